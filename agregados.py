@@ -0,0 +1,308 @@
+"""
+Agregados do dashboard mantidos no momento da escrita.
+
+Cada paciente contribui com um conjunto de (dimensão, bucket). As funções de escrita
+em crud.py calculam esse conjunto antes e depois da alteração e aplicam a diferença
+na tabela DASHBOARD_AGGREGATES na mesma transação; o dashboard lê O(#buckets) linhas
+em vez de varrer as tabelas clínicas.
+
+Rebuild completo (corrige qualquer divergência):
+    python agregados.py
+
+A tabela só vale depois do primeiro rebuild, que grava a linha de controle
+MARCADOR_RECONSTRUIDO. Antes disso (tabela recém-criada, janela do deploy) ela não
+cobre os pacientes existentes: as escritas não aplicam deltas e o dashboard calcula ao vivo.
+"""
+from collections import Counter
+from sqlalchemy.orm import Session, selectinload, load_only
+import models
+import cache
+import classificacao
+import logging
+
+logger = logging.getLogger(__name__)
+
+NAO_INFORMADO = 'Não informado'
+
+# Linha de controle (dimensão, bucket) gravada por reconstruir()
+MARCADOR_RECONSTRUIDO = ("_controle", "reconstruido")
+
+DIMENSOES = (
+    "estadiamento", "genero", "faixa_etaria", "status_vital",
+    "recidiva", "molecular", "delta_t",
+)
+
+# Campos de entrada que alteram os buckets de um paciente (crud.patch_paciente só
+# recalcula os agregados quando algum deles é enviado)
+CAMPOS_AGREGADOS = {
+    "paciente": {"hd_estadiamento_clinico", "genero", "idade", "data_nascimento"},
+    "tratamento": {"imunohistoquimicas"},
+    "desfecho": {
+        "status_vital", "recidiva_local", "recidiva_regional", "metastases",
+        "td_data_diagnostico", "td_data_inicio_tratamento",
+    },
+}
+
+# Buckets de delta T (Diagnóstico → Início do Tratamento), na ordem do gráfico SUS.
+# Cada limite é o último dia (inclusive) da sua faixa.
+DELTA_T_LIMITES = (30, 60, 90)
+
+
+def rotulos_delta_t(limites=DELTA_T_LIMITES):
+    """('0-30', '31-60', ..., '90+') para uma lista crescente de limites."""
+    inicios = (0,) + tuple(limite + 1 for limite in limites[:-1])
+    return tuple(f"{inicio}-{fim}" for inicio, fim in zip(inicios, limites)) + (f"{limites[-1]}+",)
+
+
+DELTA_T_BUCKETS = rotulos_delta_t()
+
+MOLECULAR_BUCKETS = tuple(classificacao.ROTULOS_SUBTIPO[s] for s in classificacao.SUBTIPOS)
+
+
+def _valor(obj, nome):
+    """Lê um campo de um modelo ORM, schema Pydantic ou dict."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(nome)
+    return getattr(obj, nome, None)
+
+
+def faixa_etaria(idade):
+    if idade is None:
+        return NAO_INFORMADO
+    if idade < 30:
+        return '0-29 anos'
+    if idade < 40:
+        return '30-39 anos'
+    if idade < 50:
+        return '40-49 anos'
+    if idade < 60:
+        return '50-59 anos'
+    if idade < 70:
+        return '60-69 anos'
+    return '70+ anos'
+
+
+def faixa_delta_t(data_diagnostico, data_inicio_tratamento):
+    """Bucket SUS do tempo diagnóstico → início do tratamento (None se não calculável)."""
+    if not data_diagnostico or not data_inicio_tratamento:
+        return None
+    dias = (data_inicio_tratamento - data_diagnostico).days
+    if dias < 0:
+        return None
+    for limite, rotulo in zip(DELTA_T_LIMITES, DELTA_T_BUCKETS):
+        if dias <= limite:
+            return rotulo
+    return DELTA_T_BUCKETS[-1]
+
+
+def subtipo_paciente(imunohistoquimicas):
+    """Subtipo molecular resolvido de um paciente a partir das suas IHQ."""
+    return classificacao.resolver_subtipo_paciente(
+        (
+            _valor(ihq, 'data_realizacao'),
+            classificacao.classificar_molecular(_valor(ihq, 're'), _valor(ihq, 'rp'), _valor(ihq, 'her2')),
+        )
+        for ihq in imunohistoquimicas or ()
+    )
+
+
+def calcular_buckets(paciente, desfecho=None, imunohistoquimicas=()):
+    """
+    Retorna um Counter de (dimensão, bucket) com a contribuição de um paciente.
+    Aceita modelos ORM, schemas Pydantic ou dicts (mesmos nomes de campo).
+    """
+    buckets = Counter()
+    if paciente is None:
+        return buckets
+
+    estadiamento = classificacao.normalizar_estadiamento(_valor(paciente, 'hd_estadiamento_clinico'))
+    genero = _valor(paciente, 'genero')
+    buckets[("estadiamento", classificacao.rotulo_estadiamento(estadiamento) or NAO_INFORMADO)] += 1
+    buckets[("genero", genero if genero is not None else NAO_INFORMADO)] += 1
+    buckets[("faixa_etaria", faixa_etaria(_valor(paciente, 'idade')))] += 1
+
+    if desfecho is not None:
+        status = _valor(desfecho, 'status_vital')
+        buckets[("status_vital", status if status is not None else NAO_INFORMADO)] += 1
+        if _valor(desfecho, 'recidiva_local'):
+            buckets[("recidiva", 'Recidiva Local')] += 1
+        if _valor(desfecho, 'recidiva_regional'):
+            buckets[("recidiva", 'Recidiva Regional')] += 1
+        if _valor(desfecho, 'metastases'):
+            buckets[("recidiva", 'Metástase')] += 1
+        delta = faixa_delta_t(
+            _valor(desfecho, 'td_data_diagnostico'),
+            _valor(desfecho, 'td_data_inicio_tratamento'),
+        )
+        if delta:
+            buckets[("delta_t", delta)] += 1
+
+    subtipo = subtipo_paciente(imunohistoquimicas)
+    if subtipo:
+        buckets[("molecular", classificacao.ROTULOS_SUBTIPO[subtipo])] += 1
+
+    return buckets
+
+
+def buckets_do_grafo(db_paciente):
+    """Buckets de um paciente ORM com desfecho/tratamento já carregados."""
+    tratamento = db_paciente.tratamento
+    return calcular_buckets(
+        db_paciente,
+        db_paciente.desfecho,
+        tratamento.imunohistoquimicas if tratamento is not None else (),
+    )
+
+
+def carregar_buckets(db: Session, ids):
+    """
+    Carrega do banco apenas as colunas necessárias e soma os buckets dos pacientes.
+    Não filtra removidos (soft delete): crud.delete_pacientes subtrai os recém-removidos.
+    """
+    total = Counter()
+    if not ids:
+        return total
+    pacientes = (
+        db.query(models.Paciente)
+        .options(
+            load_only(
+                models.Paciente.id_paciente,
+                models.Paciente.hd_estadiamento_clinico,
+                models.Paciente.genero,
+                models.Paciente.idade,
+            ),
+            selectinload(models.Paciente.desfecho).options(
+                selectinload(models.Desfecho.metastases).load_only(models.DesfechoMetastases.id_desfecho_metastase),
+            ),
+            selectinload(models.Paciente.tratamento)
+            .load_only(models.Tratamento.id_tratamento, models.Tratamento.id_paciente)
+            .selectinload(models.Tratamento.imunohistoquimicas)
+            .load_only(
+                models.Imunohistoquimicas.data_realizacao,
+                models.Imunohistoquimicas.re,
+                models.Imunohistoquimicas.rp,
+                models.Imunohistoquimicas.her2,
+            ),
+        )
+        .filter(models.Paciente.id_paciente.in_(list(ids)))
+        .execution_options(populate_existing=True)
+        .all()
+    )
+    for paciente in pacientes:
+        total.update(buckets_do_grafo(paciente))
+    return total
+
+
+def reconstruida(db: Session) -> bool:
+    """A tabela de agregados já passou por reconstruir() (cobre todos os pacientes)?"""
+    dimensao, bucket = MARCADOR_RECONSTRUIDO
+    return db.query(models.DashboardAgregado.id).filter(
+        models.DashboardAgregado.dimensao == dimensao,
+        models.DashboardAgregado.bucket == bucket,
+    ).first() is not None
+
+
+def _insert_dialeto(db: Session):
+    """insert() com ON CONFLICT do dialeto da sessão (PostgreSQL ou SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def aplicar_delta(db: Session, antes: Counter, depois: Counter):
+    """
+    Aplica (depois - antes) na tabela de agregados, sem commit (nada antes do primeiro
+    rebuild). Um único upsert: escritas concorrentes que criam o mesmo bucket somam em
+    vez de colidir na constraint única (dimensao, bucket).
+    """
+    if not reconstruida(db):
+        return
+    # Ordem fixa das chaves: transações concorrentes travam as linhas na mesma ordem
+    deltas = []
+    for dimensao, bucket in sorted(set(antes) | set(depois)):
+        delta = depois.get((dimensao, bucket), 0) - antes.get((dimensao, bucket), 0)
+        if delta:
+            deltas.append({"dimensao": dimensao, "bucket": bucket, "total": delta})
+    if not deltas:
+        return
+    tabela = models.DashboardAgregado
+    insert = _insert_dialeto(db)
+    comando = insert(tabela).values(deltas)
+    db.execute(comando.on_conflict_do_update(
+        index_elements=[tabela.dimensao, tabela.bucket],
+        set_={"total": tabela.total + comando.excluded.total},
+    ))
+
+
+def reconstruir(db: Session, lote: int = 500):
+    """Recalcula toda a tabela de agregados a partir das tabelas clínicas e faz commit."""
+    total = Counter()
+    ultimo_id = 0
+    while True:
+        ids = [
+            r.id_paciente for r in db.query(models.Paciente.id_paciente)
+            .filter(models.Paciente.id_paciente > ultimo_id, models.filtro_ativo(models.Paciente))
+            .order_by(models.Paciente.id_paciente)
+            .limit(lote)
+            .all()
+        ]
+        if not ids:
+            break
+        total.update(carregar_buckets(db, ids))
+        db.expunge_all()
+        ultimo_id = ids[-1]
+
+    db.query(models.DashboardAgregado).delete(synchronize_session=False)
+    db.add_all(
+        models.DashboardAgregado(dimensao=dimensao, bucket=bucket, total=quantidade)
+        for (dimensao, bucket), quantidade in total.items()
+    )
+    dimensao, bucket = MARCADOR_RECONSTRUIDO
+    db.add(models.DashboardAgregado(dimensao=dimensao, bucket=bucket, total=1))
+    db.commit()
+    cache.incrementar_versao_dados()
+    return len(total)
+
+
+def ler_dimensao(db: Session, dimensao: str):
+    """
+    Retorna [(bucket, total), ...] ordenado por total, ou None se a tabela ainda não foi
+    reconstruída (ou não existe) ou a dimensão não tem linhas: o chamador calcula ao vivo.
+    """
+    controle, marcador = MARCADOR_RECONSTRUIDO
+    try:
+        linhas = db.query(
+            models.DashboardAgregado.dimensao,
+            models.DashboardAgregado.bucket,
+            models.DashboardAgregado.total,
+        ).filter(
+            models.DashboardAgregado.dimensao.in_((dimensao, controle))
+        ).order_by(
+            models.DashboardAgregado.total.desc()
+        ).all()
+    except Exception as e:
+        logger.warning(f"Agregados indisponíveis ({dimensao}): {str(e)}")
+        db.rollback()
+        return None
+    if not any(r.dimensao == controle and r.bucket == marcador for r in linhas):
+        return None
+    linhas = [r for r in linhas if r.dimensao == dimensao]
+    if not linhas:
+        return None
+    return [(r.bucket, r.total) for r in linhas if r.total > 0]
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    models.DashboardAgregado.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        quantidade = reconstruir(db)
+        print(f"✅ Agregados do dashboard reconstruídos: {quantidade} buckets")
+    finally:
+        db.close()
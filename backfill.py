@@ -0,0 +1,164 @@
+"""
+Backfill em lotes das colunas derivadas (preenchidas na escrita por crud.py).
+
+Uso:
+    python backfill.py estadiamento [--lote 1000]
+    python backfill.py subtipo_ihq
+    python backfill.py subtipo_paciente
+    python backfill.py numericos
+
+Cada lote é lido por keyset na chave primária, calculado em Python e gravado com um
+UPDATE em massa por chave primária, com commit por lote (não segura locks longos).
+"""
+import argparse
+import logging
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import models
+import classificacao
+
+logger = logging.getLogger(__name__)
+
+
+def preencher_em_lotes(db: Session, modelo, chave, origens, calcular, lote: int = 1000) -> int:
+    """
+    Percorre `modelo` em ordem de `chave`, lendo só `origens`, e grava o dict devolvido
+    por `calcular(linha)` quando difere do valor atual. Retorna o total de linhas alteradas.
+    """
+    alteradas = 0
+    ultimo = None
+    while True:
+        consulta = db.query(chave, *origens)
+        if ultimo is not None:
+            consulta = consulta.filter(chave > ultimo)
+        linhas = consulta.order_by(chave).limit(lote).all()
+        if not linhas:
+            break
+
+        mudancas = []
+        for linha in linhas:
+            valores = calcular(linha)
+            atuais = {nome: getattr(linha, nome, None) for nome in valores}
+            if valores != atuais:
+                mudancas.append({chave.key: getattr(linha, chave.key), **valores})
+
+        if mudancas:
+            db.execute(update(modelo), mudancas)
+            db.commit()
+            alteradas += len(mudancas)
+        ultimo = getattr(linhas[-1], chave.key)
+        logger.info(f"Backfill {modelo.__tablename__}: até {chave.key}={ultimo}, {alteradas} alteradas")
+    return alteradas
+
+
+def backfill_estadiamento(db: Session, lote: int = 1000) -> int:
+    return preencher_em_lotes(
+        db,
+        models.Paciente,
+        models.Paciente.id_paciente,
+        [models.Paciente.hd_estadiamento_clinico, models.Paciente.hd_estadiamento_codigo],
+        lambda linha: {
+            "hd_estadiamento_codigo": classificacao.normalizar_estadiamento(linha.hd_estadiamento_clinico)
+        },
+        lote,
+    )
+
+
+def backfill_subtipo_ihq(db: Session, lote: int = 1000) -> int:
+    ihq = models.Imunohistoquimicas
+    return preencher_em_lotes(
+        db,
+        ihq,
+        ihq.id_imunohistoquimica,
+        [ihq.re, ihq.rp, ihq.her2, ihq.subtipo_molecular],
+        lambda linha: {
+            "subtipo_molecular": classificacao.classificar_molecular(linha.re, linha.rp, linha.her2)
+        },
+        lote,
+    )
+
+
+def backfill_subtipo_paciente(db: Session, lote: int = 1000) -> int:
+    """
+    Resolve o subtipo de cada paciente a partir das suas IHQ (rodar depois de
+    `subtipo_ihq`). Uma consulta de IHQ por lote de pacientes.
+    """
+    ihq = models.Imunohistoquimicas
+    alteradas = 0
+    ultimo = 0
+    while True:
+        pacientes = (
+            db.query(models.Paciente.id_paciente, models.Paciente.subtipo_molecular)
+            .filter(models.Paciente.id_paciente > ultimo)
+            .order_by(models.Paciente.id_paciente)
+            .limit(lote)
+            .all()
+        )
+        if not pacientes:
+            break
+
+        exames = {}
+        linhas = (
+            db.query(models.Tratamento.id_paciente, ihq.data_realizacao, ihq.subtipo_molecular)
+            .join(ihq, ihq.id_tratamento == models.Tratamento.id_tratamento)
+            .filter(models.Tratamento.id_paciente.in_([p.id_paciente for p in pacientes]))
+            .order_by(ihq.id_imunohistoquimica)
+            .all()
+        )
+        for linha in linhas:
+            exames.setdefault(linha.id_paciente, []).append((linha.data_realizacao, linha.subtipo_molecular))
+
+        mudancas = []
+        for paciente in pacientes:
+            subtipo = classificacao.resolver_subtipo_paciente(exames.get(paciente.id_paciente, []))
+            if subtipo != paciente.subtipo_molecular:
+                mudancas.append({"id_paciente": paciente.id_paciente, "subtipo_molecular": subtipo})
+
+        if mudancas:
+            db.execute(update(models.Paciente), mudancas)
+            db.commit()
+            alteradas += len(mudancas)
+        ultimo = pacientes[-1].id_paciente
+        logger.info(f"Backfill paciente.subtipo_molecular: até id_paciente={ultimo}, {alteradas} alteradas")
+    return alteradas
+
+
+def backfill_numericos(db: Session, lote: int = 1000) -> int:
+    origens = [getattr(models.Paciente, campo) for campo in classificacao.CAMPOS_NUMERICOS]
+    destinos = [
+        getattr(models.Paciente, classificacao.coluna_numerica(campo))
+        for campo in classificacao.CAMPOS_NUMERICOS
+    ]
+    return preencher_em_lotes(
+        db,
+        models.Paciente,
+        models.Paciente.id_paciente,
+        origens + destinos,
+        classificacao.campos_numericos,
+        lote,
+    )
+
+
+JOBS = {
+    "estadiamento": backfill_estadiamento,
+    "subtipo_ihq": backfill_subtipo_ihq,
+    "subtipo_paciente": backfill_subtipo_paciente,
+    "numericos": backfill_numericos,
+}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill das colunas derivadas")
+    parser.add_argument("job", choices=sorted(JOBS))
+    parser.add_argument("--lote", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = JOBS[args.job](db, args.lote)
+        print(f"✅ Backfill '{args.job}' concluído: {total} linhas alteradas")
+    finally:
+        db.close()
@@ -0,0 +1,147 @@
+"""
+Cache das funções do dashboard.
+
+- Backend padrão: LRU em memória por processo (instância Lambda).
+- Backend compartilhado: qualquer servidor compatível com Redis, ativado por
+  CACHE_REDIS_URL (requer o pacote `redis`, opcional).
+
+Cada entrada vive no máximo `ttl` segundos e a chave inclui a "versão dos dados",
+incrementada pelas escritas em crud.py: depois de uma escrita, todas as chaves antigas
+deixam de ser encontradas e expiram sozinhas.
+"""
+from collections import OrderedDict
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CHAVE_VERSAO = "dashboard:versao"
+
+
+class MemoriaLRU:
+    """LRU com TTL em memória, thread-safe. Mesma interface do RedisBackend."""
+
+    def __init__(self, capacidade: int = 512):
+        self.capacidade = capacidade
+        self._dados = OrderedDict()
+        self._contadores = {}
+        self._lock = threading.Lock()
+        # Prefixo aleatório: versões de processos diferentes nunca coincidem
+        self._prefixo = uuid.uuid4().hex[:8]
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._dados[chave] = (valor, expira_em)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.capacidade:
+                self._dados.popitem(last=False)
+
+    def incr(self, chave):
+        # Contadores ficam fora da LRU (não podem ser despejados)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + 1
+            return self._contadores[chave]
+
+    def versao(self, chave):
+        with self._lock:
+            valor = self._contadores.get(chave, 0)
+        return f"{self._prefixo}.{valor}"
+
+
+class RedisBackend:
+    """Backend compartilhado entre instâncias (Redis ou compatível)."""
+
+    def __init__(self, url: str):
+        import redis  # dependência opcional
+
+        self.cliente = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, chave):
+        valor = self.cliente.get(chave)
+        return json.loads(valor) if valor is not None else None
+
+    def set(self, chave, valor, ttl=None):
+        self.cliente.set(chave, json.dumps(valor, default=str), ex=ttl)
+
+    def incr(self, chave):
+        return self.cliente.incr(chave)
+
+    def versao(self, chave):
+        valor = self.cliente.get(chave)
+        return valor.decode() if valor is not None else "0"
+
+
+def _criar_backend():
+    url = os.getenv("CACHE_REDIS_URL")
+    if url:
+        try:
+            return RedisBackend(url)
+        except Exception as e:
+            logger.warning(f"Cache Redis indisponível, usando memória: {str(e)}")
+    return MemoriaLRU(int(os.getenv("CACHE_CAPACIDADE", "512")))
+
+
+backend = _criar_backend()
+CACHE_ATIVO = os.getenv("DASHBOARD_CACHE", "on").lower() not in ("off", "0", "false")
+
+
+def versao_dados() -> str:
+    return backend.versao(CHAVE_VERSAO)
+
+
+def incrementar_versao_dados():
+    """Invalida todo o cache do dashboard. Chamar após o commit de qualquer escrita."""
+    try:
+        backend.incr(CHAVE_VERSAO)
+    except Exception as e:
+        logger.warning(f"Falha ao incrementar versão do cache: {str(e)}")
+
+
+def cache_dashboard(ttl: int = 60):
+    """
+    Decorator para funções `f(db, *args)` somente leitura. A sessão não entra na chave.
+    Resultados vazios não são cacheados (as funções do dashboard devolvem {} / [] em erro).
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def wrapper(db, *args, **kwargs):
+            if not CACHE_ATIVO:
+                return funcao(db, *args, **kwargs)
+            try:
+                chave = f"dashboard:{funcao.__name__}:{versao_dados()}:{args!r}:{sorted(kwargs.items())!r}"
+                valor = backend.get(chave)
+            except Exception as e:
+                logger.warning(f"Falha ao ler cache de {funcao.__name__}: {str(e)}")
+                return funcao(db, *args, **kwargs)
+            if valor is not None:
+                return valor
+
+            valor = funcao(db, *args, **kwargs)
+            if valor:
+                try:
+                    backend.set(chave, valor, ttl)
+                except Exception as e:
+                    logger.warning(f"Falha ao gravar cache de {funcao.__name__}: {str(e)}")
+            return valor
+
+        wrapper.sem_cache = funcao
+        return wrapper
+    return decorador
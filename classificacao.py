@@ -0,0 +1,193 @@
+"""
+Classificações clínicas derivadas de campos de texto livre.
+Usadas na escrita (crud.py) para preencher colunas indexadas e nos backfills.
+"""
+import datetime
+import re
+import unicodedata
+from decimal import Decimal
+
+# Estadiamento canônico (grupo prognóstico principal)
+ESTADIOS = ("0", "I", "II", "III", "IV")
+
+_ARABICOS = {"0": "0", "1": "I", "2": "II", "3": "III", "4": "IV"}
+
+_TNM = re.compile(
+    r"T\s*(IS|X|[0-4])[A-D]?[^N]*?N\s*(X|[0-3])(MI)?[A-C]?(?:.*?M\s*(X|[01]))?"
+)
+# Numeral só conta com prefixo explícito de estádio ou como entrada inteira ('IIIA', '2'):
+# um romano solto pode ser outra coisa ('Grau II' é o grau histológico)
+_PREFIXADO = re.compile(
+    r"\b(?:EC|ESTADIO|ESTAGIO|ESTADIAMENTO|STAGE)(?:\s+(?:CLINICO|PATOLOGICO))?"
+    r"\s*[:\-]?\s*(0|[1-4]|IV|III|II|I)[A-C]?\b"
+)
+_SO_ESTADIO = re.compile(r"^\s*(0|[1-4]|IV|III|II|I)[A-C]?\s*$")
+
+
+def _normalizar_texto(texto: str) -> str:
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return sem_acento.upper().strip()
+
+
+def _estadio_por_tnm(t: str, n: str, micro: bool, m: str):
+    """Grupo anatômico AJCC (mama) a partir de T, N e M."""
+    if m == "1":
+        return "IV"
+    if t == "X" or n == "X":
+        return None
+    if t == "IS":
+        if n == "0":
+            return "0"
+        t = "0"
+    t, n = int(t), int(n)
+    if n == 3 or n == 2 or t == 4:
+        return "III"
+    if t == 3:
+        return "III" if n == 1 else "II"
+    if n == 1:
+        return "I" if micro and t <= 1 else "II"
+    if t == 0:
+        return None
+    return "I" if t == 1 else "II"
+
+
+def normalizar_estadiamento(texto):
+    """
+    Converte o estadiamento clínico em texto livre ('EC IIIA', 'Estádio 2', 'cT2N1M0',
+    'IV', 'Carcinoma in situ') no código canônico '0', 'I', 'II', 'III' ou 'IV'.
+    Retorna None quando não é possível classificar.
+    """
+    if not texto:
+        return None
+    normalizado = _normalizar_texto(texto)
+    if not normalizado:
+        return None
+
+    tnm = _TNM.search(normalizado)
+    if tnm:
+        estadio = _estadio_por_tnm(tnm.group(1), tnm.group(2), bool(tnm.group(3)), tnm.group(4) or "0")
+        if estadio:
+            return estadio
+
+    if "IN SITU" in normalizado:
+        return "0"
+
+    for padrao in (_PREFIXADO, _SO_ESTADIO):
+        encontrado = padrao.search(normalizado)
+        if encontrado:
+            valor = encontrado.group(1)
+            return _ARABICOS.get(valor, valor)
+    return None
+
+
+def rotulo_estadiamento(codigo):
+    """Rótulo exibido no dashboard para um código canônico."""
+    return f"EC {codigo}" if codigo else None
+
+
+# Subtipo molecular (IHQ)
+LUMINAL = "LUMINAL"
+HER2 = "HER2"
+TRIPLO_NEGATIVO = "TRIPLO_NEGATIVO"
+DESCONHECIDO = "DESCONHECIDO"
+
+SUBTIPOS = (LUMINAL, HER2, TRIPLO_NEGATIVO, DESCONHECIDO)
+
+ROTULOS_SUBTIPO = {
+    LUMINAL: 'Luminal (RH+)',
+    HER2: 'HER2+',
+    TRIPLO_NEGATIVO: 'Triplo Negativo',
+    DESCONHECIDO: 'Desconhecido',
+}
+
+
+def classificar_molecular(re, rp, her2):
+    """Classificação molecular simplificada a partir de RE, RP e HER2 (texto livre)."""
+    re_pos = re and ('pos' in re.lower() or re == 'P')
+    rp_pos = rp and ('pos' in rp.lower() or rp == 'P')
+    rh_positivo = re_pos or rp_pos
+    her2_positivo = her2 and ('3+' in her2 or 'pos' in her2.lower())
+
+    re_neg = re and ('neg' in re.lower() or re == 'N')
+    rp_neg = rp and ('neg' in rp.lower() or rp == 'N')
+    her2_negativo = her2 and ('0' in her2 or '1+' in her2 or 'neg' in her2.lower())
+
+    if rh_positivo:
+        return LUMINAL
+    if her2_positivo:
+        return HER2
+    if re_neg and rp_neg and her2_negativo:
+        return TRIPLO_NEGATIVO
+    return DESCONHECIDO
+
+
+def resolver_subtipo_paciente(exames):
+    """
+    Subtipo do paciente a partir de [(data_realizacao, subtipo), ...] na ordem de cadastro:
+    o exame classificável mais recente vence (sem data conta como mais antigo; empate,
+    o último cadastrado). Só exames inconclusivos → DESCONHECIDO; nenhum exame → None.
+    """
+    exames = list(exames)
+    conhecidos = [
+        (data or datetime.date.min, ordem, subtipo)
+        for ordem, (data, subtipo) in enumerate(exames)
+        if subtipo and subtipo != DESCONHECIDO
+    ]
+    if conhecidos:
+        return max(conhecidos)[2]
+    return DESCONHECIDO if exames else None
+
+
+# Quantidades clínicas gravadas como texto em PACIENTE. Cada campo tem uma coluna
+# numérica indexada `<campo>_num` (models.Paciente) preenchida na escrita.
+CAMPOS_NUMERICOS = (
+    "hp_idade_diagnostico_neoplasia",
+    "hv_tabagismo_carga",
+    "hv_tabagismo_tempo_anos",
+    "hv_etilismo_tempo_anos",
+    "hv_etilismo_dose_diaria",
+    "hv_tempo_atividade_semanal_min",
+    "p_gesta",
+    "p_para",
+    "p_aborto",
+    "p_idade_primeiro_filho",
+    "p_tempo_amamentacao_meses",
+    "p_menarca_idade",
+    "p_idade_menopausa",
+    "p_tempo_uso_trh",
+    "p_tempo_uso_aco",
+    "hd_ecog",
+    "mp_score_tyrer_cuzick",
+    "mp_score_canrisk",
+    "mp_score_gail",
+)
+
+# Um único número, opcionalmente seguido de unidade ('12,5%', ' 3.2 ', '20 anos', '150 min/sem').
+# Faixas ('10-15'), comparações ('<1') e textos ('não sabe') não são convertidos.
+_NUMERO = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(?:%|[A-Za-zÀ-ÿ./ ]*)$")
+_CENTESIMO = Decimal("0.01")
+_LIMITE = Decimal("100000000")
+
+
+def coluna_numerica(campo: str) -> str:
+    return f"{campo}_num"
+
+
+def converter_numero(texto):
+    """Valor numérico (Decimal com 2 casas) de um campo de texto livre, ou None."""
+    if texto is None:
+        return None
+    encontrado = _NUMERO.match(str(texto))
+    if not encontrado:
+        return None
+    valor = Decimal(encontrado.group(1).replace(",", ".")).quantize(_CENTESIMO)
+    # Fora da precisão da coluna (Numeric(10, 2)): trata como não numérico
+    return valor if valor < _LIMITE else None
+
+
+def campos_numericos(obj):
+    """{'<campo>_num': valor} para todos os CAMPOS_NUMERICOS de um paciente (ORM ou linha)."""
+    return {
+        coluna_numerica(campo): converter_numero(getattr(obj, campo, None))
+        for campo in CAMPOS_NUMERICOS
+    }
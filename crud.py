@@ -1,8 +1,134 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload, load_only
+from sqlalchemy import select, tuple_, update, insert, and_, or_
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
+import base64
+import json
 import models
 import schemas
+import agregados
+import classificacao
+import cache
+import importacao
+import historico
 import datetime
 
+def campos_derivados(valores: dict, imunohistoquimicas=None):
+    """
+    Colunas derivadas (indexadas) correspondentes aos campos de texto presentes em `valores`.
+    `imunohistoquimicas` é a lista completa de IHQ do paciente quando ela foi reescrita.
+    """
+    derivados = {}
+    if "hd_estadiamento_clinico" in valores:
+        derivados["hd_estadiamento_codigo"] = classificacao.normalizar_estadiamento(
+            valores["hd_estadiamento_clinico"]
+        )
+    for campo in classificacao.CAMPOS_NUMERICOS:
+        if campo in valores:
+            derivados[classificacao.coluna_numerica(campo)] = classificacao.converter_numero(valores[campo])
+    if imunohistoquimicas is not None:
+        derivados["subtipo_molecular"] = agregados.subtipo_paciente(imunohistoquimicas)
+    return derivados
+
+
+def preencher_campos_derivados(db_paciente, imunohistoquimicas=None):
+    """Atualiza as colunas derivadas (indexadas) a partir dos campos de texto livre."""
+    fontes = ("hd_estadiamento_clinico",) + classificacao.CAMPOS_NUMERICOS
+    valores = {campo: getattr(db_paciente, campo) for campo in fontes}
+    for coluna, valor in campos_derivados(valores, imunohistoquimicas).items():
+        setattr(db_paciente, coluna, valor)
+
+
+def calcular_idade(data_nascimento, hoje=None):
+    hoje = hoje or datetime.date.today()
+    return hoje.year - data_nascimento.year - ((hoje.month, hoje.day) < (data_nascimento.month, data_nascimento.day))
+
+
+def _com_subtipo_molecular(dados):
+    """IHQ já com o subtipo molecular classificado"""
+    dados["subtipo_molecular"] = classificacao.classificar_molecular(
+        dados.get("re"), dados.get("rp"), dados.get("her2")
+    )
+    return dados
+
+
+# Coleções filhas: (atributo no schema, modelo, chave primária, FK para o pai, preparo extra)
+FILHOS_PACIENTE = (
+    ("familiares", models.PacienteFamiliar, "id_familiar", "id_paciente", None),
+)
+FILHOS_TRATAMENTO = (
+    ("cirurgias", models.TratamentoCirurgia, "id_cirurgia", "id_tratamento", None),
+    ("quimio_paliativa", models.PalliativoQuimioterapia, "id_quimio_paliativa", "id_tratamento", None),
+    ("radio_paliativa", models.PalliativoRadioterapia, "id_radio_paliativa", "id_tratamento", None),
+    ("endo_paliativa", models.PalliativoEndocrinoterapia, "id_endo_paliativa", "id_tratamento", None),
+    ("imuno_paliativa", models.PalliativoImunoterapia, "id_imuno_paliativa", "id_tratamento", None),
+    ("imunohistoquimicas", models.Imunohistoquimicas, "id_imunohistoquimica", "id_tratamento", _com_subtipo_molecular),
+)
+FILHOS_DESFECHO = (
+    ("metastases", models.DesfechoMetastases, "id_desfecho_metastase", "id_desfecho", None),
+    ("eventos", models.DesfechoEventos, "id_evento", "id_desfecho", None),
+)
+
+
+def _dados_filho(item, colunas, preparar=None):
+    """Valores de um item filho (schema *Create ou dict) restritos às colunas do modelo"""
+    # Campos do schema sem coluna no modelo são ignorados
+    valores = item if isinstance(item, dict) else item.dict()
+    dados = {k: v for k, v in valores.items() if k in colunas}
+    return preparar(dados) if preparar else dados
+
+
+def sincronizar_filhos(db: Session, modelo, chave: str, fk: str, id_pai: int, itens, preparar=None, novo=False):
+    """
+    Sincroniza a coleção filha de `id_pai` com `itens` (schemas *Create) por chave primária:
+    - item sem id (ou com id que não pertence a este pai) → INSERT
+    - item com id existente e algum campo diferente → UPDATE
+    - item com id existente e nada diferente → nenhum comando
+    - linha existente ausente de `itens` → DELETE
+    Cada tipo de comando é um único statement em lote. `novo=True` (pai recém-criado) pula
+    a leitura das linhas existentes. Retorna True se algo foi gravado.
+    """
+    colunas = {c.key for c in modelo.__table__.columns} - {chave, fk}
+    existentes = {}
+    if not novo:
+        existentes = {
+            getattr(linha, chave): linha
+            for linha in db.query(modelo).filter(getattr(modelo, fk) == id_pai)
+        }
+
+    insercoes, atualizacoes, mantidos = [], [], set()
+    for item in itens or ():
+        dados = _dados_filho(item, colunas, preparar)
+        id_item = getattr(item, chave, None)
+        atual = existentes.get(id_item)
+        if atual is None or id_item in mantidos:
+            insercoes.append({**dados, fk: id_pai})
+            continue
+        mantidos.add(id_item)
+        if any(getattr(atual, campo) != valor for campo, valor in dados.items()):
+            atualizacoes.append({chave: id_item, **dados})
+
+    removidos = [id_item for id_item in existentes if id_item not in mantidos]
+    if removidos:
+        db.query(modelo).filter(getattr(modelo, chave).in_(removidos)).delete(synchronize_session=False)
+    if atualizacoes:
+        db.execute(update(modelo), atualizacoes)
+    if insercoes:
+        db.execute(insert(modelo).execution_options(render_nulls=True), insercoes)
+    return bool(removidos or atualizacoes or insercoes)
+
+
+def sincronizar_colecoes(db: Session, filhos, origem, id_pai: int, novo=False):
+    """Aplica sincronizar_filhos a cada coleção de `filhos` presente em `origem`"""
+    alterado = False
+    for atributo, modelo, chave, fk, preparar in filhos:
+        itens = getattr(origem, atributo, None)
+        if itens is None:
+            continue
+        alterado |= sincronizar_filhos(db, modelo, chave, fk, id_pai, itens, preparar, novo)
+    return alterado
+
+
 def create_paciente(db: Session, paciente: schemas.PacienteCreate):
     """Cria paciente com todos os dados relacionados"""
     
@@ -13,8 +139,7 @@ def create_paciente(db: Session, paciente: schemas.PacienteCreate):
     
     # Calcular a idade automaticamente baseada na data de nascimento e momento do cadastro
     if paciente.data_nascimento and not paciente_dict.get('idade'):
-        hoje = datetime.date.today()
-        idade_calculada = hoje.year - paciente.data_nascimento.year - ((hoje.month, hoje.day) < (paciente.data_nascimento.month, paciente.data_nascimento.day))
+        idade_calculada = calcular_idade(paciente.data_nascimento)
         paciente_dict['idade'] = idade_calculada
         
         # Opcionalmente, pode ser útil preencher a idade no diagnóstico para análise
@@ -23,17 +148,15 @@ def create_paciente(db: Session, paciente: schemas.PacienteCreate):
 
     # Criar paciente principal
     db_paciente = models.Paciente(**paciente_dict)
+    preencher_campos_derivados(
+        db_paciente,
+        paciente.tratamento.imunohistoquimicas if paciente.tratamento else []
+    )
     db.add(db_paciente)
     db.flush()
     
     # Familiares
-    if paciente.familiares:
-        for familiar_data in paciente.familiares:
-            db_familiar = models.PacienteFamiliar(
-                **familiar_data.dict(),
-                id_paciente=db_paciente.id_paciente
-            )
-            db.add(db_familiar)
+    sincronizar_colecoes(db, FILHOS_PACIENTE, paciente, db_paciente.id_paciente, novo=True)
     
     # Tratamento
     if paciente.tratamento:
@@ -48,59 +171,8 @@ def create_paciente(db: Session, paciente: schemas.PacienteCreate):
         db.add(db_tratamento)
         db.flush()
         
-        # Cirurgias (Unificadas)
-        if paciente.tratamento.cirurgias:
-            for cirurgia_data in paciente.tratamento.cirurgias:
-                db_cirurgia = models.TratamentoCirurgia(
-                    **cirurgia_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_cirurgia)
-        
-        # Quimioterapia Paliativa
-        if paciente.tratamento.quimio_paliativa:
-            for quimio_data in paciente.tratamento.quimio_paliativa:
-                db_quimio = models.PalliativoQuimioterapia(
-                    **quimio_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_quimio)
-        
-        # Radioterapia Paliativa
-        if paciente.tratamento.radio_paliativa:
-            for radio_data in paciente.tratamento.radio_paliativa:
-                db_radio = models.PalliativoRadioterapia(
-                    **radio_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_radio)
-        
-        # Endocrinoterapia Paliativa
-        if paciente.tratamento.endo_paliativa:
-            for endo_data in paciente.tratamento.endo_paliativa:
-                db_endo = models.PalliativoEndocrinoterapia(
-                    **endo_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_endo)
-        
-        # Imunoterapia Paliativa
-        if paciente.tratamento.imuno_paliativa:
-            for imuno_data in paciente.tratamento.imuno_paliativa:
-                db_imuno = models.PalliativoImunoterapia(
-                    **imuno_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_imuno)
-        
-        # Imunohistoquímicas
-        if paciente.tratamento.imunohistoquimicas:
-            for imunohisto_data in paciente.tratamento.imunohistoquimicas:
-                db_imunohisto = models.Imunohistoquimicas(
-                    **imunohisto_data.dict(),
-                    id_tratamento=db_tratamento.id_tratamento
-                )
-                db.add(db_imunohisto)
+        # Cirurgias, paliativos e imunohistoquímicas (um INSERT em lote por tabela)
+        sincronizar_colecoes(db, FILHOS_TRATAMENTO, paciente.tratamento, db_tratamento.id_tratamento, novo=True)
     
     # Desfecho
     if paciente.desfecho:
@@ -113,62 +185,338 @@ def create_paciente(db: Session, paciente: schemas.PacienteCreate):
         db.add(db_desfecho)
         db.flush()
         
-        # Metástases
-        if paciente.desfecho.metastases:
-            for metastase_data in paciente.desfecho.metastases:
-                db_metastase = models.DesfechoMetastases(
-                    **metastase_data.dict(),
-                    id_desfecho=db_desfecho.id_desfecho
-                )
-                db.add(db_metastase)
-        
-        # Eventos
-        if paciente.desfecho.eventos:
-            for evento_data in paciente.desfecho.eventos:
-                db_evento = models.DesfechoEventos(
-                    **evento_data.dict(),
-                    id_desfecho=db_desfecho.id_desfecho
-                )
-                db.add(db_evento)
+        # Metástases e eventos
+        sincronizar_colecoes(db, FILHOS_DESFECHO, paciente.desfecho, db_desfecho.id_desfecho, novo=True)
+    
+    # Agregados do dashboard (mesma transação)
+    agregados.aplicar_delta(db, Counter(), agregados.calcular_buckets(
+        db_paciente,
+        paciente.desfecho,
+        paciente.tratamento.imunohistoquimicas if paciente.tratamento else (),
+    ))
     
     db.commit()
+    cache.incrementar_versao_dados()
     db.refresh(db_paciente)
     return db_paciente
 
 
+# =======================================================================
+# IMPORTAÇÃO EM LOTE (POST /pacientes/bulk)
+# Cada lote é validado (importacao.py, em paralelo) e gravado com um INSERT multi-linha por tabela:
+# pacientes, tratamentos e desfechos com RETURNING (ids na ordem dos parâmetros) e
+# as coleções filhas em executemany. Commit por lote; um lote que falha no banco é
+# refeito registro a registro (savepoint) para isolar e reportar os inválidos.
+# =======================================================================
+
+LOTE_IMPORTACAO = 500
+
+
+def _valores_paciente_importacao(dados: dict):
+    """Linha de PACIENTE pronta para o INSERT (mesmas regras de create_paciente)"""
+    valores = {k: v for k, v in dados.items() if k not in ("familiares", "tratamento", "desfecho")}
+    if valores.get("data_nascimento") and not valores.get("idade"):
+        valores["idade"] = calcular_idade(valores["data_nascimento"])
+        if valores.get("hd_idade_diagnostico") is None:
+            valores["hd_idade_diagnostico"] = valores["idade"]
+    valores.update(campos_derivados(valores, _imunohistoquimicas_importacao(dados)))
+    return valores
+
+
+def _imunohistoquimicas_importacao(dados: dict):
+    return (dados.get("tratamento") or {}).get("imunohistoquimicas") or []
+
+
+def _inserir_retornando(db: Session, modelo, chave: str, linhas):
+    """
+    INSERT multi-linha com RETURNING da chave primária, na ordem de `linhas`.
+    render_nulls: sem ele o ORM omite as chaves None e agrupa as linhas por conjunto de
+    chaves, e registros esparsos viram quase um INSERT por linha.
+    """
+    if not linhas:
+        return []
+    return db.scalars(
+        insert(modelo)
+        .returning(getattr(modelo, chave), sort_by_parameter_order=True)
+        .execution_options(render_nulls=True),
+        linhas,
+    ).all()
+
+
+def _inserir_um_para_um(db: Session, modelo, chave: str, filhos, pares):
+    """`pares` = [(dados do registro 1:1, id_paciente)]: INSERT ... RETURNING + coleções"""
+    colecoes = {atributo for atributo, *_ in filhos}
+    ids = _inserir_retornando(db, modelo, chave, [
+        {**{k: v for k, v in dados.items() if k not in colecoes}, "id_paciente": id_paciente}
+        for dados, id_paciente in pares
+    ])
+    _inserir_filhos(db, filhos, [(dados, id_pai) for (dados, _), id_pai in zip(pares, ids)])
+
+
+def _inserir_filhos(db: Session, filhos, pais):
+    """`pais` = [(dados do pai, id do pai)]: um executemany por coleção filha"""
+    for atributo, modelo, chave, fk, preparar in filhos:
+        colunas = {c.key for c in modelo.__table__.columns} - {chave, fk}
+        linhas = [
+            {**_dados_filho(item, colunas, preparar), fk: id_pai}
+            for dados, id_pai in pais
+            for item in dados.get(atributo) or ()
+        ]
+        if linhas:
+            db.execute(insert(modelo).execution_options(render_nulls=True), linhas)
+
+
+def _gravar_lote_importacao(db: Session, registros):
+    """Grava uma lista de dicts validados (importacao.validar_registros), sem commit. Retorna os ids."""
+    linhas = [_valores_paciente_importacao(dados) for dados in registros]
+    ids = _inserir_retornando(db, models.Paciente, "id_paciente", linhas)
+    _inserir_filhos(db, FILHOS_PACIENTE, list(zip(registros, ids)))
+    _inserir_um_para_um(db, models.Tratamento, "id_tratamento", FILHOS_TRATAMENTO, [
+        (dados["tratamento"], id_p) for dados, id_p in zip(registros, ids) if dados.get("tratamento")
+    ])
+    _inserir_um_para_um(db, models.Desfecho, "id_desfecho", FILHOS_DESFECHO, [
+        (dados["desfecho"], id_p) for dados, id_p in zip(registros, ids) if dados.get("desfecho")
+    ])
+
+    buckets = Counter()
+    for dados, linha in zip(registros, linhas):
+        buckets.update(agregados.calcular_buckets(
+            linha, dados.get("desfecho"), _imunohistoquimicas_importacao(dados)
+        ))
+    agregados.aplicar_delta(db, Counter(), buckets)
+    return ids
+
+
+def importar_pacientes(db: Session, registros, lote: int = LOTE_IMPORTACAO, processos: int = None):
+    """
+    Importa `registros` (iterável de dicts; uma Exception no lugar de um registro, p.ex.
+    linha NDJSON ilegível, é reportada como erro daquele índice). A validação roda em
+    `processos` processos (importacao.validar_registros); a gravação, nesta sessão.
+    Retorna {"total", "criados", "ids": [{"indice", "id_paciente"}], "erros": [{"indice", "erro"}]}.
+    """
+    resultado = {"total": 0, "criados": 0, "ids": [], "erros": []}
+
+    def gravar(pendentes):
+        if not pendentes:
+            return
+        try:
+            with db.begin_nested():
+                ids = _gravar_lote_importacao(db, [p for _, p in pendentes])
+            criados = list(zip((i for i, _ in pendentes), ids))
+        except Exception as e:
+            print(f"Lote de importação rejeitado pelo banco, gravando um a um: {str(e)}")
+            criados = []
+            for indice, dados in pendentes:
+                try:
+                    with db.begin_nested():
+                        criados.append((indice, _gravar_lote_importacao(db, [dados])[0]))
+                except Exception as erro:
+                    resultado["erros"].append({"indice": indice, "erro": str(getattr(erro, "orig", erro))})
+        db.commit()
+        resultado["criados"] += len(criados)
+        resultado["ids"].extend({"indice": i, "id_paciente": id_p} for i, id_p in criados)
+
+    pendentes = []
+    for indice, dados, erro in importacao.validar_registros(registros, lote, processos):
+        resultado["total"] += 1
+        if erro is not None:
+            resultado["erros"].append({"indice": indice, "erro": erro})
+            continue
+        pendentes.append((indice, dados))
+        if len(pendentes) >= lote:
+            gravar(pendentes)
+            pendentes = []
+    gravar(pendentes)
+
+    resultado["erros"].sort(key=lambda erro: erro["indice"])
+    if resultado["criados"]:
+        cache.incrementar_versao_dados()
+    return resultado
+
+
+# Relacionamentos aceitos em `include` nas leituras parciais
+RELACIONAMENTOS_PACIENTE = ("familiares", "tratamento", "desfecho")
+
+# Campos escalares aceitos em `fields`: os expostos por schemas.Paciente
+CAMPOS_PACIENTE = ("id_paciente",) + tuple(schemas.PacienteBase.__fields__)
+
+
+def opcoes_relacionamentos(incluir):
+    """
+    Loader options para os relacionamentos pedidos, com as coleções filhas de cada um.
+    Relacionamentos 1:1 (tratamento, desfecho) vêm no mesmo SELECT por joinedload; cada
+    coleção vem em um SELECT ... WHERE fk IN (...) (selectinload), sem produto cartesiano
+    entre coleções. Vale para um ou vários pacientes na mesma consulta.
+    """
+    opcoes = []
+    if "familiares" in incluir:
+        opcoes.append(selectinload(models.Paciente.familiares))
+    if "tratamento" in incluir:
+        opcoes.append(joinedload(models.Paciente.tratamento).options(
+            selectinload(models.Tratamento.cirurgias),
+            selectinload(models.Tratamento.quimio_paliativa),
+            selectinload(models.Tratamento.radio_paliativa),
+            selectinload(models.Tratamento.endo_paliativa),
+            selectinload(models.Tratamento.imuno_paliativa),
+            selectinload(models.Tratamento.imunohistoquimicas),
+        ))
+    if "desfecho" in incluir:
+        opcoes.append(joinedload(models.Paciente.desfecho).options(
+            selectinload(models.Desfecho.metastases),
+            selectinload(models.Desfecho.eventos),
+        ))
+    return opcoes
+
+
+def validar_campos_parciais(campos, incluir):
+    """Valida `fields`/`include`; retorna (campos, incluir) normalizados ou levanta ValueError."""
+    desconhecidos = [c for c in campos or () if c not in CAMPOS_PACIENTE]
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos: {', '.join(desconhecidos)}")
+    desconhecidos = [r for r in incluir or () if r not in RELACIONAMENTOS_PACIENTE]
+    if desconhecidos:
+        raise ValueError(f"Relacionamentos desconhecidos: {', '.join(desconhecidos)}")
+    if not campos:
+        campos = CAMPOS_PACIENTE
+    return tuple(dict.fromkeys(("id_paciente",) + tuple(campos))), tuple(dict.fromkeys(incluir or ()))
+
+
+def opcoes_parciais(campos, incluir):
+    """load_only das colunas pedidas + apenas os relacionamentos pedidos"""
+    return [
+        load_only(*[getattr(models.Paciente, campo) for campo in campos]),
+        *opcoes_relacionamentos(incluir),
+    ]
+
+
 def get_paciente(db: Session, paciente_id: int):
     """Busca paciente por ID com todos os relacionamentos carregados"""
-    from sqlalchemy.orm import joinedload
     return (
         db.query(models.Paciente)
-        .options(
-            joinedload(models.Paciente.familiares),
-            joinedload(models.Paciente.tratamento).options(
-                joinedload(models.Tratamento.cirurgias),
-                joinedload(models.Tratamento.quimio_paliativa),
-                joinedload(models.Tratamento.radio_paliativa),
-                joinedload(models.Tratamento.endo_paliativa),
-                joinedload(models.Tratamento.imuno_paliativa),
-                joinedload(models.Tratamento.imunohistoquimicas),
-            ),
-            joinedload(models.Paciente.desfecho).options(
-                joinedload(models.Desfecho.metastases),
-                joinedload(models.Desfecho.eventos),
-            ),
-        )
-        .filter(models.Paciente.id_paciente == paciente_id)
+        .options(*opcoes_relacionamentos(RELACIONAMENTOS_PACIENTE))
+        .filter(models.Paciente.id_paciente == paciente_id, models.Paciente.deleted_at.is_(None))
         .first()
     )
 
 
-def get_pacientes(db: Session, skip: int = 0, limit: int = 100):
+def get_pacientes_completos(db: Session, ids):
+    """Vários pacientes com todos os relacionamentos, na ordem de `ids` (ausentes são omitidos)"""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    por_id = {
+        p.id_paciente: p for p in db.query(models.Paciente)
+        .options(*opcoes_relacionamentos(RELACIONAMENTOS_PACIENTE))
+        .filter(models.Paciente.id_paciente.in_(ids), models.Paciente.deleted_at.is_(None))
+        .all()
+    }
+    return [por_id[i] for i in ids if i in por_id]
+
+
+# Linhas lidas por vez na exportação em streaming (GET /pacientes/stream)
+LOTE_STREAM = 500
+
+# No Lambda o Mangum bufferiza a resposta inteira (limite de 6 MB do API Gateway/Lambda):
+# lá o stream é paginado. ~6,5 KB por paciente completo → 500 por página, com folga.
+LIMITE_STREAM_LAMBDA = 500
+
+
+def fim_pagina_pacientes(db: Session, apos_id: int, limit: int):
+    """
+    Último id da página de `limit` pacientes ativos depois de `apos_id`, ou None se a
+    página vai até o fim da tabela (só ids, pelo índice da chave primária).
+    """
+    ids = db.scalars(
+        select(models.Paciente.id_paciente)
+        .where(models.Paciente.id_paciente > apos_id, models.Paciente.deleted_at.is_(None))
+        .order_by(models.Paciente.id_paciente)
+        .limit(limit + 1)
+    ).all()
+    return ids[limit - 1] if len(ids) > limit else None
+
+
+def iterar_pacientes_completos(db: Session, lote: int = LOTE_STREAM, apos_id: int = 0, ate_id: int = None):
+    """
+    Pacientes ativos com o grafo completo, em ordem de id (apos_id < id <= ate_id), sem
+    materializar a tabela: yield_per lê `lote` linhas por vez (cursor do lado do servidor
+    no PostgreSQL) e as coleções de cada lote vêm em um SELECT ... IN por tabela filha.
+    """
+    # select() 2.0: Query aplicaria unique() por causa do joinedload 1:1, incompatível com yield_per
+    consulta = (
+        select(models.Paciente)
+        .options(*opcoes_relacionamentos(RELACIONAMENTOS_PACIENTE))
+        .where(models.Paciente.deleted_at.is_(None), models.Paciente.id_paciente > apos_id)
+        .order_by(models.Paciente.id_paciente)
+        .execution_options(yield_per=lote)
+    )
+    if ate_id is not None:
+        consulta = consulta.where(models.Paciente.id_paciente <= ate_id)
+    yield from db.scalars(consulta)
+
+
+def get_paciente_parcial(db: Session, paciente_id: int, campos, incluir=()):
+    """Busca paciente por ID carregando só `campos` (já validados) e os relacionamentos em `incluir`"""
+    return (
+        db.query(models.Paciente)
+        .options(*opcoes_parciais(campos, incluir))
+        .filter(models.Paciente.id_paciente == paciente_id, models.Paciente.deleted_at.is_(None))
+        .first()
+    )
+
+
+def get_versao_paciente(db: Session, paciente_id: int):
+    """Retorna apenas a versão da linha (base do ETag), ou None se o paciente não existe"""
+    return db.query(models.Paciente.versao).filter(
+        models.Paciente.id_paciente == paciente_id, models.Paciente.deleted_at.is_(None)
+    ).scalar()
+
+
+# Projeção da listagem (?view=summary): SELECT só destas colunas, sem hidratar o modelo
+COLUNAS_RESUMO = (
+    models.Paciente.id_paciente,
+    models.Paciente.nome_completo,
+    models.Paciente.data_nascimento,
+    models.Paciente.cidade,
+    models.Paciente.hd_estadiamento_clinico,
+    models.Desfecho.status_vital,
+)
+
+
+def _query_listagem(db: Session, subtipo_molecular: str = None, resumo: bool = False, campos=None, incluir=()):
+    if campos:
+        query = db.query(models.Paciente).options(*opcoes_parciais(campos, incluir))
+    elif resumo:
+        query = db.query(*COLUNAS_RESUMO).outerjoin(
+            models.Desfecho, models.Desfecho.id_paciente == models.Paciente.id_paciente
+        )
+    else:
+        query = db.query(models.Paciente)
+    query = query.filter(models.Paciente.deleted_at.is_(None))
+    if subtipo_molecular:
+        query = query.filter(models.Paciente.subtipo_molecular == subtipo_molecular)
+    return query
+
+
+def get_pacientes(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    subtipo_molecular: str = None,
+    resumo: bool = False,
+    campos=None,
+    incluir=(),
+):
     """
     Lista pacientes da tabela PACIENTE com paginação.
     Consulta a tabela principal conforme a modelagem de dados.
+    `subtipo_molecular` filtra pelo código derivado das IHQ (LUMINAL, HER2, ...).
+    Com `resumo=True` retorna linhas só com COLUNAS_RESUMO em vez de modelos completos;
+    com `campos` (validados) carrega só essas colunas e os relacionamentos em `incluir`.
     """
     try:
         # Consulta direta na tabela PACIENTE
-        pacientes = db.query(models.Paciente).offset(skip).limit(limit).all()
+        query = _query_listagem(db, subtipo_molecular, resumo, campos, incluir)
+        pacientes = query.order_by(models.Paciente.id_paciente).offset(skip).limit(limit).all()
         
         # Log para debug (remover em produção)
         print(f"CRUD: Consultando tabela PACIENTE - {len(pacientes)} registros encontrados")
@@ -179,23 +527,87 @@ def get_pacientes(db: Session, skip: int = 0, limit: int = 100):
         raise e
 
 
+# Colunas aceitas em `ordenar_por` na paginação por cursor (id_paciente desempata)
+ORDENACOES_PACIENTE = {
+    "id_paciente": models.Paciente.id_paciente,
+    "nome_completo": models.Paciente.nome_completo,
+}
+
+
+def codificar_cursor(ordenar_por: str, valor, id_paciente: int) -> str:
+    dados = json.dumps({"o": ordenar_por, "v": valor, "id": id_paciente}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, ordenar_por: str):
+    """Retorna (valor, id_paciente) do cursor; ValueError se inválido ou de outra ordenação."""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        valor, id_paciente = dados["v"], int(dados["id"])
+        origem = dados["o"]
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if origem != ordenar_por:
+        raise ValueError("Cursor gerado para outra ordenação")
+    return valor, id_paciente
+
+
+def get_pacientes_cursor(
+    db: Session,
+    cursor: str = None,
+    limit: int = 100,
+    ordenar_por: str = "id_paciente",
+    subtipo_molecular: str = None,
+    resumo: bool = False,
+    campos=None,
+    incluir=(),
+):
+    """
+    Lista pacientes por keyset: WHERE (coluna, id) > (último valor, último id) ORDER BY coluna, id.
+    O custo de qualquer página é o de uma busca no índice, independentemente da profundidade.
+    Retorna (pacientes, next_cursor); next_cursor é None na última página.
+    Com `resumo=True` as linhas trazem só COLUNAS_RESUMO; com `campos`, só essas colunas
+    (mais a de ordenação) e os relacionamentos em `incluir`.
+    """
+    if ordenar_por not in ORDENACOES_PACIENTE:
+        raise ValueError(f"Ordenação não suportada: {ordenar_por}")
+    coluna = ORDENACOES_PACIENTE[ordenar_por]
+    chave = models.Paciente.id_paciente
+
+    if campos:
+        campos = tuple(dict.fromkeys(tuple(campos) + (coluna.key,)))
+    query = _query_listagem(db, subtipo_molecular, resumo, campos, incluir)
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, ordenar_por)
+        if coluna is chave:
+            query = query.filter(chave > ultimo_id)
+        else:
+            query = query.filter(tuple_(coluna, chave) > tuple_(valor, ultimo_id))
+    ordem = [chave] if coluna is chave else [coluna, chave]
+
+    # Uma linha a mais indica se existe próxima página
+    pacientes = query.order_by(*ordem).limit(limit + 1).all()
+    next_cursor = None
+    if len(pacientes) > limit:
+        pacientes = pacientes[:limit]
+        ultimo = pacientes[-1]
+        next_cursor = codificar_cursor(ordenar_por, getattr(ultimo, coluna.key), ultimo.id_paciente)
+
+    return pacientes, next_cursor
+
+
 def update_paciente(db: Session, paciente_id: int, paciente: schemas.PacienteCreate):
     """Atualiza paciente e todos os relacionamentos"""
     db_paciente = get_paciente(db, paciente_id)
     if not db_paciente:
         return None
     
-    # Salvar histórico (não crítico — ignorar se tabela não existir)
-    try:
-        save_historico(db, db_paciente)
-    except Exception as e:
-        print(f"AVISO: Não foi possível salvar histórico: {type(e).__name__}: {str(e)}")
-        db.rollback()
-        # Re-buscar o paciente após rollback
-        db_paciente = get_paciente(db, paciente_id)
-        if not db_paciente:
-            return None
+    # Estado anterior para o histórico (o grafo já está carregado)
+    estado_historico = iniciar_historico(
+        db, paciente_id, CAMPOS_PACIENTE, RELACIONAMENTOS_PACIENTE, db_paciente
+    )
 
+    buckets_antes = agregados.buckets_do_grafo(db_paciente)
     
     # Extrair novos dados
     paciente_dict = paciente.dict(exclude={
@@ -204,8 +616,7 @@ def update_paciente(db: Session, paciente_id: int, paciente: schemas.PacienteCre
     
     # Recalcular idade se a data de nascimento for atualizada e a idade vier nula
     if paciente.data_nascimento and not paciente_dict.get('idade'):
-        hoje = datetime.date.today()
-        idade_calculada = hoje.year - paciente.data_nascimento.year - ((hoje.month, hoje.day) < (paciente.data_nascimento.month, paciente.data_nascimento.day))
+        idade_calculada = calcular_idade(paciente.data_nascimento)
         paciente_dict['idade'] = idade_calculada
         
         if paciente_dict.get('hd_idade_diagnostico') is None:
@@ -214,29 +625,326 @@ def update_paciente(db: Session, paciente_id: int, paciente: schemas.PacienteCre
     # Atualizar dados principais
     for key, value in paciente_dict.items():
         setattr(db_paciente, key, value)
+    preencher_campos_derivados(
+        db_paciente,
+        paciente.tratamento.imunohistoquimicas if paciente.tratamento else None
+    )
+    # Incremento no próprio UPDATE (como em patch_paciente): PUTs concorrentes não
+    # repetem a versão (ETag) lida antes
+    db_paciente.versao = models.Paciente.versao + 1
     
     # Atualizar relacionamentos
     update_relacionamentos(db, db_paciente, paciente)
     
+    # Agregados do dashboard: diferença entre o estado anterior e o gravado
+    db.flush()
+    agregados.aplicar_delta(db, buckets_antes, agregados.carregar_buckets(db, [paciente_id]))
+    gravar_historico(db, paciente_id, estado_historico, CAMPOS_PACIENTE, RELACIONAMENTOS_PACIENTE)
+    
     db.commit()
+    cache.incrementar_versao_dados()
     db.refresh(db_paciente)
     return db_paciente
 
 
+COLECOES_TRATAMENTO = {atributo for atributo, *_ in FILHOS_TRATAMENTO}
+COLECOES_DESFECHO = {atributo for atributo, *_ in FILHOS_DESFECHO}
+
+
+def _patch_um_para_um(db: Session, modelo, chave: str, paciente_id: int, parcial, colecoes, filhos):
+    """
+    Merge patch do tratamento/desfecho: UPDATE só das colunas enviadas (INSERT se ainda não
+    existe) e sincronização só das coleções enviadas (null = lista vazia).
+    """
+    enviados = parcial.__fields_set__
+    campos = parcial.dict(exclude_unset=True, exclude=colecoes)
+    id_registro = db.query(getattr(modelo, chave)).filter(modelo.id_paciente == paciente_id).scalar()
+    novo = id_registro is None
+    if novo:
+        registro = modelo(**campos, id_paciente=paciente_id)
+        db.add(registro)
+        db.flush()
+        id_registro = getattr(registro, chave)
+    elif campos:
+        db.query(modelo).filter(getattr(modelo, chave) == id_registro).update(campos, synchronize_session=False)
+
+    for atributo, modelo_filho, chave_filho, fk, preparar in filhos:
+        if atributo in enviados:
+            sincronizar_filhos(
+                db, modelo_filho, chave_filho, fk, id_registro,
+                getattr(parcial, atributo) or [], preparar, novo
+            )
+
+
+def patch_paciente(db: Session, paciente_id: int, patch: schemas.PacientePatch):
+    """
+    JSON Merge Patch (RFC 7396) do paciente: só as colunas e coleções presentes no corpo são
+    gravadas. Colunas do paciente vão em um único UPDATE; coleções são sincronizadas por id;
+    os agregados do dashboard só são recalculados se um campo que os afeta foi enviado.
+    Retorna None se o paciente não existe; ValueError para nulls não permitidos.
+    """
+    enviados = patch.__fields_set__
+    for nome in ("nome_completo", "tratamento", "desfecho"):
+        if nome in enviados and getattr(patch, nome) is None:
+            raise ValueError(f"'{nome}' não pode ser nulo no PATCH")
+
+    if get_versao_paciente(db, paciente_id) is None:
+        return None
+
+    # Histórico: só as partes do grafo presentes no corpo
+    campos_historico = CAMPOS_PACIENTE if enviados - set(RELACIONAMENTOS_PACIENTE) else ("id_paciente",)
+    incluir_historico = tuple(r for r in RELACIONAMENTOS_PACIENTE if r in enviados)
+    estado_historico = iniciar_historico(db, paciente_id, campos_historico, incluir_historico)
+
+    tratamento_enviado = patch.tratamento.__fields_set__ if "tratamento" in enviados else set()
+    desfecho_enviado = patch.desfecho.__fields_set__ if "desfecho" in enviados else set()
+    afeta_agregados = bool(
+        enviados & agregados.CAMPOS_AGREGADOS["paciente"]
+        or tratamento_enviado & agregados.CAMPOS_AGREGADOS["tratamento"]
+        or desfecho_enviado & agregados.CAMPOS_AGREGADOS["desfecho"]
+    )
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id]) if afeta_agregados else None
+
+    # Colunas do paciente + derivadas em um único UPDATE
+    valores = patch.dict(exclude_unset=True, exclude={"familiares", "tratamento", "desfecho"})
+    if valores.get("data_nascimento") and not valores.get("idade"):
+        valores["idade"] = calcular_idade(valores["data_nascimento"])
+    ihq = None
+    if "imunohistoquimicas" in tratamento_enviado:
+        ihq = patch.tratamento.imunohistoquimicas or []
+    valores.update(campos_derivados(valores, ihq))
+    valores["versao"] = models.Paciente.versao + 1
+    db.query(models.Paciente).filter(
+        models.Paciente.id_paciente == paciente_id
+    ).update(valores, synchronize_session=False)
+
+    if "familiares" in enviados:
+        sincronizar_filhos(
+            db, models.PacienteFamiliar, "id_familiar", "id_paciente", paciente_id, patch.familiares or []
+        )
+    if "tratamento" in enviados:
+        _patch_um_para_um(
+            db, models.Tratamento, "id_tratamento", paciente_id,
+            patch.tratamento, COLECOES_TRATAMENTO, FILHOS_TRATAMENTO
+        )
+    if "desfecho" in enviados:
+        _patch_um_para_um(
+            db, models.Desfecho, "id_desfecho", paciente_id,
+            patch.desfecho, COLECOES_DESFECHO, FILHOS_DESFECHO
+        )
+
+    if afeta_agregados:
+        db.flush()
+        agregados.aplicar_delta(db, buckets_antes, agregados.carregar_buckets(db, [paciente_id]))
+    gravar_historico(db, paciente_id, estado_historico, campos_historico, incluir_historico)
+
+    db.commit()
+    cache.incrementar_versao_dados()
+    return get_paciente(db, paciente_id)
+
+
+# =======================================================================
+# SUB-RECURSOS (/pacientes/{id}/tratamento, /desfecho, /cirurgias, ...)
+# Cada operação lê/grava só a tabela afetada e, ao final, incrementa a versão do
+# paciente (ETag), atualiza o subtipo molecular e os agregados quando necessário.
+# =======================================================================
+
+# Registros 1:1: nome → (modelo, chave primária, coleções filhas, nomes das coleções)
+UM_PARA_UM = {
+    "tratamento": (models.Tratamento, "id_tratamento", FILHOS_TRATAMENTO, COLECOES_TRATAMENTO),
+    "desfecho": (models.Desfecho, "id_desfecho", FILHOS_DESFECHO, COLECOES_DESFECHO),
+}
+
+# Coleções expostas como sub-recurso: nome → (registro 1:1 pai, definição em FILHOS_*)
+SUBRECURSOS_COLECAO = {
+    "cirurgias": ("tratamento", FILHOS_TRATAMENTO[0]),
+    "imunohistoquimicas": ("tratamento", FILHOS_TRATAMENTO[5]),
+    "eventos": ("desfecho", FILHOS_DESFECHO[1]),
+}
+
+
+def _subtipo_atual(db: Session, paciente_id: int):
+    """Subtipo do paciente recalculado a partir das IHQ gravadas"""
+    ihq = models.Imunohistoquimicas
+    exames = (
+        db.query(ihq.data_realizacao, ihq.subtipo_molecular)
+        .join(models.Tratamento, models.Tratamento.id_tratamento == ihq.id_tratamento)
+        .filter(models.Tratamento.id_paciente == paciente_id)
+        .order_by(ihq.id_imunohistoquimica)
+        .all()
+    )
+    return classificacao.resolver_subtipo_paciente(exames)
+
+
+def _iniciar_historico_subrecurso(db: Session, paciente_id: int, pai: str):
+    return iniciar_historico(db, paciente_id, ("id_paciente",), (pai,))
+
+
+def _finalizar_subrecurso(db: Session, paciente_id: int, pai: str, estado_historico,
+                          buckets_antes=None, subtipo: bool = False):
+    """
+    Versão do paciente (+ subtipo), delta dos agregados, histórico (só o registro 1:1
+    `pai` é comparado), commit e invalidação do cache
+    """
+    db.flush()
+    valores = {"versao": models.Paciente.versao + 1}
+    if subtipo:
+        valores["subtipo_molecular"] = _subtipo_atual(db, paciente_id)
+    db.query(models.Paciente).filter(
+        models.Paciente.id_paciente == paciente_id
+    ).update(valores, synchronize_session=False)
+    if buckets_antes is not None:
+        db.flush()
+        agregados.aplicar_delta(db, buckets_antes, agregados.carregar_buckets(db, [paciente_id]))
+    gravar_historico(db, paciente_id, estado_historico, ("id_paciente",), (pai,))
+    db.commit()
+    cache.incrementar_versao_dados()
+
+
+def get_um_para_um(db: Session, paciente_id: int, recurso: str):
+    """Tratamento/desfecho do paciente com suas coleções (um SELECT ... IN por coleção)"""
+    modelo, _, filhos, _ = UM_PARA_UM[recurso]
+    return (
+        db.query(modelo)
+        .options(*[selectinload(getattr(modelo, atributo)) for atributo, *_ in filhos])
+        .filter(modelo.id_paciente == paciente_id)
+        .first()
+    )
+
+
+def criar_um_para_um(db: Session, paciente_id: int, recurso: str, dados):
+    """Cria o tratamento/desfecho (com coleções). ValueError se já existe."""
+    modelo, chave, filhos, colecoes = UM_PARA_UM[recurso]
+    if db.query(getattr(modelo, chave)).filter(modelo.id_paciente == paciente_id).scalar() is not None:
+        raise ValueError(f"Paciente já possui {recurso}")
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, recurso)
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id])
+    registro = modelo(**dados.dict(exclude=colecoes), id_paciente=paciente_id)
+    db.add(registro)
+    db.flush()
+    sincronizar_colecoes(db, filhos, dados, getattr(registro, chave), novo=True)
+    _finalizar_subrecurso(
+        db, paciente_id, recurso, estado_historico, buckets_antes, subtipo=recurso == "tratamento"
+    )
+    return get_um_para_um(db, paciente_id, recurso)
+
+
+def patch_um_para_um(db: Session, paciente_id: int, recurso: str, dados):
+    """Merge patch do tratamento/desfecho existente; None se não existe"""
+    modelo, chave, filhos, colecoes = UM_PARA_UM[recurso]
+    if db.query(getattr(modelo, chave)).filter(modelo.id_paciente == paciente_id).scalar() is None:
+        return None
+    enviados = dados.__fields_set__
+    afeta_agregados = bool(enviados & agregados.CAMPOS_AGREGADOS[recurso])
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id]) if afeta_agregados else None
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, recurso)
+    _patch_um_para_um(db, modelo, chave, paciente_id, dados, colecoes, filhos)
+    _finalizar_subrecurso(
+        db, paciente_id, recurso, estado_historico, buckets_antes, subtipo="imunohistoquimicas" in enviados
+    )
+    return get_um_para_um(db, paciente_id, recurso)
+
+
+def remover_um_para_um(db: Session, paciente_id: int, recurso: str):
+    """Remove o tratamento/desfecho (coleções pelo ON DELETE CASCADE); False se não existe"""
+    modelo = UM_PARA_UM[recurso][0]
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id])
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, recurso)
+    if not db.query(modelo).filter(modelo.id_paciente == paciente_id).delete(synchronize_session=False):
+        db.rollback()
+        return False
+    _finalizar_subrecurso(
+        db, paciente_id, recurso, estado_historico, buckets_antes, subtipo=recurso == "tratamento"
+    )
+    return True
+
+
+def _id_pai_colecao(db: Session, paciente_id: int, recurso: str):
+    pai, _ = SUBRECURSOS_COLECAO[recurso]
+    modelo, chave, _, _ = UM_PARA_UM[pai]
+    return db.query(getattr(modelo, chave)).filter(modelo.id_paciente == paciente_id).scalar()
+
+
+def _filho_do_paciente(db: Session, paciente_id: int, recurso: str, id_filho: int):
+    _, (_, modelo, chave, fk, _) = SUBRECURSOS_COLECAO[recurso]
+    id_pai = _id_pai_colecao(db, paciente_id, recurso)
+    if id_pai is None:
+        return None
+    return db.query(modelo).filter(getattr(modelo, chave) == id_filho, getattr(modelo, fk) == id_pai).first()
+
+
+def listar_colecao(db: Session, paciente_id: int, recurso: str):
+    _, (_, modelo, chave, fk, _) = SUBRECURSOS_COLECAO[recurso]
+    id_pai = _id_pai_colecao(db, paciente_id, recurso)
+    if id_pai is None:
+        return []
+    return db.query(modelo).filter(getattr(modelo, fk) == id_pai).order_by(getattr(modelo, chave)).all()
+
+
+def adicionar_item_colecao(db: Session, paciente_id: int, recurso: str, dados):
+    """Insere um item (ex.: um evento). ValueError se o registro 1:1 pai ainda não existe."""
+    pai, (_, modelo, chave, fk, preparar) = SUBRECURSOS_COLECAO[recurso]
+    id_pai = _id_pai_colecao(db, paciente_id, recurso)
+    if id_pai is None:
+        raise ValueError(f"Paciente sem {pai}; crie-o em /pacientes/{paciente_id}/{pai}")
+    molecular = recurso == "imunohistoquimicas"
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id]) if molecular else None
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, pai)
+
+    colunas = {c.key for c in modelo.__table__.columns} - {chave, fk}
+    valores = {k: v for k, v in dados.dict().items() if k in colunas}
+    item = modelo(**(preparar(valores) if preparar else valores), **{fk: id_pai})
+    db.add(item)
+    _finalizar_subrecurso(db, paciente_id, pai, estado_historico, buckets_antes, subtipo=molecular)
+    db.refresh(item)
+    return item
+
+
+def atualizar_item_colecao(db: Session, paciente_id: int, recurso: str, id_filho: int, dados):
+    """Merge patch de um item da coleção; None se não pertence ao paciente"""
+    pai, (_, modelo, chave, fk, preparar) = SUBRECURSOS_COLECAO[recurso]
+    item = _filho_do_paciente(db, paciente_id, recurso, id_filho)
+    if item is None:
+        return None
+    molecular = recurso == "imunohistoquimicas"
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id]) if molecular else None
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, pai)
+
+    colunas = {c.key for c in modelo.__table__.columns} - {chave, fk}
+    for campo, valor in dados.dict(exclude_unset=True).items():
+        if campo in colunas:
+            setattr(item, campo, valor)
+    if preparar:
+        for campo, valor in preparar({c: getattr(item, c) for c in colunas}).items():
+            setattr(item, campo, valor)
+    _finalizar_subrecurso(db, paciente_id, pai, estado_historico, buckets_antes, subtipo=molecular)
+    db.refresh(item)
+    return item
+
+
+def remover_item_colecao(db: Session, paciente_id: int, recurso: str, id_filho: int):
+    pai = SUBRECURSOS_COLECAO[recurso][0]
+    item = _filho_do_paciente(db, paciente_id, recurso, id_filho)
+    if item is None:
+        return False
+    molecular = recurso == "imunohistoquimicas"
+    buckets_antes = agregados.carregar_buckets(db, [paciente_id]) if molecular else None
+    estado_historico = _iniciar_historico_subrecurso(db, paciente_id, pai)
+    db.delete(item)
+    _finalizar_subrecurso(db, paciente_id, pai, estado_historico, buckets_antes, subtipo=molecular)
+    return True
+
+
 def update_relacionamentos(db: Session, db_paciente, paciente: schemas.PacienteCreate):
-    """Atualiza todos os relacionamentos do paciente via queries explícitas (não usa lazy=noload)."""
+    """
+    Atualiza todos os relacionamentos do paciente via queries explícitas (não usa lazy=noload).
+    As coleções filhas são sincronizadas por id (sincronizar_filhos): linhas inalteradas não
+    são tocadas, em vez de apagar e reinserir tudo a cada gravação.
+    """
     paciente_id = db_paciente.id_paciente
 
-    # Familiares - deletar antigos e inserir novos via query direta
-    if paciente.familiares is not None:
-        db.query(models.PacienteFamiliar).filter(
-            models.PacienteFamiliar.id_paciente == paciente_id
-        ).delete(synchronize_session=False)
-        for familiar_data in paciente.familiares:
-            db.add(models.PacienteFamiliar(
-                **familiar_data.dict(),
-                id_paciente=paciente_id
-            ))
+    # Familiares
+    sincronizar_colecoes(db, FILHOS_PACIENTE, paciente, paciente_id)
 
     # Tratamento - buscar diretamente pelo id_paciente
     if paciente.tratamento:
@@ -249,34 +957,16 @@ def update_relacionamentos(db: Session, db_paciente, paciente: schemas.PacienteC
             "endo_paliativa", "imuno_paliativa", "imunohistoquimicas"
         })
 
-        if db_tratamento:
-            for key, value in tratamento_campos.items():
-                setattr(db_tratamento, key, value)
-            # Deletar sub-registros antigos
-            db.query(models.TratamentoCirurgia).filter(
-                models.TratamentoCirurgia.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-            db.query(models.PalliativoQuimioterapia).filter(
-                models.PalliativoQuimioterapia.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-            db.query(models.PalliativoRadioterapia).filter(
-                models.PalliativoRadioterapia.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-            db.query(models.PalliativoEndocrinoterapia).filter(
-                models.PalliativoEndocrinoterapia.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-            db.query(models.PalliativoImunoterapia).filter(
-                models.PalliativoImunoterapia.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-            db.query(models.Imunohistoquimicas).filter(
-                models.Imunohistoquimicas.id_tratamento == db_tratamento.id_tratamento
-            ).delete(synchronize_session=False)
-        else:
+        novo = db_tratamento is None
+        if novo:
             db_tratamento = models.Tratamento(**tratamento_campos, id_paciente=paciente_id)
             db.add(db_tratamento)
             db.flush()
+        else:
+            for key, value in tratamento_campos.items():
+                setattr(db_tratamento, key, value)
 
-        add_tratamento_relacionamentos(db, db_tratamento, paciente.tratamento)
+        sincronizar_colecoes(db, FILHOS_TRATAMENTO, paciente.tratamento, db_tratamento.id_tratamento, novo)
 
     # Desfecho - buscar diretamente pelo id_paciente
     if paciente.desfecho:
@@ -286,128 +976,156 @@ def update_relacionamentos(db: Session, db_paciente, paciente: schemas.PacienteC
 
         desfecho_campos = paciente.desfecho.dict(exclude={"metastases", "eventos"})
 
-        if db_desfecho:
-            for key, value in desfecho_campos.items():
-                setattr(db_desfecho, key, value)
-            db.query(models.DesfechoMetastases).filter(
-                models.DesfechoMetastases.id_desfecho == db_desfecho.id_desfecho
-            ).delete(synchronize_session=False)
-            db.query(models.DesfechoEventos).filter(
-                models.DesfechoEventos.id_desfecho == db_desfecho.id_desfecho
-            ).delete(synchronize_session=False)
-        else:
+        novo = db_desfecho is None
+        if novo:
             db_desfecho = models.Desfecho(**desfecho_campos, id_paciente=paciente_id)
             db.add(db_desfecho)
             db.flush()
+        else:
+            for key, value in desfecho_campos.items():
+                setattr(db_desfecho, key, value)
 
-        add_desfecho_relacionamentos(db, db_desfecho, paciente.desfecho)
+        sincronizar_colecoes(db, FILHOS_DESFECHO, paciente.desfecho, db_desfecho.id_desfecho, novo)
 
 
+def delete_paciente(db: Session, paciente_id: int) -> bool:
+    """
+    Soft delete: marca `deleted_at` com um único UPDATE. O paciente some das leituras e
+    dos agregados na hora; o grafo é apagado depois, em lotes, por expurgo.py.
+    Retorna False se o paciente não existe (ou já foi removido).
+    """
+    return bool(delete_pacientes(db, [paciente_id]))
 
-def add_tratamento_relacionamentos(db: Session, db_tratamento, tratamento_data):
-    """Adiciona relacionamentos de tratamento"""
-    
-    # Cirurgias (Unificadas)
-    if tratamento_data.cirurgias:
-        for cirurgia_data in tratamento_data.cirurgias:
-            db_cirurgia = models.TratamentoCirurgia(
-                **cirurgia_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_cirurgia)
-    
-    # Quimioterapia Paliativa
-    if tratamento_data.quimio_paliativa:
-        for quimio_data in tratamento_data.quimio_paliativa:
-            db_quimio = models.PalliativoQuimioterapia(
-                **quimio_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_quimio)
-    
-    # Radioterapia Paliativa
-    if tratamento_data.radio_paliativa:
-        for radio_data in tratamento_data.radio_paliativa:
-            db_radio = models.PalliativoRadioterapia(
-                **radio_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_radio)
-    
-    # Endocrinoterapia Paliativa
-    if tratamento_data.endo_paliativa:
-        for endo_data in tratamento_data.endo_paliativa:
-            db_endo = models.PalliativoEndocrinoterapia(
-                **endo_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_endo)
-    
-    # Imunoterapia Paliativa
-    if tratamento_data.imuno_paliativa:
-        for imuno_data in tratamento_data.imuno_paliativa:
-            db_imuno = models.PalliativoImunoterapia(
-                **imuno_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_imuno)
-    
-    # Imunohistoquímicas
-    if tratamento_data.imunohistoquimicas:
-        for imunohisto_data in tratamento_data.imunohistoquimicas:
-            db_imunohisto = models.Imunohistoquimicas(
-                **imunohisto_data.dict(),
-                id_tratamento=db_tratamento.id_tratamento
-            )
-            db.add(db_imunohisto)
 
+def delete_pacientes(db: Session, ids):
+    """Soft delete de vários pacientes em um único UPDATE. Retorna os ids removidos."""
+    removidos = db.scalars(
+        update(models.Paciente)
+        .where(models.Paciente.id_paciente.in_(sorted(set(ids))), models.Paciente.deleted_at.is_(None))
+        .values(deleted_at=datetime.datetime.utcnow(), versao=models.Paciente.versao + 1)
+        .returning(models.Paciente.id_paciente),
+        execution_options={"synchronize_session": False},
+    ).all()
+    if not removidos:
+        db.rollback()
+        return []
+    agregados.aplicar_delta(db, agregados.carregar_buckets(db, removidos), Counter())
+    db.commit()
+    cache.incrementar_versao_dados()
+    return sorted(removidos)
 
-def add_desfecho_relacionamentos(db: Session, db_desfecho, desfecho_data):
-    """Adiciona relacionamentos de desfecho"""
-    
-    # Metástases
-    if desfecho_data.metastases:
-        for metastase_data in desfecho_data.metastases:
-            db_metastase = models.DesfechoMetastases(
-                **metastase_data.dict(),
-                id_desfecho=db_desfecho.id_desfecho
-            )
-            db.add(db_metastase)
-    
-    # Eventos
-    if desfecho_data.eventos:
-        for evento_data in desfecho_data.eventos:
-            db_evento = models.DesfechoEventos(
-                **evento_data.dict(),
-                id_desfecho=db_desfecho.id_desfecho
-            )
-            db.add(db_evento)
 
+# =======================================================================
+# HISTÓRICO (diffs do grafo + checkpoints periódicos, ver historico.py)
+# Não crítico: se o histórico falhar (p.ex. migration pendente), a escrita segue sem ele.
+# =======================================================================
 
-def delete_paciente(db: Session, paciente_id: int):
-    """Deleta paciente e todos os relacionamentos (CASCADE)"""
-    paciente = get_paciente(db, paciente_id)
-    if paciente:
-        db.delete(paciente)
-        db.commit()
-    return paciente
-
-
-def save_historico(db: Session, paciente):
-    """Salva histórico de alterações"""
-    historico = models.PacienteHistorico(
-        id_paciente=paciente.id_paciente,
-        data_modificacao=datetime.datetime.utcnow(),
-        dados_anteriores={
-            "nome_completo": paciente.nome_completo,
-            "data_nascimento": str(paciente.data_nascimento) if paciente.data_nascimento else None,
-            "genero": paciente.genero,
-            "cidade": paciente.cidade,
-            "uf": paciente.uf
-        }
+def _carregar_snapshot(db: Session, paciente_id: int, campos, incluir):
+    """Snapshot das partes pedidas relidas do banco (ignora o que está no identity map)"""
+    db_paciente = (
+        db.query(models.Paciente)
+        .options(*opcoes_parciais(campos, incluir))
+        .filter(models.Paciente.id_paciente == paciente_id)
+        .execution_options(populate_existing=True)
+        .one()
     )
-    db.add(historico)
-    db.flush()
+    return historico.snapshot(db_paciente, campos, incluir)
+
+
+def iniciar_historico(db: Session, paciente_id: int, campos, incluir, db_paciente=None):
+    """
+    Estado anterior a uma escrita: (versão do último checkpoint, snapshot de `campos` e
+    `incluir`), ou None se o histórico está indisponível. Sem checkpoint, o snapshot é do
+    grafo completo. `db_paciente` (grafo completo já carregado) evita reler o banco.
+    """
+    try:
+        with db.begin_nested():
+            ultimo = historico.ultimo_checkpoint(db, paciente_id)
+            if ultimo is None:
+                campos, incluir = CAMPOS_PACIENTE, RELACIONAMENTOS_PACIENTE
+            if db_paciente is not None:
+                return ultimo, historico.snapshot(db_paciente, campos, incluir)
+            return ultimo, _carregar_snapshot(db, paciente_id, campos, incluir)
+    except Exception as e:
+        print(f"AVISO: Histórico indisponível: {type(e).__name__}: {str(e)}")
+        return None
+
+
+def gravar_historico(db: Session, paciente_id: int, estado, campos, incluir):
+    """Registra a versão recém-escrita (sem commit); `estado` vem de iniciar_historico"""
+    if estado is None:
+        return
+    ultimo, antes = estado
+    try:
+        with db.begin_nested():
+            versao = db.query(models.Paciente.versao).filter(models.Paciente.id_paciente == paciente_id).scalar()
+            if historico.checkpoint_devido(ultimo, versao):
+                campos, incluir = CAMPOS_PACIENTE, RELACIONAMENTOS_PACIENTE
+            depois = _carregar_snapshot(db, paciente_id, campos, incluir)
+            historico.registrar(db, paciente_id, versao, antes, depois, ultimo)
+    except Exception as e:
+        print(f"AVISO: Não foi possível salvar histórico: {type(e).__name__}: {str(e)}")
+
+
+# =======================================================================
+# IDEMPOTÊNCIA (Idempotency-Key em POST /pacientes)
+# =======================================================================
+
+# Por quanto tempo a resposta original é repetida para a mesma chave
+IDEMPOTENCIA_TTL = datetime.timedelta(hours=24)
+# Reserva sem conclusão depois disso é considerada abandonada (processo interrompido)
+IDEMPOTENCIA_EM_ANDAMENTO_MAX = datetime.timedelta(minutes=5)
+
+
+def reservar_idempotencia(db: Session, usuario: str, chave: str, hash_corpo: str, ttl=IDEMPOTENCIA_TTL):
+    """
+    Reserva (usuario, chave) para uma nova execução. Retorna None quando a reserva foi
+    criada (o chamador executa e chama concluir_idempotencia ou liberar_idempotencia),
+    ou o registro existente (concluído ou em andamento) para ser repetido.
+    """
+    registro = models.IdempotenciaRequisicao
+    for _ in range(2):
+        agora = datetime.datetime.utcnow()
+        # Chaves expiradas ou abandonadas do usuário (inclusive esta) deixam de valer
+        db.query(registro).filter(
+            registro.usuario == usuario,
+            or_(
+                registro.expira_em <= agora,
+                and_(registro.status_code.is_(None), registro.criado_em <= agora - IDEMPOTENCIA_EM_ANDAMENTO_MAX),
+            ),
+        ).delete(synchronize_session=False)
+        try:
+            db.add(registro(
+                usuario=usuario, chave=chave, hash_corpo=hash_corpo,
+                criado_em=agora, expira_em=agora + ttl,
+            ))
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+        existente = db.get(registro, (usuario, chave))
+        if existente is not None:
+            return existente
+    raise RuntimeError("Não foi possível reservar a chave de idempotência")
+
+
+def concluir_idempotencia(db: Session, usuario: str, chave: str, status_code: int, resposta):
+    """Grava a resposta da execução reservada"""
+    db.query(models.IdempotenciaRequisicao).filter(
+        models.IdempotenciaRequisicao.usuario == usuario,
+        models.IdempotenciaRequisicao.chave == chave,
+    ).update({"status_code": status_code, "resposta": resposta}, synchronize_session=False)
+    db.commit()
+
+
+def liberar_idempotencia(db: Session, usuario: str, chave: str):
+    """Remove a reserva de uma execução que falhou, para o cliente poder repetir"""
+    db.query(models.IdempotenciaRequisicao).filter(
+        models.IdempotenciaRequisicao.usuario == usuario,
+        models.IdempotenciaRequisicao.chave == chave,
+        models.IdempotenciaRequisicao.status_code.is_(None),
+    ).delete(synchronize_session=False)
+    db.commit()
 
 
 # =======================================================================
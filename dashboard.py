@@ -1,46 +1,66 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func, and_, or_, literal, union_all, extract, cast, Date, distinct, Integer
+from sqlalchemy import text, func, and_, or_, literal, union_all, extract, cast, case, Date, distinct, Integer
 import models
+import agregados
+from cache import cache_dashboard
+from classificacao import ESTADIOS, ROTULOS_SUBTIPO, CAMPOS_NUMERICOS, coluna_numerica, rotulo_estadiamento
 import logging
 
 logger = logging.getLogger(__name__)
 
 # ✅ 1. Distribuição por Estadiamento no Diagnóstico
+@cache_dashboard(ttl=300)
 def get_estadiamento(db: Session):
     """
     Busca distribuição por estadiamento.
-    Ajuste: estadiamento_clinico foi movido para a tabela PACIENTE (campo hd_estadiamento_clinico).
+    Agrupa pelo código canônico (hd_estadiamento_codigo, derivado do texto livre na escrita),
+    exibido como 'EC 0'..'EC IV'.
     """
     try:
-        # ATENÇÃO: Confirme se o mapeamento em models.Paciente.hd_estadiamento_clinico é o correto.
-        estadiamento_field = models.Paciente.hd_estadiamento_clinico
-        
-        result = db.query(
-            func.coalesce(estadiamento_field, literal('Não informado')).label('estagio'),
-            func.count(models.Paciente.id_paciente).label('total')
-        ).group_by(
-            estadiamento_field
-        ).order_by(
-            func.count(models.Paciente.id_paciente).desc()
-        ).all()
+        agregado = agregados.ler_dimensao(db, "estadiamento")
+        if agregado is not None:
+            return [{"estagio": bucket, "total": total} for bucket, total in agregado]
 
-        return [{"estagio": r.estagio, "total": r.total} for r in result]
+        return [
+            {"estagio": rotulo_estadiamento(codigo) or 'Não informado', "total": total}
+            for codigo, total in _contagem_por_estadiamento(db)
+        ]
     except Exception as e:
         logger.error(f"Erro ao buscar estadiamento: {str(e)}")
         return []
 
 
+def _contagem_por_estadiamento(db: Session):
+    """Um GROUP BY indexado sobre o código canônico de estadiamento."""
+    return db.query(
+        models.Paciente.hd_estadiamento_codigo,
+        func.count(models.Paciente.id_paciente)
+    ).filter(
+        models.filtro_ativo(models.Paciente)
+    ).group_by(
+        models.Paciente.hd_estadiamento_codigo
+    ).order_by(
+        func.count(models.Paciente.id_paciente).desc()
+    ).all()
+
+
 # ✅ 2. Sobrevida Global (Vivo x Óbito)
+@cache_dashboard(ttl=300)
 def get_sobrevida_global(db: Session):
     """
     Busca sobrevida global.
     Ajuste: O campo status_vital permanece na tabela DESFECHO.
     """
     try:
-        
+        agregado = agregados.ler_dimensao(db, "status_vital")
+        if agregado is not None:
+            return [{"status": bucket, "total": total} for bucket, total in agregado]
+
         result = db.query(
             func.coalesce(models.Desfecho.status_vital, literal('Não informado')).label('status'),
             func.count(models.Desfecho.id_desfecho).label('total')
+        ).filter(
+            models.filtro_ativo(models.Desfecho)
         ).group_by(
             models.Desfecho.status_vital
         ).all()
@@ -52,6 +72,7 @@ def get_sobrevida_global(db: Session):
 
 
 # ✅ 3. Taxa de Recidiva (Local, Regional, Metástase)
+@cache_dashboard(ttl=300)
 def get_taxa_recidiva(db: Session):
     """
     Busca taxa de recidiva.
@@ -59,18 +80,21 @@ def get_taxa_recidiva(db: Session):
     `DESFECHO_METASTASES` (`models.DesfechoMetastases`).
     """
     try:
-        
+        agregado = agregados.ler_dimensao(db, "recidiva")
+        if agregado is not None:
+            return [{"tipo": bucket, "total": total} for bucket, total in agregado]
+
         # Subquery 1: Recidiva Local (usa o flag booleano em Desfecho)
         recidiva_local = db.query(
             models.Desfecho.id_desfecho.label('id'), # Identificador para o UNION ALL
             literal('Recidiva Local').label('tipo')
-        ).filter(models.Desfecho.recidiva_local == True)
+        ).filter(models.Desfecho.recidiva_local == True, models.filtro_ativo(models.Desfecho))
         
         # Subquery 2: Recidiva Regional (usa o flag booleano em Desfecho)
         recidiva_regional = db.query(
             models.Desfecho.id_desfecho.label('id'),
             literal('Recidiva Regional').label('tipo')
-        ).filter(models.Desfecho.recidiva_regional == True)
+        ).filter(models.Desfecho.recidiva_regional == True, models.filtro_ativo(models.Desfecho))
         
         # Subquery 3: Metástase (JOIN com a nova tabela 1:N DESFECHO_METASTASES)
         # O distinct no SELECT evita contar locais duplicados na tabela de metástase, garantindo
@@ -81,7 +105,7 @@ def get_taxa_recidiva(db: Session):
         ).join(
             models.DesfechoMetastases,
             models.DesfechoMetastases.id_desfecho == models.Desfecho.id_desfecho
-        )
+        ).filter(models.filtro_ativo(models.Desfecho))
         
         # Union das subqueries
         # Usamos o ID para garantir que pacientes duplicados sejam removidos no COUNT final (embora o GROUP BY já faça isso).
@@ -100,6 +124,7 @@ def get_taxa_recidiva(db: Session):
 
 
 # ✅ 4. Média dos Tempos (Delta T)
+@cache_dashboard(ttl=300)
 def get_media_delta_t(db: Session):
     """
     Busca média dos tempos.
@@ -120,7 +145,8 @@ def get_media_delta_t(db: Session):
             ).label('media_dias')
         ).filter(
             data_cir.isnot(None),
-            data_diag.isnot(None)
+            data_diag.isnot(None),
+            models.filtro_ativo(models.Desfecho)
         )
         
         # Subquery 2: Diagnóstico → Início Tratamento
@@ -131,7 +157,8 @@ def get_media_delta_t(db: Session):
             ).label('media_dias')
         ).filter(
             data_init_trat.isnot(None),
-            data_diag.isnot(None)
+            data_diag.isnot(None),
+            models.filtro_ativo(models.Desfecho)
         )
         
         # Subquery 3: Primeira Consulta → Diagnóstico
@@ -142,7 +169,8 @@ def get_media_delta_t(db: Session):
             ).label('media_dias')
         ).filter(
             data_diag.isnot(None),
-            data_prim_cons.isnot(None)
+            data_prim_cons.isnot(None),
+            models.filtro_ativo(models.Desfecho)
         )
         
         # Union das subqueries
@@ -159,15 +187,114 @@ def get_media_delta_t(db: Session):
         return []
 
 
+def _diferenca_dias(db: Session, inicio, fim):
+    """Dias inteiros entre duas colunas Date (PostgreSQL: date - date; SQLite: julianday)."""
+    if db.get_bind().dialect.name == "sqlite":
+        return cast(func.julianday(fim) - func.julianday(inicio), Integer)
+    return cast(fim, Date) - cast(inicio, Date)
+
+
+def _validar_limites(limites):
+    try:
+        limites = tuple(int(limite) for limite in limites)
+    except (TypeError, ValueError):
+        raise ValueError("Limites devem ser números inteiros de dias")
+    if not limites or list(limites) != sorted(set(limites)) or limites[0] < 0:
+        raise ValueError("Limites devem ser inteiros não negativos, distintos e em ordem crescente")
+    return limites
+
+
+def _histograma_delta_t(db: Session, dias, filtro, limites):
+    """Contagem por faixa calculada no banco: no máximo len(limites) + 1 linhas."""
+    faixa = case(
+        *[(dias <= limite, indice) for indice, limite in enumerate(limites)],
+        else_=len(limites)
+    ).label('faixa')
+    contagem = dict(
+        db.query(faixa, func.count().label('total')).filter(*filtro).group_by(faixa).all()
+    )
+    return [
+        {"faixa": rotulo, "total": contagem.get(indice, 0)}
+        for indice, rotulo in enumerate(agregados.rotulos_delta_t(limites))
+    ]
+
+
+def _percentis(db: Session, dias, filtro, fracoes):
+    """
+    Percentis contínuos (interpolação linear, como percentile_cont).
+    PostgreSQL: percentile_cont em uma única consulta. Demais bancos: para cada fração
+    busca só as duas linhas vizinhas da posição (ORDER BY + OFFSET, LIMIT 2).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        linha = db.query(
+            *[func.percentile_cont(fracao).within_group(dias) for fracao in fracoes]
+        ).filter(*filtro).one()
+        return [float(valor) if valor is not None else None for valor in linha]
+
+    total = db.query(func.count()).filter(*filtro).scalar() or 0
+    if not total:
+        return [None] * len(fracoes)
+    valores = []
+    for fracao in fracoes:
+        posicao = fracao * (total - 1)
+        base = int(posicao)
+        vizinhos = [
+            r[0] for r in db.query(dias).filter(*filtro).order_by(dias).offset(base).limit(2).all()
+        ]
+        inferior = vizinhos[0]
+        superior = vizinhos[-1]
+        valores.append(float(inferior + (superior - inferior) * (posicao - base)))
+    return valores
+
+
+# ✅ 4.1 Delta T analítico (histograma e percentis calculados no banco)
+@cache_dashboard(ttl=300)
+def get_delta_t_analitico(db: Session, limites=agregados.DELTA_T_LIMITES):
+    """
+    Diagnóstico → Início do Tratamento: histograma por faixas configuráveis
+    (`limites` = último dia de cada faixa, ex.: (30, 60, 90)) e mediana/p75/p90.
+    Só alguns registros trafegam do banco, independentemente do tamanho da coorte.
+    """
+    limites = _validar_limites(limites)
+    try:
+        inicio = models.Desfecho.td_data_diagnostico
+        fim = models.Desfecho.td_data_inicio_tratamento
+        dias = _diferenca_dias(db, inicio, fim)
+        filtro = (inicio.isnot(None), fim.isnot(None), dias >= 0, models.filtro_ativo(models.Desfecho))
+
+        total, media = db.query(func.count(), func.avg(dias)).filter(*filtro).one()
+        mediana, p75, p90 = _percentis(db, dias, filtro, (0.5, 0.75, 0.9))
+
+        return {
+            "limites": list(limites),
+            "histograma": _histograma_delta_t(db, dias, filtro, limites),
+            "total": total,
+            "media_dias": round(float(media), 1) if media is not None else None,
+            "mediana_dias": round(mediana, 1) if mediana is not None else None,
+            "p75_dias": round(p75, 1) if p75 is not None else None,
+            "p90_dias": round(p90, 1) if p90 is not None else None,
+        }
+    except Exception as e:
+        logger.error(f"Erro ao buscar delta T analítico: {str(e)}")
+        return {}
+
+
 # ✅ 5. Distribuição por Gênero
+@cache_dashboard(ttl=300)
 def get_distribuicao_genero(db: Session):
     """
     Busca distribuição de pacientes por gênero.
     """
     try:
+        agregado = agregados.ler_dimensao(db, "genero")
+        if agregado is not None:
+            return [{"genero": bucket, "total": total} for bucket, total in agregado]
+
         result = db.query(
             func.coalesce(models.Paciente.genero, literal('Não informado')).label('genero'),
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             models.Paciente.genero
         ).order_by(
@@ -181,13 +308,18 @@ def get_distribuicao_genero(db: Session):
 
 
 # ✅ 6. Distribuição por Faixa Etária
+@cache_dashboard(ttl=300)
 def get_distribuicao_faixa_etaria(db: Session):
     """
     Busca distribuição de pacientes por faixa etária.
     """
     try:
+        agregado = agregados.ler_dimensao(db, "faixa_etaria")
+        if agregado is not None:
+            return [{"faixa_etaria": bucket, "total": total} for bucket, total in agregado]
+
         # Criar faixas etárias usando CASE WHEN
-        faixa_etaria = func.case(
+        faixa_etaria = case(
             (models.Paciente.idade < 30, '0-29 anos'),
             (and_(models.Paciente.idade >= 30, models.Paciente.idade < 40), '30-39 anos'),
             (and_(models.Paciente.idade >= 40, models.Paciente.idade < 50), '40-49 anos'),
@@ -200,6 +332,8 @@ def get_distribuicao_faixa_etaria(db: Session):
         result = db.query(
             faixa_etaria,
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             faixa_etaria
         ).order_by(
@@ -213,6 +347,7 @@ def get_distribuicao_faixa_etaria(db: Session):
 
 
 # ✅ 7. Distribuição por Tipo de Cirurgia
+@cache_dashboard(ttl=300)
 def get_distribuicao_tipo_cirurgia(db: Session):
     """
     Busca distribuição por tipo de procedimento cirúrgico.
@@ -221,6 +356,8 @@ def get_distribuicao_tipo_cirurgia(db: Session):
         result = db.query(
             func.coalesce(models.TratamentoCirurgia.tipo_procedimento, literal('Não informado')).label('tipo'),
             func.count(models.TratamentoCirurgia.id_cirurgia).label('total')
+        ).filter(
+            models.filtro_ativo(models.TratamentoCirurgia)
         ).group_by(
             models.TratamentoCirurgia.tipo_procedimento
         ).order_by(
@@ -234,6 +371,7 @@ def get_distribuicao_tipo_cirurgia(db: Session):
 
 
 # ✅ 8. Distribuição por Marcadores Imunohistoquímicos
+@cache_dashboard(ttl=300)
 def get_distribuicao_marcadores(db: Session):
     """
     Busca distribuição por marcadores imunohistoquímicos.
@@ -244,7 +382,8 @@ def get_distribuicao_marcadores(db: Session):
             func.coalesce(models.Imunohistoquimicas.her2, literal('Não informado')).label('marcador'),
             func.count(models.Imunohistoquimicas.id_imunohistoquimica).label('total')
         ).filter(
-            models.Imunohistoquimicas.her2.isnot(None)
+            models.Imunohistoquimicas.her2.isnot(None),
+            models.filtro_ativo(models.Imunohistoquimicas)
         ).group_by(
             models.Imunohistoquimicas.her2
         ).all()
@@ -254,7 +393,8 @@ def get_distribuicao_marcadores(db: Session):
             func.coalesce(models.Imunohistoquimicas.ki67, literal('Não informado')).label('marcador'),
             func.count(models.Imunohistoquimicas.id_imunohistoquimica).label('total')
         ).filter(
-            models.Imunohistoquimicas.ki67.isnot(None)
+            models.Imunohistoquimicas.ki67.isnot(None),
+            models.filtro_ativo(models.Imunohistoquimicas)
         ).group_by(
             models.Imunohistoquimicas.ki67
         ).all()
@@ -269,6 +409,7 @@ def get_distribuicao_marcadores(db: Session):
 
 
 # ✅ 9. Distribuição por História Familiar
+@cache_dashboard(ttl=300)
 def get_distribuicao_historia_familiar(db: Session):
     """
     Busca distribuição por história familiar de câncer.
@@ -277,6 +418,8 @@ def get_distribuicao_historia_familiar(db: Session):
         result = db.query(
             func.coalesce(models.Paciente.hf_cancer_familia, literal(False)).label('tem_historia'),
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             models.Paciente.hf_cancer_familia
         ).all()
@@ -291,6 +434,7 @@ def get_distribuicao_historia_familiar(db: Session):
 
 
 # ✅ 10. Distribuição por Hábitos de Vida
+@cache_dashboard(ttl=300)
 def get_distribuicao_habitos_vida(db: Session):
     """
     Busca distribuição por hábitos de vida (tabagismo, etilismo, atividade física).
@@ -300,6 +444,8 @@ def get_distribuicao_habitos_vida(db: Session):
         tabagismo_result = db.query(
             func.coalesce(models.Paciente.hv_tabagismo, literal('Não informado')).label('habito'),
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             models.Paciente.hv_tabagismo
         ).all()
@@ -308,6 +454,8 @@ def get_distribuicao_habitos_vida(db: Session):
         etilismo_result = db.query(
             func.coalesce(models.Paciente.hv_etilismo, literal('Não informado')).label('habito'),
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             models.Paciente.hv_etilismo
         ).all()
@@ -316,6 +464,8 @@ def get_distribuicao_habitos_vida(db: Session):
         atividade_result = db.query(
             func.coalesce(models.Paciente.hv_atividade_fisica, literal('Não informado')).label('habito'),
             func.count(models.Paciente.id_paciente).label('total')
+        ).filter(
+            models.filtro_ativo(models.Paciente)
         ).group_by(
             models.Paciente.hv_atividade_fisica
         ).all()
@@ -330,48 +480,57 @@ def get_distribuicao_habitos_vida(db: Session):
         return {"tabagismo": [], "etilismo": [], "atividade_fisica": []}
 
 
+# Agregação condicional: um único scan por tabela calcula vários cartões
+def _contar_se(db: Session, condicao):
+    """COUNT(*) FILTER (WHERE ...) no PostgreSQL; SUM(CASE ...) como fallback (SQLite)."""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.count().filter(condicao)
+    return func.coalesce(func.sum(case((condicao, 1), else_=0)), 0)
+
+
 # ✅ 11. Resumo Geral do Dashboard
+@cache_dashboard(ttl=60)
 def get_resumo_geral(db: Session):
     try:
-        total_pacientes = db.query(func.count(models.Paciente.id_paciente)).scalar() or 0
-        pacientes_com_tratamento = db.query(func.count(models.Tratamento.id_tratamento)).scalar() or 0
-        pacientes_com_desfecho = db.query(func.count(models.Desfecho.id_desfecho)).scalar() or 0
-        pacientes_vivos = db.query(func.count(models.Desfecho.id_desfecho)).filter(models.Desfecho.status_vital.ilike('%Vivo%')).scalar() or 0
-        pacientes_obito = db.query(func.count(models.Desfecho.id_desfecho)).filter(
-            or_(
+        # 1. Um scan em PACIENTE (+ contagem de TRATAMENTO como subquery escalar)
+        pacientes = db.query(
+            func.count(models.Paciente.id_paciente).label('total'),
+            func.avg(models.Paciente.hd_idade_diagnostico).label('idade_media'),
+            func.avg(models.Paciente.hd_tamanho_tumoral_clinico).label('tamanho_medio'),
+            func.avg(models.Paciente.mp_score_gail_num).label('media_gail'),
+            func.avg(models.Paciente.mp_score_tyrer_cuzick_num).label('media_tyrer'),
+            db.query(func.count(models.Tratamento.id_tratamento)).filter(
+                models.filtro_ativo(models.Tratamento)
+            ).scalar_subquery().label('com_tratamento'),
+        ).filter(models.filtro_ativo(models.Paciente)).one()
+
+        # 2. Um scan em DESFECHO
+        desfechos = db.query(
+            func.count(models.Desfecho.id_desfecho).label('total'),
+            _contar_se(db, models.Desfecho.status_vital.ilike('%Vivo%')).label('vivos'),
+            _contar_se(db, or_(
                 models.Desfecho.status_vital.ilike('%óbito%'),
                 models.Desfecho.status_vital.ilike('%obito%'),
                 models.Desfecho.morte == True
-            )
-        ).scalar() or 0
-        pacientes_recidiva = db.query(func.count(models.Desfecho.id_desfecho)).filter(or_(models.Desfecho.recidiva_local == True, models.Desfecho.recidiva_regional == True)).scalar() or 0
-        pacientes_metastase = db.query(func.count(models.Desfecho.id_desfecho)).filter(models.Desfecho.metastase_ocorreu == True).scalar() or 0
-        
-        # Idade média diagnóstico
-        idade_media = db.query(func.avg(models.Paciente.hd_idade_diagnostico)).scalar()
-        idade_media = float(idade_media) if idade_media else 0.0
-
-        # Tamanho medio tumor
-        tamanho_medio = db.query(func.avg(models.Paciente.hd_tamanho_tumoral_clinico)).scalar()
-        tamanho_medio = float(tamanho_medio) if tamanho_medio else 0.0
-
-        # Médias de Risco (Strings no DB -> Converte manual)
-        riscos = db.query(models.Paciente.mp_score_gail, models.Paciente.mp_score_tyrer_cuzick).all()
-        s_gail = 0.0
-        c_gail = 0
-        s_tyrer = 0.0
-        c_tyrer = 0
-        for g, t in riscos:
-            if g:
-                try: 
-                    s_gail += float(g.replace('%', '').replace(',', '.').strip())
-                    c_gail += 1
-                except: pass
-            if t:
-                try: 
-                    s_tyrer += float(t.replace('%', '').replace(',', '.').strip())
-                    c_tyrer += 1
-                except: pass
+            )).label('obito'),
+            _contar_se(db, or_(
+                models.Desfecho.recidiva_local == True,
+                models.Desfecho.recidiva_regional == True
+            )).label('recidiva'),
+            _contar_se(db, models.Desfecho.metastase_ocorreu == True).label('metastase'),
+        ).filter(models.filtro_ativo(models.Desfecho)).one()
+
+        total_pacientes = pacientes.total or 0
+        pacientes_com_tratamento = pacientes.com_tratamento or 0
+        pacientes_com_desfecho = desfechos.total or 0
+        pacientes_vivos = desfechos.vivos or 0
+        pacientes_obito = desfechos.obito or 0
+        pacientes_recidiva = desfechos.recidiva or 0
+        pacientes_metastase = desfechos.metastase or 0
+        idade_media = float(pacientes.idade_media) if pacientes.idade_media else 0.0
+        tamanho_medio = float(pacientes.tamanho_medio) if pacientes.tamanho_medio else 0.0
+        media_gail = float(pacientes.media_gail) if pacientes.media_gail is not None else 0.0
+        media_tyrer = float(pacientes.media_tyrer) if pacientes.media_tyrer is not None else 0.0
 
         return {
             "total_pacientes": total_pacientes,
@@ -386,15 +545,50 @@ def get_resumo_geral(db: Session):
             "taxa_metastase": round((pacientes_metastase / pacientes_com_desfecho * 100), 1) if pacientes_com_desfecho > 0 else 0,
             "idade_media_diagnostico": round(idade_media, 0),
             "tamanho_medio_tumor": round(tamanho_medio, 1),
-            "media_risco_gail": round((s_gail / c_gail), 2) if c_gail > 0 else 0.0,
-            "media_risco_tyrer": round((s_tyrer / c_tyrer), 2) if c_tyrer > 0 else 0.0,
+            "media_risco_gail": round(media_gail, 2),
+            "media_risco_tyrer": round(media_tyrer, 2),
         }
     except Exception as e:
         logger.error(f"Erro ao buscar resumo geral: {str(e)}")
         return {}
 
 
+# ✅ 11.1 Quantidades clínicas numéricas (colunas `<campo>_num`)
+@cache_dashboard(ttl=300)
+def get_resumo_numerico(db: Session):
+    """
+    Total preenchido, média, mínimo e máximo de cada campo de CAMPOS_NUMERICOS,
+    em um único scan de PACIENTE sobre as colunas numéricas derivadas.
+    """
+    try:
+        colunas = [
+            (campo, getattr(models.Paciente, coluna_numerica(campo)))
+            for campo in CAMPOS_NUMERICOS
+        ]
+        linha = db.query(*[
+            agregado(coluna)
+            for _, coluna in colunas
+            for agregado in (func.count, func.avg, func.min, func.max)
+        ]).filter(models.filtro_ativo(models.Paciente)).one()
+
+        resultado = []
+        for indice, (campo, _) in enumerate(colunas):
+            total, media, minimo, maximo = linha[indice * 4:indice * 4 + 4]
+            resultado.append({
+                "campo": campo,
+                "total": total or 0,
+                "media": round(float(media), 2) if media is not None else None,
+                "minimo": float(minimo) if minimo is not None else None,
+                "maximo": float(maximo) if maximo is not None else None,
+            })
+        return resultado
+    except Exception as e:
+        logger.error(f"Erro ao buscar resumo numérico: {str(e)}")
+        return []
+
+
 # ✅ 12. Estatísticas Temporais para Gráfico Área
+@cache_dashboard(ttl=300)
 def get_estatisticas_temporais(db: Session):
     import datetime
     try:
@@ -410,12 +604,14 @@ def get_estatisticas_temporais(db: Session):
 
         # 1. Buscar apenas as datas dos novos pacientes (a partir da data_corte)
         pacientes_datas = db.query(models.Desfecho.td_data_primeira_consulta).filter(
-            models.Desfecho.td_data_primeira_consulta >= data_corte
+            models.Desfecho.td_data_primeira_consulta >= data_corte,
+            models.filtro_ativo(models.Desfecho)
         ).all()
 
         # 2. Buscar apenas as datas e IDs de histórico (a partir da data_corte)
         consultas_historico = db.query(models.PacienteHistorico.data_modificacao, models.PacienteHistorico.id_paciente).filter(
-            models.PacienteHistorico.data_modificacao >= data_corte
+            models.PacienteHistorico.data_modificacao >= data_corte,
+            models.filtro_ativo(models.PacienteHistorico)
         ).all()
 
         # Estruturas de agrupamento em memória (dicionários por chave "YYYY-MM")
@@ -468,48 +664,49 @@ def get_estatisticas_temporais(db: Session):
 
     
 # ✅ 13. SUS Metrics (DeltaT, Estadiamento, Molecular) Direto do Banco!
+@cache_dashboard(ttl=120)
 def get_sus_metrics(db: Session):
     try:
-        # 1. Delta T
-        desfechos = db.query(models.Desfecho.td_data_diagnostico, models.Desfecho.td_data_inicio_tratamento).filter(
-            models.Desfecho.td_data_diagnostico.isnot(None),
-            models.Desfecho.td_data_inicio_tratamento.isnot(None)
-        ).all()
-        
-        under30 = under60 = under90 = over90 = validDeltaTFound = 0
-        for diag, trat in desfechos:
-            diff_days = (trat - diag).days
-            if diff_days >= 0:
-                if diff_days <= 30: under30 += 1
-                elif diff_days <= 60: under60 += 1
-                elif diff_days <= 90: under90 += 1
-                else: over90 += 1
-                validDeltaTFound += 1
-
-        # 2. Estadiamento
-        est_0 = db.query(func.count(models.Paciente.id_paciente)).filter(models.Paciente.hd_estadiamento_clinico.ilike('%0%')).scalar() or 0
-        est_1 = db.query(func.count(models.Paciente.id_paciente)).filter(models.Paciente.hd_estadiamento_clinico.ilike('%I%'), ~models.Paciente.hd_estadiamento_clinico.ilike('%II%'), ~models.Paciente.hd_estadiamento_clinico.ilike('%IV%')).scalar() or 0
-        est_2 = db.query(func.count(models.Paciente.id_paciente)).filter(models.Paciente.hd_estadiamento_clinico.ilike('%II%'), ~models.Paciente.hd_estadiamento_clinico.ilike('%III%')).scalar() or 0
-        est_3 = db.query(func.count(models.Paciente.id_paciente)).filter(models.Paciente.hd_estadiamento_clinico.ilike('%III%')).scalar() or 0
-        est_4 = db.query(func.count(models.Paciente.id_paciente)).filter(models.Paciente.hd_estadiamento_clinico.ilike('%IV%')).scalar() or 0
-
-        # 3. Molecular Count (Puxa do primeiro de tratamento)
-        ihq = db.query(models.Imunohistoquimicas.re, models.Imunohistoquimicas.rp, models.Imunohistoquimicas.her2).all()
-        luminal = her2 = tneg = indeterminado = 0
-        for rec in ihq:
-            re_pos = rec.re and ('pos' in rec.re.lower() or rec.re == 'P')
-            rp_pos = rec.rp and ('pos' in rec.rp.lower() or rec.rp == 'P')
-            rhPositivo = re_pos or rp_pos
-            her2Positivo = rec.her2 and ('3+' in rec.her2 or 'pos' in rec.her2.lower())
-            
-            re_neg = rec.re and ('neg' in rec.re.lower() or rec.re == 'N')
-            rp_neg = rec.rp and ('neg' in rec.rp.lower() or rec.rp == 'N')
-            her2Negativo = rec.her2 and ('0' in rec.her2 or '1+' in rec.her2 or 'neg' in rec.her2.lower())
-            
-            if rhPositivo: luminal += 1
-            elif her2Positivo and not rhPositivo: her2 += 1
-            elif re_neg and rp_neg and her2Negativo: tneg += 1
-            else: indeterminado += 1
+        # 1. Delta T (agregado na escrita; fallback ao vivo)
+        delta_t = dict(agregados.ler_dimensao(db, "delta_t") or [])
+        if not delta_t:
+            inicio = models.Desfecho.td_data_diagnostico
+            fim = models.Desfecho.td_data_inicio_tratamento
+            dias = _diferenca_dias(db, inicio, fim)
+            delta_t = {
+                h["faixa"]: h["total"]
+                for h in _histograma_delta_t(
+                    db, dias,
+                    (inicio.isnot(None), fim.isnot(None), dias >= 0, models.filtro_ativo(models.Desfecho)),
+                    agregados.DELTA_T_LIMITES,
+                )
+            }
+        under30, under60, under90, over90 = (delta_t.get(b, 0) for b in agregados.DELTA_T_BUCKETS)
+        validDeltaTFound = under30 + under60 + under90 + over90
+
+        # 2. Estadiamento (código canônico: agregado na escrita; fallback GROUP BY indexado)
+        estadiamento = dict(agregados.ler_dimensao(db, "estadiamento") or [])
+        if not estadiamento:
+            estadiamento = {
+                rotulo_estadiamento(codigo): total
+                for codigo, total in _contagem_por_estadiamento(db) if codigo
+            }
+        est_0, est_1, est_2, est_3, est_4 = (estadiamento.get(rotulo_estadiamento(c), 0) for c in ESTADIOS)
+
+        # 3. Molecular (subtipo resolvido por paciente: agregado na escrita; fallback GROUP BY indexado)
+        molecular = dict(agregados.ler_dimensao(db, "molecular") or [])
+        if not molecular:
+            molecular = {
+                ROTULOS_SUBTIPO.get(subtipo, subtipo): total
+                for subtipo, total in db.query(
+                    models.Paciente.subtipo_molecular,
+                    func.count(models.Paciente.id_paciente)
+                ).filter(
+                    models.Paciente.subtipo_molecular.isnot(None),
+                    models.filtro_ativo(models.Paciente)
+                ).group_by(models.Paciente.subtipo_molecular).all()
+            }
+        luminal, her2, tneg, indeterminado = (molecular.get(b, 0) for b in agregados.MOLECULAR_BUCKETS)
 
         return {
             "deltaT": [
@@ -535,4 +732,54 @@ def get_sus_metrics(db: Session):
         }
     except Exception as e:
         logger.error(f"Erro ao buscar SUS metrics: {str(e)}")
-        return {}
\ No newline at end of file
+        return {}
+
+
+# ✅ 14. Bundle do Dashboard (várias métricas em uma única requisição)
+DASHBOARD_METRICAS = {
+    "resumo": get_resumo_geral,
+    "numericos": get_resumo_numerico,
+    "estatisticas_temporais": get_estatisticas_temporais,
+    "sus_metrics": get_sus_metrics,
+    "estadiamento": get_estadiamento,
+    "sobrevida": get_sobrevida_global,
+    "recidiva": get_taxa_recidiva,
+    "delta_t": get_media_delta_t,
+    "delta_t_analitico": get_delta_t_analitico,
+    "genero": get_distribuicao_genero,
+    "faixa_etaria": get_distribuicao_faixa_etaria,
+    "tipo_cirurgia": get_distribuicao_tipo_cirurgia,
+    "marcadores": get_distribuicao_marcadores,
+    "historia_familiar": get_distribuicao_historia_familiar,
+    "habitos_vida": get_distribuicao_habitos_vida,
+}
+
+
+def get_dashboard_bundle(db: Session, metricas=None):
+    """
+    Executa várias métricas do dashboard na mesma sessão e devolve um único documento.
+    As métricas rodam em sequência: a Session não é thread-safe e, no Lambda, cada
+    instância atende uma requisição por vez, então o ganho vem de evitar N invocações,
+    N validações de JWT e N conexões. No PostgreSQL cada métrica roda em um SAVEPOINT
+    para que a falha de uma não aborte a transação das seguintes.
+    """
+    nomes = list(metricas) if metricas else list(DASHBOARD_METRICAS.keys())
+    desconhecidas = [nome for nome in nomes if nome not in DASHBOARD_METRICAS]
+    if desconhecidas:
+        raise ValueError(f"Métricas desconhecidas: {', '.join(desconhecidas)}")
+
+    isolar = db.get_bind().dialect.name == "postgresql"
+    resultado = {}
+    for nome in dict.fromkeys(nomes):
+        funcao = DASHBOARD_METRICAS[nome]
+        if isolar:
+            savepoint = db.begin_nested()
+            try:
+                resultado[nome] = funcao(db)
+            finally:
+                # Métricas são somente leitura: desfazer o savepoint também limpa
+                # uma transação abortada por erro engolido dentro da função.
+                savepoint.rollback()
+        else:
+            resultado[nome] = funcao(db)
+    return resultado
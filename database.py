@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -55,6 +55,13 @@ if DATABASE_URL.startswith("sqlite"):
         DATABASE_URL,
         connect_args={"check_same_thread": False}
     )
+
+    # O SQLite só aplica ON DELETE CASCADE com as chaves estrangeiras ligadas
+    @event.listens_for(engine, "connect")
+    def _ativar_foreign_keys(conexao, _registro):
+        cursor = conexao.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 else:
     # Configuração para PostgreSQL (produção)
     # A ÚNICA MUDANÇA É AQUI: search_path=clinical
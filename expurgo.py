@@ -0,0 +1,124 @@
+"""
+Expurgo dos pacientes removidos (soft delete: paciente.deleted_at preenchido).
+
+As rotas de remoção só marcam `deleted_at` (o paciente sai das leituras e dos
+agregados na hora). Este job apaga os grafos fora do caminho da requisição: lotes
+pequenos por keyset em (deleted_at, id_paciente), um DELETE por lote (o resto do
+grafo sai pelo ON DELETE CASCADE), commit e pausa entre lotes para não competir com
+o tráfego. Os agregados não mudam aqui: já foram ajustados na remoção.
+
+Também apaga as chaves de idempotência expiradas (IDEMPOTENCIA_REQUISICOES): a escrita
+só remove as do próprio usuário, então as de quem não volta a usar a API ficariam lá.
+
+Uso:
+    python expurgo.py [--carencia-dias 30] [--lote 100] [--pausa 0.5]
+No Lambda roda agendado (função `expurgo` no serverless.yml, ver `handler`).
+"""
+import argparse
+import datetime
+import logging
+import os
+import time
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+import models
+
+logger = logging.getLogger(__name__)
+
+# Tempo mínimo entre a remoção e o expurgo (janela para auditoria/restauração)
+CARENCIA_DIAS = int(os.getenv("EXPURGO_CARENCIA_DIAS", "30"))
+LOTE = int(os.getenv("EXPURGO_LOTE", "100"))
+PAUSA = float(os.getenv("EXPURGO_PAUSA", "0.5"))
+
+
+def expurgar(db: Session, carencia_dias: int = CARENCIA_DIAS, lote: int = LOTE, pausa: float = PAUSA,
+             continuar=lambda: True) -> int:
+    """
+    Apaga, em lotes, os pacientes removidos há mais de `carencia_dias`. `continuar()` é
+    consultado antes de cada lote (p.ex. tempo restante do Lambda). Retorna o total apagado.
+    """
+    corte = datetime.datetime.utcnow() - datetime.timedelta(days=carencia_dias)
+    paciente = models.Paciente
+    total = 0
+    while continuar():
+        ids = db.scalars(
+            select(paciente.id_paciente)
+            .where(paciente.deleted_at.isnot(None), paciente.deleted_at <= corte)
+            .order_by(paciente.deleted_at, paciente.id_paciente)
+            .limit(lote)
+        ).all()
+        if not ids:
+            break
+        db.execute(
+            delete(paciente).where(paciente.id_paciente.in_(ids), paciente.deleted_at.isnot(None)),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+        total += len(ids)
+        logger.info(f"Expurgo: {total} pacientes apagados (último lote até id_paciente={ids[-1]})")
+        if len(ids) < lote:
+            break
+        time.sleep(pausa)
+    return total
+
+
+def expurgar_idempotencia(db: Session, lote: int = LOTE, pausa: float = PAUSA, continuar=lambda: True) -> int:
+    """
+    Apaga, em lotes, as chaves de idempotência expiradas (criadas há mais de
+    crud.IDEMPOTENCIA_TTL: `expira_em` já passou). Retorna o total apagado.
+    """
+    agora = datetime.datetime.utcnow()
+    registro = models.IdempotenciaRequisicao
+    total = 0
+    while continuar():
+        chaves = db.execute(
+            select(registro.usuario, registro.chave).where(registro.expira_em <= agora).limit(lote)
+        ).all()
+        if not chaves:
+            break
+        db.execute(
+            delete(registro).where(
+                tuple_(registro.usuario, registro.chave).in_(chaves), registro.expira_em <= agora
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+        total += len(chaves)
+        logger.info(f"Expurgo: {total} chaves de idempotência expiradas apagadas")
+        if len(chaves) < lote:
+            break
+        time.sleep(pausa)
+    return total
+
+
+def handler(event, context):
+    """Entrada do Lambda agendado: para com folga antes do timeout da função."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        continuar = lambda: context.get_remaining_time_in_millis() > 10000
+        total = expurgar(db, continuar=continuar)
+        chaves = expurgar_idempotencia(db, continuar=continuar)
+    finally:
+        db.close()
+    return {"expurgados": total, "idempotencia_expiradas": chaves}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Expurgo dos pacientes removidos (soft delete) e das chaves de idempotência expiradas")
+    parser.add_argument("--carencia-dias", type=int, default=CARENCIA_DIAS)
+    parser.add_argument("--lote", type=int, default=LOTE)
+    parser.add_argument("--pausa", type=float, default=PAUSA)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = expurgar(db, args.carencia_dias, args.lote, args.pausa)
+        chaves = expurgar_idempotencia(db, args.lote, args.pausa)
+        print(f"✅ Expurgo concluído: {total} pacientes e {chaves} chaves de idempotência expiradas apagados")
+    finally:
+        db.close()
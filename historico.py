@@ -0,0 +1,166 @@
+"""
+Histórico de versões do paciente (tabela PACIENTE_HISTORICO).
+
+Cada escrita grava uma linha com a versão resultante e, em `alteracoes`, só o que mudou
+no grafo (paciente, familiares, tratamento, desfecho e coleções) como um merge patch JSON:
+objetos são mesclados recursivamente, listas são substituídas inteiras e null é um valor
+(os snapshots têm sempre as mesmas chaves, então nada é "removido").
+
+A cada CHECKPOINT_A_CADA versões a linha também guarda o grafo completo em `snapshot`;
+qualquer versão é reconstruída a partir do checkpoint anterior aplicando no máximo
+CHECKPOINT_A_CADA diffs. O primeiro checkpoint de um paciente é o estado anterior à sua
+primeira alteração registrada (pacientes criados antes deste formato também), datado
+dessa alteração: `as_of` anterior a ela não tem reconstrução.
+"""
+import copy
+import json
+from pydantic.json import pydantic_encoder
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+import models
+import schemas
+
+CHECKPOINT = "checkpoint"
+DIFF = "diff"
+
+# Diffs no máximo entre dois checkpoints (limita o custo de reconstruir uma versão)
+CHECKPOINT_A_CADA = 20
+
+# Schemas de leitura usados para serializar cada relacionamento
+SCHEMAS_GRAFO = {
+    "familiares": schemas.Familiar,
+    "tratamento": schemas.Tratamento,
+    "desfecho": schemas.Desfecho,
+}
+
+
+def snapshot(db_paciente, campos, incluir):
+    """Estado JSON do paciente: os `campos` escalares e os relacionamentos em `incluir`"""
+    dados = {campo: getattr(db_paciente, campo) for campo in campos}
+    for nome in incluir:
+        valor = getattr(db_paciente, nome)
+        schema = SCHEMAS_GRAFO[nome]
+        if isinstance(valor, list):
+            dados[nome] = [schema.from_orm(item) for item in valor]
+        else:
+            dados[nome] = schema.from_orm(valor) if valor is not None else None
+    # Mesma conversão da resposta da API (datas em ISO, Decimal em número)
+    return json.loads(json.dumps(dados, default=pydantic_encoder))
+
+
+def diferenca(antes, depois):
+    """Merge patch que leva `antes` a `depois` ({} se iguais); só as chaves de `depois`"""
+    patch = {}
+    for chave, valor in depois.items():
+        anterior = antes.get(chave)
+        if isinstance(anterior, dict) and isinstance(valor, dict):
+            interno = diferenca(anterior, valor)
+            if interno:
+                patch[chave] = interno
+        elif chave not in antes or anterior != valor:
+            patch[chave] = valor
+    return patch
+
+
+def aplicar(base, patch):
+    """Aplica um patch de `diferenca` sobre `base` (sem alterar `base`)"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    resultado = dict(base) if isinstance(base, dict) else {}
+    for chave, valor in patch.items():
+        resultado[chave] = aplicar(resultado.get(chave), valor)
+    return resultado
+
+
+def ultimo_checkpoint(db: Session, paciente_id: int):
+    """Versão do checkpoint mais recente do paciente, ou None se ainda não há nenhum"""
+    h = models.PacienteHistorico
+    return (
+        db.query(h.versao)
+        .filter(h.id_paciente == paciente_id, h.tipo == CHECKPOINT)
+        .order_by(h.versao.desc())
+        .limit(1)
+        .scalar()
+    )
+
+
+def checkpoint_devido(versao_checkpoint, versao: int) -> bool:
+    """A versão `versao` deve ser gravada como checkpoint completo?"""
+    return versao_checkpoint is None or versao - versao_checkpoint >= CHECKPOINT_A_CADA
+
+
+def registrar(db: Session, paciente_id: int, versao: int, antes: dict, depois: dict, versao_checkpoint):
+    """
+    Grava a versão `versao` (sem commit). `antes` e `depois` cobrem as mesmas partes do
+    grafo; quando checkpoint_devido(...), `depois` é o grafo completo e, se o paciente
+    ainda não tem checkpoint, `antes` também (vira o checkpoint da versão anterior).
+    """
+    if versao_checkpoint is None:
+        db.add(models.PacienteHistorico(
+            id_paciente=paciente_id, versao=versao - 1, tipo=CHECKPOINT, snapshot=antes,
+        ))
+    completo = checkpoint_devido(versao_checkpoint, versao)
+    db.add(models.PacienteHistorico(
+        id_paciente=paciente_id,
+        versao=versao,
+        tipo=CHECKPOINT if completo else DIFF,
+        alteracoes=diferenca(antes, {chave: valor for chave, valor in depois.items() if chave in antes}),
+        snapshot=depois if completo else None,
+    ))
+    db.flush()
+
+
+def listar(db: Session, paciente_id: int, limit: int = 50, skip: int = 0, apos=None):
+    """
+    Linhas do histórico, da mais recente para a mais antiga: só as colunas da listagem
+    (sem hidratar modelos nem ler os snapshots). `apos` = (data_modificacao, id) da última
+    linha da página anterior: keyset servido por ix_paciente_historico_paciente_data.
+    """
+    h = models.PacienteHistorico
+    query = db.query(
+        h.id, h.id_paciente, h.data_modificacao, h.versao, h.tipo, h.alteracoes, h.dados_anteriores
+    ).filter(h.id_paciente == paciente_id).order_by(h.data_modificacao.desc(), h.id.desc())
+    if apos is not None:
+        query = query.filter(tuple_(h.data_modificacao, h.id) < tuple_(*apos))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+
+def reconstruir(db: Session, paciente_id: int, as_of):
+    """
+    Estado do paciente em `as_of`: (versão, data_modificacao, grafo), ou None se `as_of`
+    é anterior ao primeiro registro do histórico. Lê um checkpoint e até
+    CHECKPOINT_A_CADA diffs.
+    """
+    h = models.PacienteHistorico
+    alvo = (
+        db.query(h.versao, h.data_modificacao)
+        .filter(h.id_paciente == paciente_id, h.versao.isnot(None), h.data_modificacao <= as_of)
+        .order_by(h.versao.desc())
+        .first()
+    )
+    if alvo is None:
+        return None
+    checkpoint = (
+        db.query(h.versao, h.snapshot)
+        .filter(h.id_paciente == paciente_id, h.tipo == CHECKPOINT, h.versao <= alvo.versao)
+        .order_by(h.versao.desc())
+        .first()
+    )
+    if checkpoint is None:
+        return None
+    estado = checkpoint.snapshot
+    diffs = (
+        db.query(h.alteracoes)
+        .filter(
+            h.id_paciente == paciente_id,
+            h.versao > checkpoint.versao,
+            h.versao <= alvo.versao,
+        )
+        .order_by(h.versao)
+        .all()
+    )
+    for linha in diffs:
+        estado = aplicar(estado, linha.alteracoes or {})
+    return alvo.versao, alvo.data_modificacao, estado
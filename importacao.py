@@ -0,0 +1,151 @@
+"""
+Validação paralela da importação em lote (crud.importar_pacientes).
+
+A validação Pydantic dos registros é CPU-bound: os registros são divididos em blocos
+validados num pool de processos, enquanto um único escritor (a sessão do chamador)
+grava os lotes já validados. No máximo `processos * 2` blocos ficam em voo (o leitor
+para de consumir a entrada quando o escritor atrasa) e os resultados saem na ordem
+da entrada, então os índices dos erros batem com os registros enviados. Os blocos
+voltam como dicts simples: desserializar dicts no escritor custa uma
+fração de desserializar os modelos Pydantic.
+
+No Lambda não há /dev/shm (o multiprocessing não cria semáforos): lá, ou quando o
+pool não pode ser criado, a validação roda no próprio processo.
+
+Importação pela linha de comando (NDJSON ou array JSON):
+    python importacao.py pacientes.ndjson [--lote 500] [--processos 4]
+"""
+import argparse
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pydantic import BaseModel
+import schemas
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 500
+
+
+def processos_padrao() -> int:
+    """IMPORTACAO_PROCESSOS, ou 1 no Lambda, ou o número de CPUs"""
+    configurado = os.getenv("IMPORTACAO_PROCESSOS")
+    if configurado:
+        return max(1, int(configurado))
+    if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        return 1
+    return os.cpu_count() or 1
+
+
+def _como_dict(valor):
+    """Equivalente a BaseModel.dict() sem as cópias e filtros do Pydantic (bem mais rápido)"""
+    if isinstance(valor, BaseModel):
+        return {campo: _como_dict(v) for campo, v in valor.__dict__.items()}
+    if isinstance(valor, list):
+        return [_como_dict(v) for v in valor]
+    return valor
+
+
+def _validar_bloco(inicio: int, registros):
+    """[(índice, dados validados | None, erro | None)] de um bloco"""
+    resultado = []
+    for indice, registro in enumerate(registros, start=inicio):
+        if isinstance(registro, Exception):
+            resultado.append((indice, None, str(registro)))
+            continue
+        try:
+            resultado.append((indice, _como_dict(schemas.PacienteCreate.parse_obj(registro)), None))
+        except Exception as e:
+            resultado.append((indice, None, e.errors() if hasattr(e, "errors") else str(e)))
+    return resultado
+
+
+def _blocos(registros, tamanho: int):
+    iterador = iter(registros)
+    inicio = 0
+    while True:
+        bloco = list(islice(iterador, tamanho))
+        if not bloco:
+            return
+        yield inicio, bloco
+        inicio += len(bloco)
+
+
+def _criar_pool(processos: int):
+    try:
+        return ProcessPoolExecutor(max_workers=processos)
+    except (OSError, NotImplementedError, ImportError) as e:
+        logger.warning(f"Pool de processos indisponível, validando no processo atual: {str(e)}")
+        return None
+
+
+def validar_registros(registros, tamanho: int = TAMANHO_BLOCO, processos: int = None):
+    """
+    Gera (índice, dados, erro) para cada registro, na ordem de `registros`; `dados` é o
+    dict de schemas.PacienteCreate já validado e convertido (datas, enums, defaults).
+    Uma Exception no lugar de um registro (p.ex. linha NDJSON ilegível) vira erro.
+    """
+    processos = processos_padrao() if processos is None else processos
+    # Entrada pequena já em memória: o custo de subir o pool não compensa
+    if isinstance(registros, list) and len(registros) <= tamanho * 2:
+        processos = 1
+    pool = _criar_pool(processos) if processos > 1 else None
+    if pool is None:
+        for inicio, bloco in _blocos(registros, tamanho):
+            yield from _validar_bloco(inicio, bloco)
+        return
+
+    with pool:
+        em_voo = deque()
+        for inicio, bloco in _blocos(registros, tamanho):
+            em_voo.append(pool.submit(_validar_bloco, inicio, bloco))
+            # Contrapressão: espera o bloco mais antigo antes de ler mais entrada
+            if len(em_voo) >= processos * 2:
+                yield from em_voo.popleft().result()
+        while em_voo:
+            yield from em_voo.popleft().result()
+
+
+def ler_arquivo(caminho: str):
+    """Registros de um arquivo NDJSON (lido linha a linha) ou array JSON"""
+    with open(caminho, encoding="utf-8") as arquivo:
+        primeiro = arquivo.read(1)
+        while primeiro and primeiro.isspace():
+            primeiro = arquivo.read(1)
+        if primeiro == "[":
+            arquivo.seek(0)
+            yield from json.load(arquivo)
+            return
+        arquivo.seek(0)
+        for linha in arquivo:
+            if not linha.strip():
+                continue
+            try:
+                yield json.loads(linha)
+            except ValueError as e:
+                yield ValueError(f"JSON inválido: {str(e)}")
+
+
+if __name__ == "__main__":
+    import crud
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Importação em lote de pacientes")
+    parser.add_argument("arquivo", help="NDJSON (um paciente por linha) ou array JSON")
+    parser.add_argument("--lote", type=int, default=crud.LOTE_IMPORTACAO)
+    parser.add_argument("--processos", type=int, default=None)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        resultado = crud.importar_pacientes(db, ler_arquivo(args.arquivo), args.lote, args.processos)
+    finally:
+        db.close()
+    for erro in resultado["erros"]:
+        print(json.dumps(erro, ensure_ascii=False, default=str))
+    print(f"✅ Importação concluída: {resultado['criados']} de {resultado['total']} pacientes criados, "
+          f"{len(resultado['erros'])} com erro")
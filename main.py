@@ -1,14 +1,16 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, status, Body
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, Body, Header
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import crud, models, schemas
+import crud, models, schemas, cache, historico
 from database import SessionLocal, engine
 import os
 from mangum import Mangum
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Union
 import exportar 
 import logging
 from auth import verify_token, get_current_user
@@ -17,7 +19,8 @@ from dashboard import (
     # **IMPORTANTE: Adicionar as outras funções de dashboard que faltaram na sua lista de imports**
     get_distribuicao_genero, get_distribuicao_faixa_etaria, get_distribuicao_tipo_cirurgia, 
     get_distribuicao_marcadores, get_distribuicao_historia_familiar, 
-    get_distribuicao_habitos_vida, get_resumo_geral, get_estatisticas_temporais, get_sus_metrics
+    get_distribuicao_habitos_vida, get_resumo_geral, get_estatisticas_temporais, get_sus_metrics,
+    get_dashboard_bundle, get_delta_t_analitico, get_resumo_numerico
 )
 from s3_service import s3_service
 from fastapi import File, UploadFile, Form
@@ -26,9 +29,12 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import uuid
 import base64
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, validator
 import threading
+import hashlib
+import json
+import time
 from collections import defaultdict
 
 # Configurar logging
@@ -79,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Handler para AWS Lambda (Mantido)
@@ -99,6 +106,34 @@ def get_db():
     finally:
         db.close()
 
+
+# ETags (If-None-Match → 304 sem executar as consultas pesadas)
+# Com o cache em memória a versão dos dados é por instância; a janela de tempo
+# limita por quanto tempo uma instância pode responder 304 sem ver escritas de outra.
+DASHBOARD_ETAG_JANELA = 60
+
+def gerar_etag(*partes) -> str:
+    return '"' + hashlib.sha1(":".join(str(p) for p in partes).encode()).hexdigest()[:24] + '"'
+
+def etag_corresponde(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [t.strip().replace("W/", "", 1) for t in header.split(",")]
+
+def etag_dashboard(request: Request, response: Response):
+    """Dependência das rotas /dashboard/*: responde 304 antes de rodar as consultas."""
+    etag = gerar_etag(
+        "dashboard", request.url.path, request.url.query,
+        cache.versao_dados(), int(time.time() // DASHBOARD_ETAG_JANELA)
+    )
+    if etag_corresponde(request, etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
 # Middleware para log de requisições (Mantido)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -147,8 +182,8 @@ async def options_handler(path: str, request: Request):
         content={},
         headers={
             "Access-Control-Allow-Origin": allow_origin,
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, X-CSRF-Token",
+            "Access-Control-Allow-Methods": "GET, POST, PUT, PATCH, DELETE, OPTIONS",
+            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, X-CSRF-Token, Idempotency-Key",
             "Access-Control-Allow-Credentials": "true",
             "Access-Control-Max-Age": "1800"
         }
@@ -338,64 +373,334 @@ def create_session(ip_address: str) -> str:
 
 
 # Rotas protegidas para Paciente
+def _hash_corpo(paciente: schemas.PacienteCreate) -> str:
+    corpo = json.dumps(jsonable_encoder(paciente), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(corpo.encode()).hexdigest()
+
 async def _create_paciente_handler(
     paciente: schemas.PacienteCreate,
     db: Session,
-    current_user: Dict[str, Any]
+    current_user: Dict[str, Any],
+    idempotency_key: Optional[str] = None
 ):
-    return crud.create_paciente(db=db, paciente=paciente)
+    if not idempotency_key:
+        return crud.create_paciente(db=db, paciente=paciente)
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key muito longa (máximo 255)")
+
+    # Repetição com a mesma chave devolve a resposta original sem criar outro paciente
+    usuario = current_user.get("sub") or current_user.get("username") or ""
+    hash_corpo = _hash_corpo(paciente)
+    existente = crud.reservar_idempotencia(db, usuario, idempotency_key, hash_corpo)
+    if existente is not None:
+        if existente.hash_corpo != hash_corpo:
+            raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outro corpo")
+        if existente.status_code is None:
+            raise HTTPException(status_code=409, detail="Requisição com esta Idempotency-Key em andamento")
+        return JSONResponse(
+            status_code=existente.status_code,
+            content=existente.resposta,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        db_paciente = crud.create_paciente(db=db, paciente=paciente)
+    except Exception:
+        db.rollback()
+        crud.liberar_idempotencia(db, usuario, idempotency_key)
+        raise
+    resposta = jsonable_encoder(schemas.Paciente.from_orm(db_paciente))
+    crud.concluir_idempotencia(db, usuario, idempotency_key, 200, resposta)
+    return JSONResponse(status_code=200, content=resposta)
 
 @app.post("/pacientes/", response_model=schemas.Paciente)
 async def create_paciente_slash(
     paciente: schemas.PacienteCreate = Body(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
-    return await _create_paciente_handler(paciente, db, current_user)
+    return await _create_paciente_handler(paciente, db, current_user, idempotency_key)
 
 @app.post("/pacientes", response_model=schemas.Paciente)
 async def create_paciente(
     paciente: schemas.PacienteCreate = Body(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
-    return await _create_paciente_handler(paciente, db, current_user)
+    return await _create_paciente_handler(paciente, db, current_user, idempotency_key)
+
+# Importação em lote: array JSON ou NDJSON (Content-Type: application/x-ndjson)
+TIPOS_NDJSON = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
-@app.get("/pacientes/", response_model=List[schemas.Paciente])
+def _linhas_ndjson(corpo: bytes):
+    """Um registro por linha não vazia; linhas ilegíveis viram erro daquele índice"""
+    for linha in (l for l in corpo.splitlines() if l.strip()):
+        try:
+            yield json.loads(linha)
+        except ValueError as e:
+            yield ValueError(f"JSON inválido: {str(e)}")
+
+@app.post("/pacientes/bulk")
+@limiter.limit("5/minute")
+async def importar_pacientes(
+    request: Request,
+    lote: int = 500,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    if not 1 <= lote <= 1000:
+        raise HTTPException(status_code=400, detail="lote deve estar entre 1 e 1000")
+    corpo = await request.body()
+    tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if tipo in TIPOS_NDJSON:
+        registros = _linhas_ndjson(corpo)
+    else:
+        try:
+            registros = json.loads(corpo)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Corpo deve ser um array JSON ou NDJSON")
+        if not isinstance(registros, list):
+            raise HTTPException(status_code=400, detail="Corpo deve ser um array JSON ou NDJSON")
+    try:
+        # Importação síncrona (ORM) fora do event loop
+        return await run_in_threadpool(crud.importar_pacientes, db, registros, lote)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erro na importação em lote: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+VIEWS_PACIENTE = ("full", "summary")
+
+def _linhas_resumo(linhas):
+    """Linhas da projeção → JSON sem passar pela validação do schema completo"""
+    return [dict(linha._mapping) for linha in linhas]
+
+SCHEMAS_RELACIONAMENTO = {
+    "familiares": schemas.Familiar,
+    "tratamento": schemas.Tratamento,
+    "desfecho": schemas.Desfecho,
+}
+
+def _lista_param(valor: Optional[str]):
+    return [v.strip() for v in valor.split(",") if v.strip()] if valor else []
+
+def _campos_parciais(fields: Optional[str], include: Optional[str]):
+    """(campos, incluir) validados, ou None se a leitura não é parcial; 400 se inválidos"""
+    if fields is None and include is None:
+        return None
+    try:
+        return crud.validar_campos_parciais(_lista_param(fields), _lista_param(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _serializar_parcial(db_paciente, campos, incluir):
+    """Somente as chaves pedidas (os relacionamentos usam os schemas de leitura)"""
+    dados = {campo: getattr(db_paciente, campo) for campo in campos}
+    for nome in incluir:
+        valor = getattr(db_paciente, nome)
+        schema = SCHEMAS_RELACIONAMENTO[nome]
+        if isinstance(valor, list):
+            dados[nome] = [schema.from_orm(item).dict() for item in valor]
+        else:
+            dados[nome] = schema.from_orm(valor).dict() if valor is not None else None
+    return dados
+
+@app.get(
+    "/pacientes/",
+    response_model=Union[List[schemas.Paciente], List[schemas.PacienteResumo], schemas.PacientePagina]
+)
 def read_pacientes(
     skip: int = 0, 
     limit: int = 100, 
+    subtipo_molecular: Optional[str] = None,
+    cursor: Optional[str] = None,
+    ordenar_por: str = "id_paciente",
+    view: str = "full",
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """
     Lista todos os pacientes da tabela PACIENTE com paginação.
     Consulta a tabela principal conforme a modelagem de dados.
+
+    - Sem `cursor`: lista paginada por skip/limit (ordem por id_paciente), como antes.
+    - Com `cursor` (vazio na primeira página): retorna {"items", "next_cursor"} paginando
+      por keyset em `ordenar_por` (id_paciente ou nome_completo); repassar `next_cursor`
+      para a próxima página até ele vir nulo.
+    - `view=summary`: cada item traz só id, nome, nascimento, cidade, estadiamento e
+      status vital (schemas.PacienteResumo), lidos com um SELECT de colunas.
+    - `fields=a,b,c` e/ou `include=tratamento,desfecho,familiares`: cada item traz só
+      essas chaves (id_paciente sempre); tem precedência sobre `view`.
     """
     if limit > 100:
         limit = 100
+    if view not in VIEWS_PACIENTE:
+        raise HTTPException(status_code=400, detail=f"view deve ser um de: {', '.join(VIEWS_PACIENTE)}")
+    resumo = view == "summary"
+    parcial = _campos_parciais(fields, include)
+    campos, incluir = parcial or (None, ())
+
+    if cursor is not None:
+        try:
+            pacientes, next_cursor = crud.get_pacientes_cursor(
+                db, cursor=cursor, limit=limit, ordenar_por=ordenar_por,
+                subtipo_molecular=subtipo_molecular, resumo=resumo,
+                campos=campos, incluir=incluir
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if parcial:
+            return JSONResponse(content=jsonable_encoder({
+                "items": [_serializar_parcial(p, campos, incluir) for p in pacientes],
+                "next_cursor": next_cursor,
+            }))
+        if resumo:
+            return JSONResponse(content=jsonable_encoder(
+                {"items": _linhas_resumo(pacientes), "next_cursor": next_cursor}
+            ))
+        return {"items": pacientes, "next_cursor": next_cursor}
     
     # Consulta direta na tabela PACIENTE conforme modelagem
-    pacientes = crud.get_pacientes(db, skip=skip, limit=limit)
+    pacientes = crud.get_pacientes(
+        db, skip=skip, limit=limit, subtipo_molecular=subtipo_molecular, resumo=resumo,
+        campos=campos, incluir=incluir
+    )
     
     # Log para debug (remover em produção)
     print(f"Consulta realizada: {len(pacientes)} pacientes encontrados")
     
+    if parcial:
+        return JSONResponse(content=jsonable_encoder(
+            [_serializar_parcial(p, campos, incluir) for p in pacientes]
+        ))
+    if resumo:
+        return JSONResponse(content=jsonable_encoder(_linhas_resumo(pacientes)))
     return pacientes
 
 
 
+# Antes de /pacientes/{paciente_id}: "stream" não é um id
+@app.get("/pacientes/stream")
+@limiter.limit("60/minute")
+def stream_pacientes(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    Exporta os pacientes como NDJSON (um schemas.Paciente completo por linha), em ordem
+    de id. A primeira linha sai assim que o primeiro lote é lido; a memória não cresce
+    com o total. A sessão do streaming é do gerador: dura o corpo inteiro.
+
+    Com `limit` (obrigatório no Lambda, onde o Mangum bufferiza a resposta e o limite é
+    6 MB: no máximo crud.LIMITE_STREAM_LAMBDA) a exportação é paginada: o cabeçalho
+    X-Next-Cursor traz o `cursor` da próxima página e falta na última.
+    """
+    if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        limit = min(limit or crud.LIMITE_STREAM_LAMBDA, crud.LIMITE_STREAM_LAMBDA)
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit deve ser >= 1")
+    apos_id = 0
+    if cursor:
+        try:
+            _, apos_id = crud.decodificar_cursor(cursor, "stream")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    ate_id = crud.fim_pagina_pacientes(db, apos_id, limit) if limit else None
+    headers = {}
+    if ate_id is not None:
+        headers["X-Next-Cursor"] = crud.codificar_cursor("stream", None, ate_id)
+
+    def linhas():
+        sessao = SessionLocal()
+        try:
+            for paciente in crud.iterar_pacientes_completos(sessao, apos_id=apos_id, ate_id=ate_id):
+                yield schemas.Paciente.from_orm(paciente).json() + "\n"
+        except Exception as e:
+            # Os cabeçalhos (200) já foram enviados: só resta interromper o corpo
+            logger.error(f"Erro no streaming de pacientes: {type(e).__name__}: {str(e)}")
+            raise
+        finally:
+            sessao.close()
+
+    return StreamingResponse(linhas(), media_type="application/x-ndjson", headers=headers)
+
 @app.get("/pacientes/{paciente_id}", response_model=schemas.Paciente)
 def read_paciente(
     paciente_id: int, 
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
+    """
+    Paciente completo, ou só as chaves pedidas com `fields=a,b,c` e
+    `include=tratamento,desfecho,familiares` (carrega só essas colunas/relacionamentos).
+    """
+    parcial = _campos_parciais(fields, include)
+
+    # A versão da linha é lida antes do grafo completo: 304 custa um SELECT indexado
+    versao = crud.get_versao_paciente(db, paciente_id)
+    if versao is None:
+        raise HTTPException(status_code=404, detail="Recurso não encontrado")
+    if parcial:
+        campos, incluir = parcial
+        etag = gerar_etag("paciente", paciente_id, versao, ",".join(campos), ",".join(incluir))
+    else:
+        etag = gerar_etag("paciente", paciente_id, versao)
+    if etag_corresponde(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    if parcial:
+        db_paciente = crud.get_paciente_parcial(db, paciente_id, campos, incluir)
+        if db_paciente is None:
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return JSONResponse(
+            content=jsonable_encoder(_serializar_parcial(db_paciente, campos, incluir)),
+            headers={"ETag": etag}
+        )
+
     db_paciente = crud.get_paciente(db, paciente_id=paciente_id)
     if db_paciente is None:
         raise HTTPException(status_code=404, detail="Recurso não encontrado")
+    response.headers["ETag"] = etag
     return db_paciente
 
+@app.patch("/pacientes/{paciente_id}", response_model=schemas.Paciente)
+def patch_paciente(
+    paciente_id: int,
+    paciente: schemas.PacientePatch,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """Atualização parcial (JSON Merge Patch): grava apenas o que veio no corpo."""
+    try:
+        db_paciente = crud.patch_paciente(db, paciente_id=paciente_id, patch=paciente)
+        if db_paciente is None:
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return db_paciente
+    except HTTPException:
+        raise
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erro ao atualizar parcialmente paciente {paciente_id}: {type(e).__name__}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro interno ao atualizar paciente: {type(e).__name__}: {str(e)}"
+        )
+
 @app.put("/pacientes/{paciente_id}", response_model=schemas.Paciente)
 def update_paciente(
     paciente_id: int, 
@@ -424,32 +729,190 @@ def delete_paciente(
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
-    deleted = crud.delete_paciente(db, paciente_id=paciente_id)
-    if deleted is None:
+    if not crud.delete_paciente(db, paciente_id=paciente_id):
         raise HTTPException(status_code=404, detail="Recurso não encontrado")
     return {"success": True}
 
-# Rota para histórico (protegida) (Mantido)
+@app.post("/pacientes/bulk-delete")
+def delete_pacientes(
+    corpo: schemas.PacienteIds,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    removidos = crud.delete_pacientes(db, corpo.ids)
+    return {
+        "removidos": removidos,
+        "nao_encontrados": sorted(set(corpo.ids) - set(removidos)),
+    }
+
+@app.post("/pacientes/batch-get", response_model=schemas.PacientesPorId)
+def read_pacientes_por_id(
+    corpo: schemas.PacienteIdsLeitura,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    Vários pacientes completos por id, indexados pelo id (na ordem pedida). O custo não
+    cresce com a quantidade: um SELECT de pacientes e um SELECT ... IN por tabela filha.
+    """
+    pacientes = crud.get_pacientes_completos(db, corpo.ids)
+    encontrados = {p.id_paciente for p in pacientes}
+    return {
+        "pacientes": {p.id_paciente: p for p in pacientes},
+        "nao_encontrados": [i for i in dict.fromkeys(corpo.ids) if i not in encontrados],
+    }
+
+# Rota para histórico (protegida)
+def _linhas_historico(linhas):
+    return [
+        {
+            "id": h.id,
+            "paciente_id": h.id_paciente,
+            "data_modificacao": h.data_modificacao,
+            "versao": h.versao,
+            "tipo": h.tipo,
+            "alteracoes": h.alteracoes,
+            "dados_anteriores": h.dados_anteriores,
+        }
+        for h in linhas
+    ]
+
 @app.get("/pacientes/{paciente_id}/historico")
 def read_paciente_historico(
     paciente_id: int, 
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    as_of: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
-    historico = db.query(models.PacienteHistorico).filter(
-        models.PacienteHistorico.paciente_id == paciente_id
-    ).order_by(models.PacienteHistorico.data_modificacao.desc()).all()
-    
-    resultado = []
-    for h in historico:
-        resultado.append({
-            "id": h.id,
-            "paciente_id": h.paciente_id,
-            "data_modificacao": h.data_modificacao,
-            "dados_anteriores": h.dados_anteriores
-        })
-    
-    return resultado
+    """
+    Versões do paciente (mais recente primeiro), cada uma com o merge patch aplicado em
+    `alteracoes`; com `as_of`, o grafo completo como estava naquele instante (UTC).
+    - Sem `cursor`: lista paginada por skip/limit, como antes.
+    - Com `cursor` (vazio na primeira página): retorna {"items", "next_cursor"} paginando
+      por keyset em (data_modificacao, id); repassar `next_cursor` até ele vir null.
+    """
+    if skip < 0 or not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="skip deve ser >= 0 e limit entre 1 e 500")
+    # O histórico só muda junto com a versão do paciente
+    versao = crud.get_versao_paciente(db, paciente_id)
+    if versao is None:
+        # Paciente inexistente ou removido (soft delete), como nos sub-recursos
+        raise HTTPException(status_code=404, detail="Recurso não encontrado")
+    apos = None
+    if cursor:
+        try:
+            valor, ultimo_id = crud.decodificar_cursor(cursor, "historico")
+            apos = (datetime.fromisoformat(valor), ultimo_id)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    etag = gerar_etag("historico", paciente_id, versao, skip, limit, cursor, as_of)
+    if etag_corresponde(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    if as_of is not None:
+        if as_of.tzinfo is not None:
+            as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+        reconstruido = historico.reconstruir(db, paciente_id, as_of)
+        if reconstruido is None:
+            raise HTTPException(status_code=404, detail="Sem histórico até a data informada")
+        versao_as_of, data_modificacao, paciente = reconstruido
+        return {"versao": versao_as_of, "data_modificacao": data_modificacao, "paciente": paciente}
+
+    if cursor is None:
+        return _linhas_historico(historico.listar(db, paciente_id, limit, skip=skip))
+
+    # Uma linha a mais indica se existe próxima página
+    linhas = historico.listar(db, paciente_id, limit + 1, apos=apos)
+    next_cursor = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        next_cursor = crud.codificar_cursor("historico", linhas[-1].data_modificacao.isoformat(), linhas[-1].id)
+    return {"items": _linhas_historico(linhas), "next_cursor": next_cursor}
+
+# Sub-recursos do paciente: cada rota lê/grava só a tabela afetada (crud.*_um_para_um / *_colecao)
+def _exigir_paciente(db: Session, paciente_id: int):
+    if crud.get_versao_paciente(db, paciente_id) is None:
+        raise HTTPException(status_code=404, detail="Recurso não encontrado")
+
+def _registrar_um_para_um(recurso: str, schema_leitura, schema_escrita):
+    rota = f"/pacientes/{{paciente_id}}/{recurso}"
+
+    @app.get(rota, response_model=schema_leitura, name=f"read_{recurso}")
+    def ler(paciente_id: int, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        registro = crud.get_um_para_um(db, paciente_id, recurso)
+        if registro is None:
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return registro
+
+    @app.post(rota, response_model=schema_leitura, status_code=201, name=f"create_{recurso}")
+    def criar(paciente_id: int, dados: schema_escrita, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        try:
+            return crud.criar_um_para_um(db, paciente_id, recurso, dados)
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @app.patch(rota, response_model=schema_leitura, name=f"patch_{recurso}")
+    def atualizar(paciente_id: int, dados: schema_escrita, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        registro = crud.patch_um_para_um(db, paciente_id, recurso, dados)
+        if registro is None:
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return registro
+
+    @app.delete(rota, name=f"delete_{recurso}")
+    def remover(paciente_id: int, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        if not crud.remover_um_para_um(db, paciente_id, recurso):
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return {"success": True}
+
+def _registrar_colecao(recurso: str, schema_leitura, schema_escrita):
+    rota = f"/pacientes/{{paciente_id}}/{recurso}"
+    rota_item = rota + "/{id_item}"
+
+    @app.get(rota, response_model=List[schema_leitura], name=f"list_{recurso}")
+    def listar(paciente_id: int, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        return crud.listar_colecao(db, paciente_id, recurso)
+
+    @app.post(rota, response_model=schema_leitura, status_code=201, name=f"create_{recurso}")
+    def adicionar(paciente_id: int, dados: schema_escrita, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        try:
+            return crud.adicionar_item_colecao(db, paciente_id, recurso, dados)
+        except ValueError as e:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @app.patch(rota_item, response_model=schema_leitura, name=f"patch_{recurso}")
+    def atualizar(paciente_id: int, id_item: int, dados: schema_escrita, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        item = crud.atualizar_item_colecao(db, paciente_id, recurso, id_item, dados)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return item
+
+    @app.delete(rota_item, name=f"delete_{recurso}")
+    def remover(paciente_id: int, id_item: int, db: Session = Depends(get_db), current_user: Dict[str, Any] = Depends(get_current_user)):
+        _exigir_paciente(db, paciente_id)
+        if not crud.remover_item_colecao(db, paciente_id, recurso, id_item):
+            raise HTTPException(status_code=404, detail="Recurso não encontrado")
+        return {"success": True}
+
+_registrar_um_para_um("tratamento", schemas.Tratamento, schemas.TratamentoCreate)
+_registrar_um_para_um("desfecho", schemas.Desfecho, schemas.DesfechoCreate)
+_registrar_colecao("cirurgias", schemas.Cirurgia, schemas.CirurgiaCreate)
+_registrar_colecao("imunohistoquimicas", schemas.Imunohistoquimica, schemas.ImunohistoquimicaCreate)
+_registrar_colecao("eventos", schemas.Evento, schemas.EventoCreate)
 
 if __name__ == "__main__":
     import uvicorn
@@ -459,18 +922,29 @@ if __name__ == "__main__":
 
 @app.get('/dashboard/resumo')
 @limiter.limit("30/minute")
-def dashboard_resumo(request: Request, db: Session = Depends(get_db)):
+def dashboard_resumo(request: Request, db: Session = Depends(get_db), etag: None = Depends(etag_dashboard)):
     """Obtém os cartões do dashboard incluindo médias fixas que estavam zeradas."""
     return get_resumo_geral(db)
 
+@app.get('/dashboard/numericos')
+@limiter.limit("30/minute")
+def dashboard_numericos(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
+):
+    """Média, mínimo e máximo das quantidades clínicas gravadas como texto (colunas numéricas derivadas)."""
+    return get_resumo_numerico(db)
+
 @app.get("/dashboard/estatisticas_temporais")
 @limiter.limit("30/minute")
-def dashboard_estatisticas_temporais(request: Request, db: Session = Depends(get_db)):
+def dashboard_estatisticas_temporais(request: Request, db: Session = Depends(get_db), etag: None = Depends(etag_dashboard)):
     return get_estatisticas_temporais(db)
 
 @app.get("/dashboard/sus_metrics")
 @limiter.limit("30/minute")
-def dashboard_sus_metrics(request: Request, db: Session = Depends(get_db)):
+def dashboard_sus_metrics(request: Request, db: Session = Depends(get_db), etag: None = Depends(etag_dashboard)):
     return get_sus_metrics(db)
 
 @app.get("/dashboard/estadiamento")
@@ -478,7 +952,8 @@ def dashboard_sus_metrics(request: Request, db: Session = Depends(get_db)):
 def dashboard_estadiamento(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_estadiamento(db)
 
@@ -488,7 +963,8 @@ def dashboard_estadiamento(
 def dashboard_sobrevida(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_sobrevida_global(db)
 
@@ -498,7 +974,8 @@ def dashboard_sobrevida(
 def dashboard_recidiva(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_taxa_recidiva(db)
 
@@ -508,17 +985,40 @@ def dashboard_recidiva(
 def dashboard_delta_t(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_media_delta_t(db)
 
 
+@app.get("/dashboard/delta_t/analitico")
+@limiter.limit("30/minute")
+def dashboard_delta_t_analitico(
+    request: Request,
+    limites: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
+):
+    """
+    Histograma e percentis do delta T Diagnóstico → Início do Tratamento.
+    `limites` é o último dia de cada faixa, separado por vírgulas (padrão: 30,60,90).
+    """
+    try:
+        if limites:
+            return get_delta_t_analitico(db, tuple(l.strip() for l in limites.split(",") if l.strip()))
+        return get_delta_t_analitico(db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/dashboard/genero")
 @limiter.limit("30/minute")
 def dashboard_genero(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_genero(db)
 
@@ -528,7 +1028,8 @@ def dashboard_genero(
 def dashboard_faixa_etaria(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_faixa_etaria(db)
 
@@ -538,7 +1039,8 @@ def dashboard_faixa_etaria(
 def dashboard_tipo_cirurgia(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_tipo_cirurgia(db)
 
@@ -548,7 +1050,8 @@ def dashboard_tipo_cirurgia(
 def dashboard_marcadores(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_marcadores(db)
 
@@ -558,7 +1061,8 @@ def dashboard_marcadores(
 def dashboard_historia_familiar(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_historia_familiar(db)
 
@@ -568,7 +1072,8 @@ def dashboard_historia_familiar(
 def dashboard_habitos_vida(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_distribuicao_habitos_vida(db)
 
@@ -578,7 +1083,8 @@ def dashboard_habitos_vida(
 def dashboard_resumo(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     return get_resumo_geral(db)
 
@@ -588,9 +1094,29 @@ def dashboard_resumo(
 def dashboard_estatisticas_temporais(
     request: Request,
     db: Session = Depends(get_db), 
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
 ):
     """Retorna estatísticas temporais (evolução ao longo do tempo)"""
     return get_media_delta_t(db)
 
 
+@app.get("/dashboard/bundle")
+@limiter.limit("30/minute")
+def dashboard_bundle(
+    request: Request,
+    metricas: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    etag: None = Depends(etag_dashboard)
+):
+    """
+    Retorna várias métricas do dashboard em um único documento.
+    `metricas` é uma lista separada por vírgulas (ex.: resumo,genero,sus_metrics);
+    se omitida, todas as métricas são retornadas.
+    """
+    nomes = [m.strip() for m in metricas.split(",") if m.strip()] if metricas else None
+    try:
+        return get_dashboard_bundle(db, nomes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
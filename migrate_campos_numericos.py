@@ -0,0 +1,30 @@
+"""
+Migration: colunas numéricas derivadas (`<campo>_num`, indexadas) para as quantidades
+clínicas gravadas como texto em PACIENTE (classificacao.CAMPOS_NUMERICOS).
+Run this script ONCE against the production PostgreSQL database.
+Em seguida preenche as colunas em lotes.
+"""
+from sqlalchemy import text
+from database import engine, SessionLocal
+import backfill
+import classificacao
+
+SQL = []
+for campo in classificacao.CAMPOS_NUMERICOS:
+    coluna = classificacao.coluna_numerica(campo)
+    SQL.append(f"ALTER TABLE clinical.paciente ADD COLUMN IF NOT EXISTS {coluna} NUMERIC(10, 2);")
+    SQL.append(f"CREATE INDEX IF NOT EXISTS ix_paciente_{coluna} ON clinical.paciente ({coluna});")
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print(f"   - paciente: {len(classificacao.CAMPOS_NUMERICOS)} colunas numéricas e índices criados")
+
+    db = SessionLocal()
+    try:
+        alteradas = backfill.backfill_numericos(db)
+        print(f"   - backfill: {alteradas} pacientes atualizados")
+    finally:
+        db.close()
@@ -0,0 +1,30 @@
+"""
+Migration: coluna indexada com o estadiamento canônico ('0'..'IV') na tabela PACIENTE.
+Run this script ONCE against the production PostgreSQL database.
+Em seguida preenche a coluna em lotes e reconstrói os agregados do dashboard.
+"""
+from sqlalchemy import text
+from database import engine, SessionLocal
+import agregados
+import backfill
+
+SQL = [
+    "ALTER TABLE clinical.paciente ADD COLUMN IF NOT EXISTS hd_estadiamento_codigo VARCHAR(5);",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_hd_estadiamento_codigo ON clinical.paciente (hd_estadiamento_codigo);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente.hd_estadiamento_codigo: coluna e índice criados")
+
+    db = SessionLocal()
+    try:
+        alteradas = backfill.backfill_estadiamento(db)
+        print(f"   - backfill: {alteradas} pacientes classificados")
+        agregados.reconstruir(db)
+        print("   - agregados do dashboard reconstruídos")
+    finally:
+        db.close()
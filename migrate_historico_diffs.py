@@ -0,0 +1,23 @@
+"""
+Migration: histórico em diffs do grafo + checkpoints (PACIENTE_HISTORICO).
+Run this script ONCE against the production PostgreSQL database.
+As linhas antigas (só dados_anteriores) continuam listadas; a reconstrução (?as_of=)
+começa no primeiro checkpoint, gravado na próxima alteração de cada paciente.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    "ALTER TABLE clinical.paciente_historico ADD COLUMN IF NOT EXISTS versao INTEGER;",
+    "ALTER TABLE clinical.paciente_historico ADD COLUMN IF NOT EXISTS tipo VARCHAR(20);",
+    "ALTER TABLE clinical.paciente_historico ADD COLUMN IF NOT EXISTS alteracoes JSON;",
+    "ALTER TABLE clinical.paciente_historico ADD COLUMN IF NOT EXISTS snapshot JSON;",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_historico_paciente_versao ON clinical.paciente_historico (id_paciente, versao);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente_historico: colunas versao, tipo, alteracoes, snapshot e índice (id_paciente, versao)")
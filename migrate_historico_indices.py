@@ -0,0 +1,18 @@
+"""
+Migration: índices da PACIENTE_HISTORICO (listagem por paciente e estatísticas por data).
+Run this script ONCE against the production PostgreSQL database.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    "CREATE INDEX IF NOT EXISTS ix_paciente_historico_paciente_data ON clinical.paciente_historico (id_paciente, data_modificacao, id);",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_historico_data ON clinical.paciente_historico (data_modificacao, id_paciente);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente_historico: índices (id_paciente, data_modificacao, id) e (data_modificacao, id_paciente)")
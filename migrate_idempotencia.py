@@ -0,0 +1,29 @@
+"""
+Migration: tabela de chaves de idempotência (Idempotency-Key em POST /pacientes).
+Run this script ONCE against the production PostgreSQL database.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS clinical.idempotencia_requisicoes (
+        usuario VARCHAR(255) NOT NULL,
+        chave VARCHAR(255) NOT NULL,
+        hash_corpo VARCHAR(64) NOT NULL,
+        status_code INTEGER,
+        resposta JSON,
+        criado_em TIMESTAMP NOT NULL,
+        expira_em TIMESTAMP NOT NULL,
+        PRIMARY KEY (usuario, chave)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_idempotencia_requisicoes_expira_em ON clinical.idempotencia_requisicoes (expira_em);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - idempotencia_requisicoes: tabela e índice criados")
@@ -0,0 +1,18 @@
+"""
+Migration: índice composto (nome_completo, id_paciente) em PACIENTE para a
+paginação por cursor ordenada por nome (GET /pacientes/?cursor=&ordenar_por=nome_completo).
+Run this script ONCE against the production PostgreSQL database.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    "CREATE INDEX IF NOT EXISTS ix_paciente_nome_completo_id ON clinical.paciente (nome_completo, id_paciente);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente: índice (nome_completo, id_paciente) criado")
@@ -0,0 +1,19 @@
+"""
+Migration: soft delete de PACIENTE (coluna deleted_at + índices parciais).
+Run this script ONCE against the production PostgreSQL database.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    "ALTER TABLE clinical.paciente ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_ativos ON clinical.paciente (id_paciente) WHERE deleted_at IS NULL;",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_removidos ON clinical.paciente (deleted_at, id_paciente) WHERE deleted_at IS NOT NULL;",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente.deleted_at: coluna e índices parciais (ativos/removidos) criados")
@@ -0,0 +1,34 @@
+"""
+Migration: subtipo molecular pré-calculado em IMUNOHISTOQUIMICAS (por exame) e em
+PACIENTE (subtipo resolvido). Run this script ONCE against the production PostgreSQL database.
+Em seguida preenche as colunas em lotes e reconstrói os agregados do dashboard.
+"""
+from sqlalchemy import text
+from database import engine, SessionLocal
+import agregados
+import backfill
+
+SQL = [
+    "ALTER TABLE clinical.imunohistoquimicas ADD COLUMN IF NOT EXISTS subtipo_molecular VARCHAR(20);",
+    "CREATE INDEX IF NOT EXISTS ix_imunohistoquimicas_subtipo_molecular ON clinical.imunohistoquimicas (subtipo_molecular);",
+    "ALTER TABLE clinical.paciente ADD COLUMN IF NOT EXISTS subtipo_molecular VARCHAR(20);",
+    "CREATE INDEX IF NOT EXISTS ix_paciente_subtipo_molecular ON clinical.paciente (subtipo_molecular);",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - imunohistoquimicas.subtipo_molecular / paciente.subtipo_molecular: colunas e índices criados")
+
+    db = SessionLocal()
+    try:
+        alteradas = backfill.backfill_subtipo_ihq(db)
+        print(f"   - backfill: {alteradas} IHQ classificadas")
+        alteradas = backfill.backfill_subtipo_paciente(db)
+        print(f"   - backfill: {alteradas} pacientes classificados")
+        agregados.reconstruir(db)
+        print("   - agregados do dashboard reconstruídos")
+    finally:
+        db.close()
@@ -0,0 +1,17 @@
+"""
+Migration: adiciona a coluna de versão (base dos ETags) na tabela PACIENTE.
+Run this script ONCE against the production PostgreSQL database.
+"""
+from sqlalchemy import text
+from database import engine
+
+SQL = [
+    "ALTER TABLE clinical.paciente ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;",
+]
+
+if __name__ == "__main__":
+    with engine.begin() as conn:
+        for comando in SQL:
+            conn.execute(text(comando))
+    print("✅ Migration aplicada com sucesso!")
+    print("   - paciente.versao: coluna criada (default 1)")
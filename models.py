@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Boolean, Numeric, ForeignKey, DateTime, JSON, Text, CHAR
+from sqlalchemy import Column, Integer, String, Date, Boolean, Numeric, ForeignKey, DateTime, JSON, Text, CHAR, UniqueConstraint, Index, select, text
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -8,6 +8,20 @@ import datetime
 # =======================================================================
 class Paciente(Base):
     __tablename__ = "paciente"
+    __table_args__ = (
+        # Paginação por cursor ordenada por nome (crud.get_pacientes_cursor)
+        Index("ix_paciente_nome_completo_id", "nome_completo", "id_paciente"),
+        # Soft delete: leituras varrem só os ativos; o expurgo e os filtros das tabelas
+        # filhas (filtro_ativo) consultam só os removidos
+        Index(
+            "ix_paciente_ativos", "id_paciente",
+            postgresql_where=text("deleted_at IS NULL"), sqlite_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_paciente_removidos", "deleted_at", "id_paciente",
+            postgresql_where=text("deleted_at IS NOT NULL"), sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
     
     # CHAVE PRIMÁRIA
     id_paciente = Column(Integer, primary_key=True, index=True)
@@ -97,6 +111,8 @@ class Paciente(Base):
     hd_tamanho_tumoral_clinico = Column(Numeric(5, 2))
     hd_linfonodos_palpaveis = Column(String(10))
     hd_estadiamento_clinico = Column(String(50))
+    hd_estadiamento_codigo = Column(String(5), index=True) # Derivado: '0'..'IV' (classificacao.normalizar_estadiamento)
+    subtipo_molecular = Column(String(20), index=True) # Derivado: subtipo resolvido entre as IHQ do paciente
     hd_metastase_distancia = Column(Boolean, default=False)
     hd_locais_metastase = Column(Text)
 
@@ -104,12 +120,39 @@ class Paciente(Base):
     mp_score_tyrer_cuzick = Column(String(50))
     mp_score_canrisk = Column(String(50))
     mp_score_gail = Column(String(50))
+
+    # COLUNAS NUMÉRICAS DERIVADAS (classificacao.CAMPOS_NUMERICOS): valor convertido do texto na escrita
+    hp_idade_diagnostico_neoplasia_num = Column(Numeric(10, 2), index=True)
+    hv_tabagismo_carga_num = Column(Numeric(10, 2), index=True)
+    hv_tabagismo_tempo_anos_num = Column(Numeric(10, 2), index=True)
+    hv_etilismo_tempo_anos_num = Column(Numeric(10, 2), index=True)
+    hv_etilismo_dose_diaria_num = Column(Numeric(10, 2), index=True)
+    hv_tempo_atividade_semanal_min_num = Column(Numeric(10, 2), index=True)
+    p_gesta_num = Column(Numeric(10, 2), index=True)
+    p_para_num = Column(Numeric(10, 2), index=True)
+    p_aborto_num = Column(Numeric(10, 2), index=True)
+    p_idade_primeiro_filho_num = Column(Numeric(10, 2), index=True)
+    p_tempo_amamentacao_meses_num = Column(Numeric(10, 2), index=True)
+    p_menarca_idade_num = Column(Numeric(10, 2), index=True)
+    p_idade_menopausa_num = Column(Numeric(10, 2), index=True)
+    p_tempo_uso_trh_num = Column(Numeric(10, 2), index=True)
+    p_tempo_uso_aco_num = Column(Numeric(10, 2), index=True)
+    hd_ecog_num = Column(Numeric(10, 2), index=True)
+    mp_score_tyrer_cuzick_num = Column(Numeric(10, 2), index=True)
+    mp_score_canrisk_num = Column(Numeric(10, 2), index=True)
+    mp_score_gail_num = Column(Numeric(10, 2), index=True)
+
+    # CONTROLE DE VERSÃO (ETag): incrementada a cada alteração do paciente ou de seus dados
+    versao = Column(Integer, nullable=False, default=1, server_default="1")
+
+    # SOFT DELETE: preenchido ao remover; o grafo é apagado depois por expurgo.py
+    deleted_at = Column(DateTime)
     
     # Relacionamentos
-    familiares = relationship("PacienteFamiliar", back_populates="paciente", cascade="all, delete-orphan", lazy="noload")
-    tratamento = relationship("Tratamento", back_populates="paciente", cascade="all, delete-orphan", uselist=False, lazy="noload")
-    desfecho = relationship("Desfecho", back_populates="paciente", cascade="all, delete-orphan", uselist=False, lazy="noload")
-    historico = relationship("PacienteHistorico", back_populates="paciente", cascade="all, delete-orphan", lazy="noload")
+    familiares = relationship("PacienteFamiliar", back_populates="paciente", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    tratamento = relationship("Tratamento", back_populates="paciente", cascade="all, delete-orphan", passive_deletes=True, uselist=False, lazy="noload")
+    desfecho = relationship("Desfecho", back_populates="paciente", cascade="all, delete-orphan", passive_deletes=True, uselist=False, lazy="noload")
+    historico = relationship("PacienteHistorico", back_populates="paciente", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
 
 
 # =======================================================================
@@ -227,12 +270,12 @@ class Tratamento(Base):
     paciente = relationship("Paciente", back_populates="tratamento")
     
     # Relacionamentos 1:N
-    cirurgias = relationship("TratamentoCirurgia", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
-    quimio_paliativa = relationship("PalliativoQuimioterapia", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
-    radio_paliativa = relationship("PalliativoRadioterapia", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
-    endo_paliativa = relationship("PalliativoEndocrinoterapia", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
-    imuno_paliativa = relationship("PalliativoImunoterapia", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
-    imunohistoquimicas = relationship("Imunohistoquimicas", back_populates="tratamento", cascade="all, delete-orphan", lazy="noload")
+    cirurgias = relationship("TratamentoCirurgia", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    quimio_paliativa = relationship("PalliativoQuimioterapia", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    radio_paliativa = relationship("PalliativoRadioterapia", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    endo_paliativa = relationship("PalliativoEndocrinoterapia", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    imuno_paliativa = relationship("PalliativoImunoterapia", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    imunohistoquimicas = relationship("Imunohistoquimicas", back_populates="tratamento", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
 
 
 # =======================================================================
@@ -269,8 +312,8 @@ class Desfecho(Base):
     paciente = relationship("Paciente", back_populates="desfecho")
     
     # Relacionamentos 1:N
-    metastases = relationship("DesfechoMetastases", back_populates="desfecho", cascade="all, delete-orphan", lazy="noload")
-    eventos = relationship("DesfechoEventos", back_populates="desfecho", cascade="all, delete-orphan", lazy="noload")
+    metastases = relationship("DesfechoMetastases", back_populates="desfecho", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+    eventos = relationship("DesfechoEventos", back_populates="desfecho", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
 
 
 # =======================================================================
@@ -363,6 +406,7 @@ class Imunohistoquimicas(Base):
     her2 = Column(String(50))
     fish = Column(String(50))
     outras_informacoes = Column(Text)
+    subtipo_molecular = Column(String(20), index=True) # Derivado: classificacao.classificar_molecular(re, rp, her2)
 
     tratamento = relationship("Tratamento", back_populates="imunohistoquimicas")
 
@@ -401,6 +445,82 @@ class PacienteHistorico(Base):
     id = Column(Integer, primary_key=True, index=True)
     id_paciente = Column(Integer, ForeignKey("paciente.id_paciente", ondelete="CASCADE"), nullable=False)
     data_modificacao = Column(DateTime, default=datetime.datetime.utcnow)
+    # Formato antigo: 5 campos do paciente antes da alteração (linhas sem `versao`)
     dados_anteriores = Column(JSON)
+    # Versão do paciente após a alteração, 'checkpoint' ou 'diff' (historico.py)
+    versao = Column(Integer)
+    tipo = Column(String(20))
+    # Merge patch em relação à versão anterior
+    alteracoes = Column(JSON)
+    # Grafo completo (só nos checkpoints)
+    snapshot = Column(JSON)
     
-    paciente = relationship("Paciente", back_populates="historico")
\ No newline at end of file
+    paciente = relationship("Paciente", back_populates="historico")
+
+    __table_args__ = (
+        Index("ix_paciente_historico_paciente_versao", "id_paciente", "versao"),
+        # Listagem do paciente por data (keyset em data_modificacao, id)
+        Index("ix_paciente_historico_paciente_data", "id_paciente", "data_modificacao", "id"),
+        # Estatísticas temporais do dashboard (faixa de datas; cobre id_paciente)
+        Index("ix_paciente_historico_data", "data_modificacao", "id_paciente"),
+    )
+
+
+# =======================================================================
+# AGREGADOS DO DASHBOARD (mantidos na escrita)
+# Uma linha por (dimensão, bucket) com o total de pacientes/registros.
+# Ver agregados.py para a regra de cada dimensão e o rebuild completo.
+# =======================================================================
+class DashboardAgregado(Base):
+    __tablename__ = "dashboard_aggregates"
+    __table_args__ = (
+        UniqueConstraint("dimensao", "bucket", name="uq_dashboard_aggregates_dimensao_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    dimensao = Column(String(50), nullable=False)
+    bucket = Column(String(255), nullable=False)
+    total = Column(Integer, nullable=False, default=0)
+
+
+# =======================================================================
+# FILTRO DE SOFT DELETE
+# Pacientes com `deleted_at` preenchido ficam fora de todas as leituras até o expurgo.
+# =======================================================================
+def filtro_ativo(modelo):
+    """
+    Condição WHERE que exclui as linhas de pacientes removidos. Nas tabelas filhas é um
+    NOT IN sobre o conjunto (pequeno) de removidos, servido por ix_paciente_removidos.
+    """
+    if modelo is Paciente:
+        return Paciente.deleted_at.is_(None)
+    removidos = select(Paciente.id_paciente).where(Paciente.deleted_at.isnot(None))
+    if hasattr(modelo, "id_paciente"):
+        return modelo.id_paciente.not_in(removidos)
+    if hasattr(modelo, "id_tratamento"):
+        return modelo.id_tratamento.not_in(
+            select(Tratamento.id_tratamento).where(Tratamento.id_paciente.in_(removidos))
+        )
+    if hasattr(modelo, "id_desfecho"):
+        return modelo.id_desfecho.not_in(
+            select(Desfecho.id_desfecho).where(Desfecho.id_paciente.in_(removidos))
+        )
+    raise ValueError(f"{modelo.__name__} não está ligado a um paciente")
+
+
+# =======================================================================
+# CHAVES DE IDEMPOTÊNCIA (Idempotency-Key em POST /pacientes)
+# Uma linha por (usuário, chave) com a resposta original; `status_code` nulo indica
+# requisição ainda em andamento. Linhas expiradas são ignoradas, removidas na escrita e
+# pelo job de expurgo (expurgo.py).
+# =======================================================================
+class IdempotenciaRequisicao(Base):
+    __tablename__ = "idempotencia_requisicoes"
+
+    usuario = Column(String(255), primary_key=True)
+    chave = Column(String(255), primary_key=True)
+    hash_corpo = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    resposta = Column(JSON)
+    criado_em = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    expira_em = Column(DateTime, nullable=False, index=True)
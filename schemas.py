@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, validator
+from typing import Optional, List, Union, Dict, ClassVar
 from datetime import date, datetime
 
 # =======================================================================
@@ -22,7 +22,8 @@ class FamiliarBase(BaseModel):
     tipo_cancer_outros: Optional[str] = None
 
 class FamiliarCreate(FamiliarBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_familiar: Optional[int] = None
 
 class Familiar(FamiliarBase):
     id_familiar: int
@@ -46,7 +47,8 @@ class CirurgiaBase(BaseModel):
     ampliacao_margem: Optional[bool] = False
 
 class CirurgiaCreate(CirurgiaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_cirurgia: Optional[int] = None
 
 class Cirurgia(CirurgiaBase):
     id_cirurgia: int
@@ -67,7 +69,8 @@ class PalliativoQuimioterapiaBase(BaseModel):
     intercorrencias: Optional[str] = None
 
 class PalliativoQuimioterapiaCreate(PalliativoQuimioterapiaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_quimio_paliativa: Optional[int] = None
 
 class PalliativoQuimioterapia(PalliativoQuimioterapiaBase):
     id_quimio_paliativa: int
@@ -83,7 +86,8 @@ class PalliativoRadioterapiaBase(BaseModel):
     intercorrencias: Optional[str] = None
 
 class PalliativoRadioterapiaCreate(PalliativoRadioterapiaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_radio_paliativa: Optional[int] = None
 
 class PalliativoRadioterapia(PalliativoRadioterapiaBase):
     id_radio_paliativa: int
@@ -99,7 +103,8 @@ class PalliativoEndocrinoterapiaBase(BaseModel):
     intercorrencias: Optional[str] = None
 
 class PalliativoEndocrinoterapiaCreate(PalliativoEndocrinoterapiaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_endo_paliativa: Optional[int] = None
 
 class PalliativoEndocrinoterapia(PalliativoEndocrinoterapiaBase):
     id_endo_paliativa: int
@@ -115,7 +120,8 @@ class PalliativoImunoterapiaBase(BaseModel):
     intercorrencias: Optional[str] = None
 
 class PalliativoImunoterapiaCreate(PalliativoImunoterapiaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_imuno_paliativa: Optional[int] = None
 
 class PalliativoImunoterapia(PalliativoImunoterapiaBase):
     id_imuno_paliativa: int
@@ -141,7 +147,8 @@ class ImunohistoquimicaBase(BaseModel):
     outras_informacoes: Optional[str] = None
 
 class ImunohistoquimicaCreate(ImunohistoquimicaBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_imunohistoquimica: Optional[int] = None
 
 class Imunohistoquimica(ImunohistoquimicaBase):
     id_imunohistoquimica: int
@@ -255,7 +262,8 @@ class MetastaseBase(BaseModel):
     local: Optional[str] = None
 
 class MetastaseCreate(MetastaseBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_desfecho_metastase: Optional[int] = None
 
 class Metastase(MetastaseBase):
     id_desfecho_metastase: int
@@ -270,7 +278,8 @@ class EventoBase(BaseModel):
     descricao: Optional[str] = None
 
 class EventoCreate(EventoBase):
-    pass
+    # Presente ao reenviar um registro existente (atualização); ausente = novo registro
+    id_evento: Optional[int] = None
 
 class Evento(EventoBase):
     id_evento: int
@@ -423,6 +432,14 @@ class PacienteCreate(PacienteBase):
     tratamento: Optional[TratamentoCreate] = None
     desfecho: Optional[DesfechoCreate] = None
 
+class PacientePatch(PacienteCreate):
+    """
+    Corpo do PATCH (JSON Merge Patch): só os campos enviados são alterados. Em tratamento e
+    desfecho só as colunas/coleções enviadas são gravadas; listas enviadas substituem a
+    coleção (itens com id são atualizados, sem id são inseridos, ausentes são removidos).
+    """
+    pass
+
 class Tratamento(TratamentoBase):
     id_tratamento: int
     id_paciente: int
@@ -456,6 +473,46 @@ class Paciente(PacienteBase):
     class Config:
         orm_mode = True
 
+class PacienteResumo(BaseModel):
+    """Projeção da listagem (GET /pacientes/?view=summary)"""
+    id_paciente: int
+    nome_completo: str
+    data_nascimento: Optional[date] = None
+    cidade: Optional[str] = None
+    hd_estadiamento_clinico: Optional[str] = None
+    status_vital: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class PacientePagina(BaseModel):
+    """Página da listagem por cursor: `next_cursor` é None na última página."""
+    items: List[Union[Paciente, PacienteResumo]]
+    next_cursor: Optional[str] = None
+
+class PacienteIds(BaseModel):
+    """Corpo das operações em lote por id (POST /pacientes/bulk-delete)"""
+    MAX_IDS: ClassVar[int] = 1000
+
+    ids: List[int]
+
+    @validator("ids")
+    def limitar_ids(cls, v):
+        if not v:
+            raise ValueError("Informe ao menos um id")
+        if len(v) > cls.MAX_IDS:
+            raise ValueError(f"Máximo de {cls.MAX_IDS} ids por requisição")
+        return v
+
+class PacienteIdsLeitura(PacienteIds):
+    """Corpo de POST /pacientes/batch-get (grafos completos: limite menor)"""
+    MAX_IDS: ClassVar[int] = 100
+
+class PacientesPorId(BaseModel):
+    """Resposta de POST /pacientes/batch-get"""
+    pacientes: Dict[int, Paciente]
+    nao_encontrados: List[int] = []
+
 # =======================================================================
 # SCHEMAS PARA HISTÓRICO
 # =======================================================================
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark do carregamento do grafo do paciente (crud.get_paciente)
+
+Compara a cadeia antiga de joinedload (produto cartesiano entre as coleções) com a
+estratégia atual (crud.opcoes_relacionamentos: 1:1 por JOIN, coleções por SELECT ... IN)
+à medida que cresce o número de filhos por coleção. Para cada cenário mostra quantas
+consultas foram executadas, quantas linhas o banco devolveu e a latência mediana.
+
+Uso (por padrão cria um SQLite temporário; NÃO aponte para o banco de produção):
+    python scripts/benchmark_carregamento.py [--filhos 1,2,3] [--pacientes 5] [--repeticoes 3]
+    python scripts/benchmark_carregamento.py --url postgresql://.../banco_descartavel
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark do carregamento de get_paciente")
+    parser.add_argument("--url", help="Banco descartável (padrão: SQLite temporário)")
+    parser.add_argument("--filhos", default="1,2,3", help="Filhos por coleção em cada cenário")
+    parser.add_argument("--pacientes", type=int, default=5, help="Pacientes no cenário em lote")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    return parser.parse_args()
+
+
+def criar_paciente(db, models, n):
+    """Paciente com `n` linhas em cada uma das nove coleções filhas (inserido direto pelo ORM)"""
+    paciente = models.Paciente(
+        nome_completo=f"Benchmark {n}",
+        familiares=[models.PacienteFamiliar(nome=f"Familiar {i}", parentesco="mae") for i in range(n)],
+        tratamento=models.Tratamento(
+            cirurgias=[models.TratamentoCirurgia(tipo_procedimento="mama") for i in range(n)],
+            quimio_paliativa=[models.PalliativoQuimioterapia(esquema=f"Q{i}") for i in range(n)],
+            radio_paliativa=[models.PalliativoRadioterapia() for i in range(n)],
+            endo_paliativa=[models.PalliativoEndocrinoterapia() for i in range(n)],
+            imuno_paliativa=[models.PalliativoImunoterapia() for i in range(n)],
+            imunohistoquimicas=[models.Imunohistoquimicas(re="Positivo") for i in range(n)],
+        ),
+        desfecho=models.Desfecho(
+            status_vital="Vivo",
+            metastases=[models.DesfechoMetastases(local=f"M{i}") for i in range(n)],
+            eventos=[models.DesfechoEventos(titulo=f"Evento {i}") for i in range(n)],
+        ),
+    )
+    db.add(paciente)
+    db.commit()
+    return paciente.id_paciente
+
+
+def opcoes_joinedload_antigo(models):
+    """Cadeia de joinedload usada antes por crud.get_paciente"""
+    from sqlalchemy.orm import joinedload
+
+    return [
+        joinedload(models.Paciente.familiares),
+        joinedload(models.Paciente.tratamento).options(
+            joinedload(models.Tratamento.cirurgias),
+            joinedload(models.Tratamento.quimio_paliativa),
+            joinedload(models.Tratamento.radio_paliativa),
+            joinedload(models.Tratamento.endo_paliativa),
+            joinedload(models.Tratamento.imuno_paliativa),
+            joinedload(models.Tratamento.imunohistoquimicas),
+        ),
+        joinedload(models.Paciente.desfecho).options(
+            joinedload(models.Desfecho.metastases),
+            joinedload(models.Desfecho.eventos),
+        ),
+    ]
+
+
+def medir(engine, SessionLocal, models, opcoes, ids, repeticoes):
+    """(consultas, linhas devolvidas pelo banco, latência mediana em ms)"""
+    from sqlalchemy import event
+
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append((statement, parameters))
+
+    tempos = []
+    for rodada in range(repeticoes):
+        db = SessionLocal()
+        if rodada == 0:
+            event.listen(engine, "before_cursor_execute", registrar)
+        inicio = time.perf_counter()
+        pacientes = (
+            db.query(models.Paciente)
+            .options(*opcoes)
+            .filter(models.Paciente.id_paciente.in_(ids))
+            .all()
+        )
+        # Garante que o grafo inteiro foi materializado
+        for p in pacientes:
+            len(p.familiares), len(p.tratamento.cirurgias), len(p.desfecho.eventos)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if rodada == 0:
+            event.remove(engine, "before_cursor_execute", registrar)
+        db.close()
+
+    # Reexecuta as consultas capturadas direto no driver para contar as linhas transferidas
+    linhas = 0
+    conexao = engine.raw_connection()
+    try:
+        cursor = conexao.cursor()
+        for statement, parameters in consultas:
+            cursor.execute(statement, parameters)
+            linhas += len(cursor.fetchall())
+    finally:
+        conexao.close()
+    return len(consultas), linhas, statistics.median(tempos)
+
+
+def main():
+    args = argumentos()
+    temporario = None
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        temporario = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        temporario.close()
+        os.environ["DATABASE_URL"] = f"sqlite:///{temporario.name}"
+
+    import models
+    import crud
+    from database import engine, SessionLocal, Base
+
+    Base.metadata.create_all(bind=engine)
+    estrategias = {
+        "joinedload (antigo)": opcoes_joinedload_antigo(models),
+        "selectin (atual)": crud.opcoes_relacionamentos(crud.RELACIONAMENTOS_PACIENTE),
+    }
+
+    print(f"{'cenário':<28}{'estratégia':<22}{'consultas':>10}{'linhas':>10}{'ms (mediana)':>14}")
+    try:
+        for n in [int(v) for v in args.filhos.split(",") if v.strip()]:
+            db = SessionLocal()
+            lote = [criar_paciente(db, models, n) for _ in range(args.pacientes)]
+            ids = lote[:1]
+            db.close()
+
+            for cenario, alvo in ((f"1 paciente, {n} filho(s)", ids), (f"{len(lote)} pacientes, {n} filho(s)", lote)):
+                for nome, opcoes in estrategias.items():
+                    consultas, linhas, ms = medir(engine, SessionLocal, models, opcoes, alvo, args.repeticoes)
+                    print(f"{cenario:<28}{nome:<22}{consultas:>10}{linhas:>10}{ms:>14.1f}")
+    finally:
+        if temporario:
+            engine.dispose()
+            os.remove(temporario.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import copy
+import os
+import sys
+import tempfile
+
+# Banco descartável, definido antes de qualquer import de database.py: SQLite temporário,
+# ou TEST_DATABASE_URL (p.ex. um PostgreSQL de testes; NÃO aponte para produção)
+_banco = os.path.join(tempfile.mkdtemp(), "testes.db")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{_banco}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pytest
+
+from database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    """Sessão sobre tabelas recriadas a cada teste"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    sessao = SessionLocal()
+    yield sessao
+    sessao.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def cliente(db):
+    """TestClient da API com usuário autenticado fixo e sem rate limit"""
+    from fastapi.testclient import TestClient
+    import auth
+    import main
+
+    main.app.dependency_overrides[auth.get_current_user] = lambda: {"username": "teste"}
+    main.limiter.enabled = False
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+    main.limiter.enabled = True
+
+
+# Paciente com todas as partes do grafo (familiares, tratamento, desfecho e coleções)
+_PACIENTE = {
+    "nome_completo": "Maria da Silva",
+    "data_nascimento": "1970-05-01",
+    "genero": "Feminino",
+    "cidade": "Fortaleza",
+    "hd_estadiamento_clinico": "EC IIIA",
+    "familiares": [{"nome": "Ana", "parentesco": "mae"}],
+    "tratamento": {
+        "cirurgias": [{"tipo_procedimento": "mama"}],
+        "imunohistoquimicas": [{"re": "Positivo", "rp": "Negativo", "her2": "1+"}],
+    },
+    "desfecho": {
+        "status_vital": "Vivo",
+        "td_data_diagnostico": "2024-01-01",
+        "td_data_inicio_tratamento": "2024-02-15",
+        "eventos": [{"titulo": "Consulta"}],
+    },
+}
+
+
+@pytest.fixture
+def dados_paciente():
+    """Corpo de POST/PUT /pacientes (cópia: os testes podem alterar)"""
+    return copy.deepcopy(_PACIENTE)
@@ -0,0 +1,44 @@
+import agregados
+import models
+
+
+def linhas_agregados(db):
+    """{(dimensão, bucket): total} sem zeros (reconstruir não grava buckets zerados)"""
+    db.expire_all()
+    return {
+        (linha.dimensao, linha.bucket): linha.total
+        for linha in db.query(models.DashboardAgregado)
+        if linha.total and (linha.dimensao, linha.bucket) != agregados.MARCADOR_RECONSTRUIDO
+    }
+
+
+def test_sem_rebuild_escritas_nao_gravam_deltas(cliente, db, dados_paciente):
+    assert cliente.post("/pacientes", json=dados_paciente).status_code == 200
+
+    assert db.query(models.DashboardAgregado).count() == 0
+    assert agregados.ler_dimensao(db, "genero") is None
+
+
+def test_deltas_das_escritas_batem_com_rebuild(cliente, db, dados_paciente):
+    for genero in ("Feminino", "Masculino"):
+        assert cliente.post("/pacientes", json=dict(dados_paciente, genero=genero)).status_code == 200
+    agregados.reconstruir(db)
+
+    id_novo = cliente.post("/pacientes", json=dict(dados_paciente, data_nascimento="1990-01-01")).json()["id_paciente"]
+    outro = dict(dados_paciente, genero="Masculino", hd_estadiamento_clinico="IV")
+    outro["desfecho"] = dict(dados_paciente["desfecho"], status_vital="Óbito", td_data_inicio_tratamento="2024-06-01")
+    assert cliente.put("/pacientes/1", json=outro).status_code == 200
+    assert cliente.patch("/pacientes/2", json={"genero": None, "desfecho": {"recidiva_local": True}}).status_code == 200
+    assert cliente.post(f"/pacientes/{id_novo}/imunohistoquimicas", json={"re": "Negativo", "rp": "Negativo", "her2": "3+", "data_realizacao": "2030-01-01"}).status_code == 201
+    assert cliente.delete("/pacientes/2/desfecho").status_code == 200
+    importados = cliente.post("/pacientes/bulk", json=[
+        dados_paciente,
+        {"nome_completo": "Sem grafo", "genero": "Feminino"},
+    ]).json()
+    assert importados["criados"] == 2
+    assert cliente.delete(f"/pacientes/{importados['ids'][0]['id_paciente']}").status_code == 200
+    assert cliente.post("/pacientes/bulk-delete", json={"ids": [1]}).status_code == 200
+
+    incrementais = linhas_agregados(db)
+    agregados.reconstruir(db)
+    assert incrementais == linhas_agregados(db)
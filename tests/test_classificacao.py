@@ -0,0 +1,25 @@
+import pytest
+
+import classificacao
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("EC IIIA", "III"),
+    ("ec: iv", "IV"),
+    ("Estádio 2", "II"),
+    ("Estágio 3", "III"),
+    ("estadio clinico IIA", "II"),
+    ("IIB", "II"),
+    (" iiia ", "III"),
+    ("3B", "III"),
+    ("cT2N1M0", "II"),
+    ("Carcinoma in situ", "0"),
+    ("Grau histológico II, EC IIIA", "III"),
+])
+def test_normalizar_estadiamento(texto, esperado):
+    assert classificacao.normalizar_estadiamento(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", ["Grau I", "grau III", "GRAU II", "Grau histológico 2", "Nottingham grau III"])
+def test_grau_histologico_nao_e_estadio(texto):
+    assert classificacao.normalizar_estadiamento(texto) is None
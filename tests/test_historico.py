@@ -0,0 +1,119 @@
+import datetime
+
+import pytest
+
+import historico
+import models
+
+
+def test_diferenca_e_aplicar_reconstroem_o_estado():
+    antes = {
+        "nome": "Maria", "cidade": "Fortaleza", "genero": "Feminino",
+        "desfecho": {"status_vital": "Vivo", "eventos": [{"titulo": "Consulta"}]},
+        "familiares": [{"nome": "Ana"}],
+        "tratamento": None,
+    }
+    depois = {
+        "nome": "Maria", "cidade": "Sobral", "genero": None,
+        "desfecho": {"status_vital": "Vivo", "eventos": [{"titulo": "Consulta"}, {"titulo": "Retorno"}]},
+        "familiares": [],
+        "tratamento": {"cirurgias": []},
+    }
+
+    patch = historico.diferenca(antes, depois)
+    assert patch == {
+        "cidade": "Sobral",
+        "genero": None,
+        "desfecho": {"eventos": [{"titulo": "Consulta"}, {"titulo": "Retorno"}]},
+        "familiares": [],
+        "tratamento": {"cirurgias": []},
+    }
+    assert historico.aplicar(antes, patch) == depois
+    assert antes["cidade"] == "Fortaleza"  # base não é alterada
+    assert historico.diferenca(depois, depois) == {}
+    assert historico.aplicar(depois, {}) == depois
+    # Objeto que volta a null é substituído, não mesclado
+    assert historico.aplicar(depois, historico.diferenca(depois, antes)) == antes
+
+
+def test_checkpoint_devido_a_cada_n_versoes():
+    n = historico.CHECKPOINT_A_CADA
+    assert n == 20
+    assert historico.checkpoint_devido(None, 1)
+    assert not historico.checkpoint_devido(1, 2)
+    assert not historico.checkpoint_devido(1, n)
+    assert historico.checkpoint_devido(1, n + 1)
+    assert not historico.checkpoint_devido(n + 1, 2 * n)
+    assert historico.checkpoint_devido(n + 1, 2 * n + 1)
+
+
+@pytest.fixture
+def checkpoint_a_cada_3(monkeypatch):
+    monkeypatch.setattr(historico, "CHECKPOINT_A_CADA", 3)
+
+
+def agora():
+    return datetime.datetime.utcnow()
+
+
+def estado_em(cliente, id_paciente, instante):
+    return cliente.get(f"/pacientes/{id_paciente}/historico", params={"as_of": instante.isoformat()})
+
+
+def test_reconstrucao_de_cada_versao(cliente, db, dados_paciente, checkpoint_a_cada_3):
+    antes_de_criar = agora()
+    id_paciente = cliente.post("/pacientes", json=dados_paciente).json()["id_paciente"]
+    antes_da_primeira_alteracao = agora()
+
+    def editar_paciente(atual):
+        corpo = dict(atual, cidade="Sobral")
+        corpo["familiares"] = atual["familiares"] + [{"nome": "Rita", "parentesco": "irma"}]
+        return cliente.put(f"/pacientes/{id_paciente}", json=corpo)
+
+    edicoes = [
+        editar_paciente,
+        lambda atual: cliente.patch(f"/pacientes/{id_paciente}", json={"genero": None, "desfecho": {"status_vital": "Óbito"}}),
+        lambda atual: cliente.post(f"/pacientes/{id_paciente}/cirurgias", json={"tipo_procedimento": "axila"}),
+        lambda atual: cliente.patch(
+            f"/pacientes/{id_paciente}/cirurgias/{atual['tratamento']['cirurgias'][0]['id_cirurgia']}",
+            json={"margens": "Livres"},
+        ),
+        lambda atual: cliente.patch(f"/pacientes/{id_paciente}/desfecho", json={"recidiva_local": True}),
+        lambda atual: cliente.delete(
+            f"/pacientes/{id_paciente}/eventos/{atual['desfecho']['eventos'][0]['id_evento']}"
+        ),
+        lambda atual: cliente.patch(f"/pacientes/{id_paciente}", json={"familiares": []}),
+        lambda atual: cliente.delete(f"/pacientes/{id_paciente}/tratamento"),
+    ]
+
+    versoes = []  # (instante, versão, estado da API) logo após cada escrita
+    atual = cliente.get(f"/pacientes/{id_paciente}").json()
+    versoes.append((agora(), db.get(models.Paciente, id_paciente).versao, atual))
+    for editar in edicoes:
+        assert editar(atual).status_code in (200, 201)
+        atual = cliente.get(f"/pacientes/{id_paciente}").json()
+        db.expire_all()
+        versoes.append((agora(), db.get(models.Paciente, id_paciente).versao, atual))
+
+    # Cada escrita gerou uma versão nova
+    numeros = [versao for _, versao, _ in versoes]
+    assert numeros == list(range(numeros[0], numeros[0] + len(versoes)))
+
+    # Checkpoint de base (estado anterior à primeira alteração), a primeira alteração
+    # (ainda sem checkpoint anterior) e depois a cada 3 versões
+    linhas = db.query(models.PacienteHistorico).filter_by(id_paciente=id_paciente).order_by(models.PacienteHistorico.versao).all()
+    assert [l.versao for l in linhas] == numeros
+    checkpoints = [l.versao for l in linhas if l.tipo == historico.CHECKPOINT]
+    assert checkpoints == [numeros[0], numeros[1], numeros[1] + 3, numeros[1] + 6]
+    assert all(l.snapshot is None for l in linhas if l.tipo == historico.DIFF)
+
+    for instante, versao, esperado in versoes[1:]:
+        resposta = estado_em(cliente, id_paciente, instante)
+        assert resposta.status_code == 200
+        assert resposta.json()["versao"] == versao
+        assert resposta.json()["paciente"] == esperado
+
+    # O checkpoint de base é datado da primeira alteração: antes dela não há reconstrução
+    assert estado_em(cliente, id_paciente, antes_da_primeira_alteracao).status_code == 404
+    assert estado_em(cliente, id_paciente, antes_de_criar).status_code == 404
+    assert historico.reconstruir(db, id_paciente, antes_da_primeira_alteracao) is None
@@ -0,0 +1,77 @@
+import datetime
+
+import models
+
+
+def criar(cliente, dados, chave):
+    return cliente.post("/pacientes", json=dados, headers={"Idempotency-Key": chave})
+
+
+def total_pacientes(db):
+    return db.query(models.Paciente).count()
+
+
+def test_repeticao_devolve_resposta_gravada(cliente, db, dados_paciente):
+    primeira = criar(cliente, dados_paciente, "chave-1")
+    assert primeira.status_code == 200
+    assert "Idempotent-Replayed" not in primeira.headers
+
+    repetida = criar(cliente, dados_paciente, "chave-1")
+    assert repetida.status_code == 200
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    assert repetida.json() == primeira.json()
+    assert total_pacientes(db) == 1
+
+
+def test_mesma_chave_com_outro_corpo_retorna_422(cliente, db, dados_paciente):
+    assert criar(cliente, dados_paciente, "chave-1").status_code == 200
+
+    resposta = criar(cliente, dict(dados_paciente, cidade="Sobral"), "chave-1")
+    assert resposta.status_code == 422
+    assert total_pacientes(db) == 1
+
+
+def test_chave_expirada_vale_como_nova(cliente, db, dados_paciente):
+    primeira = criar(cliente, dados_paciente, "chave-1")
+
+    db.query(models.IdempotenciaRequisicao).update(
+        {"expira_em": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)}
+    )
+    db.commit()
+
+    # Expirada: executa de novo (outro paciente), mesmo com outro corpo
+    nova = criar(cliente, dict(dados_paciente, cidade="Sobral"), "chave-1")
+    assert nova.status_code == 200
+    assert "Idempotent-Replayed" not in nova.headers
+    assert nova.json()["id_paciente"] != primeira.json()["id_paciente"]
+    assert total_pacientes(db) == 2
+
+    repetida = criar(cliente, dict(dados_paciente, cidade="Sobral"), "chave-1")
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    assert repetida.json() == nova.json()
+
+
+def test_chaves_sao_por_usuario(cliente, db, dados_paciente):
+    import auth, main
+
+    assert criar(cliente, dados_paciente, "chave-1").status_code == 200
+    main.app.dependency_overrides[auth.get_current_user] = lambda: {"username": "outro"}
+    resposta = criar(cliente, dados_paciente, "chave-1")
+    assert resposta.status_code == 200
+    assert "Idempotent-Replayed" not in resposta.headers
+    assert total_pacientes(db) == 2
+
+
+def test_expurgo_apaga_so_chaves_expiradas(db):
+    import expurgo
+
+    agora = datetime.datetime.utcnow()
+    for i in range(5):
+        expira_em = agora + (datetime.timedelta(hours=1) if i == 0 else -datetime.timedelta(seconds=i))
+        db.add(models.IdempotenciaRequisicao(
+            usuario="teste", chave=f"chave-{i}", hash_corpo="x", criado_em=agora, expira_em=expira_em,
+        ))
+    db.commit()
+
+    assert expurgo.expurgar_idempotencia(db, lote=2, pausa=0) == 4
+    assert [r.chave for r in db.query(models.IdempotenciaRequisicao)] == ["chave-0"]
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from sqlalchemy import event
+
+import crud
+import models
+from database import engine
+
+
+def registros_esparsos(quantidade):
+    """Registros com campos None variando de um para outro (como os dados reais)"""
+    registros = []
+    for i in range(quantidade):
+        registro = {"nome_completo": f"Paciente {i}"}
+        if i % 2:
+            registro["cidade"] = "Fortaleza"
+        if i % 3:
+            registro["genero"] = "Feminino"
+        registro["familiares"] = [{"nome": "Familiar", "parentesco": "mae" if i % 7 else None}]
+        registro["desfecho"] = {
+            "status_vital": "Vivo" if i % 3 else None,
+            "eventos": [{"titulo": "Evento", "descricao": "d" if i % 2 else None}],
+        }
+        registros.append(registro)
+    return registros
+
+
+def contar_inserts(funcao):
+    comandos = Counter()
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO"):
+            comandos[statement.split()[2]] += 1
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        resultado = funcao()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    return resultado, comandos
+
+
+def test_importacao_esparsa_um_insert_por_tabela(db):
+    resultado, comandos = contar_inserts(
+        lambda: crud.importar_pacientes(db, registros_esparsos(200), lote=200, processos=1)
+    )
+
+    assert resultado["criados"] == 200
+    assert not resultado["erros"]
+    assert comandos["paciente_familiares"] == 1
+    assert comandos["desfecho_eventos"] == 1
+    if engine.dialect.name == "postgresql":
+        # No SQLite o INSERT ... RETURNING ordenado é sempre um comando por linha
+        assert comandos["paciente"] == 1
+        assert comandos["desfecho"] == 1
+
+
+def test_importacao_grava_nulls_e_defaults(db):
+    resultado = crud.importar_pacientes(db, registros_esparsos(4), lote=4, processos=1)
+
+    ids = [item["id_paciente"] for item in resultado["ids"]]
+    pacientes = {p.id_paciente: p for p in db.query(models.Paciente).filter(models.Paciente.id_paciente.in_(ids))}
+    assert [pacientes[i].cidade for i in ids] == [None, "Fortaleza", None, "Fortaleza"]
+    assert all(pacientes[i].versao == 1 for i in ids)
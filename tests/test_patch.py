@@ -0,0 +1,67 @@
+import pytest
+
+
+@pytest.fixture
+def paciente(cliente, dados_paciente):
+    id_paciente = cliente.post("/pacientes", json=dados_paciente).json()["id_paciente"]
+    return id_paciente, cliente.get(f"/pacientes/{id_paciente}").json()
+
+
+def test_campos_omitidos_sao_mantidos(cliente, paciente):
+    id_paciente, antes = paciente
+
+    resposta = cliente.patch(
+        f"/pacientes/{id_paciente}", json={"cidade": "Sobral", "desfecho": {"status_vital": "Óbito"}}
+    )
+    assert resposta.status_code == 200
+
+    depois = cliente.get(f"/pacientes/{id_paciente}").json()
+    assert depois["cidade"] == "Sobral"
+    assert depois["desfecho"]["status_vital"] == "Óbito"
+    # Tudo o que não veio no corpo continua igual, inclusive dentro de objetos aninhados
+    for campo in ("nome_completo", "data_nascimento", "genero", "hd_estadiamento_clinico", "familiares", "tratamento"):
+        assert depois[campo] == antes[campo]
+    assert depois["desfecho"]["td_data_diagnostico"] == antes["desfecho"]["td_data_diagnostico"]
+    assert depois["desfecho"]["eventos"] == antes["desfecho"]["eventos"]
+
+
+def test_null_limpa_o_campo(cliente, paciente):
+    id_paciente, antes = paciente
+
+    resposta = cliente.patch(
+        f"/pacientes/{id_paciente}", json={"genero": None, "desfecho": {"td_data_inicio_tratamento": None}}
+    )
+    assert resposta.status_code == 200
+
+    depois = cliente.get(f"/pacientes/{id_paciente}").json()
+    assert depois["genero"] is None
+    assert depois["desfecho"]["td_data_inicio_tratamento"] is None
+    assert depois["cidade"] == antes["cidade"]
+    assert depois["desfecho"]["td_data_diagnostico"] == antes["desfecho"]["td_data_diagnostico"]
+
+
+def test_null_em_campo_obrigatorio_e_rejeitado(cliente, paciente):
+    id_paciente, antes = paciente
+
+    assert cliente.patch(f"/pacientes/{id_paciente}", json={"nome_completo": None}).status_code == 400
+    assert cliente.get(f"/pacientes/{id_paciente}").json() == antes
+
+
+def test_lista_e_substituida_inteira(cliente, paciente):
+    id_paciente, antes = paciente
+    novos = [{"nome": "Rita", "parentesco": "irma"}, {"nome": "Lia", "parentesco": "tia"}]
+    cirurgias = [{"tipo_procedimento": "axila"}]
+
+    resposta = cliente.patch(
+        f"/pacientes/{id_paciente}", json={"familiares": novos, "tratamento": {"cirurgias": cirurgias}}
+    )
+    assert resposta.status_code == 200
+
+    depois = cliente.get(f"/pacientes/{id_paciente}").json()
+    assert [(f["nome"], f["parentesco"]) for f in depois["familiares"]] == [("Rita", "irma"), ("Lia", "tia")]
+    assert [c["tipo_procedimento"] for c in depois["tratamento"]["cirurgias"]] == ["axila"]
+    # Outras coleções do tratamento não enviadas ficam como estavam
+    assert depois["tratamento"]["imunohistoquimicas"] == antes["tratamento"]["imunohistoquimicas"]
+
+    assert cliente.patch(f"/pacientes/{id_paciente}", json={"familiares": []}).status_code == 200
+    assert cliente.get(f"/pacientes/{id_paciente}").json()["familiares"] == []
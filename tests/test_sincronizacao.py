@@ -0,0 +1,80 @@
+import re
+
+from sqlalchemy import event
+
+import models
+from database import engine
+
+# Tabelas das coleções e relacionamentos do paciente (fora paciente/histórico/agregados)
+TABELAS_FILHAS = {
+    "paciente_familiares", "tratamento", "desfecho", "tratamento_cirurgia",
+    "palliativo_quimioterapia", "palliativo_radioterapia", "palliativo_endocrinoterapia",
+    "palliativo_imunoterapia", "imunohistoquimicas", "desfecho_metastases", "desfecho_eventos",
+}
+DML = re.compile(r"^\s*(INSERT INTO|UPDATE|DELETE FROM)\s+(\w+)", re.IGNORECASE)
+
+
+def comandos_filhos(funcao):
+    """(comando, tabela) de cada INSERT/UPDATE/DELETE em tabela filha durante `funcao`"""
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        encontrado = DML.match(statement)
+        if encontrado and encontrado.group(2) in TABELAS_FILHAS:
+            comandos.append((encontrado.group(1).upper(), encontrado.group(2)))
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        resultado = funcao()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    return comandos, resultado
+
+
+def criar(cliente, dados):
+    dados["familiares"] = [
+        {"nome": "Ana", "parentesco": "mae"},
+        {"nome": "Rita", "parentesco": "irma"},
+        {"nome": "Lia", "parentesco": "tia"},
+    ]
+    id_paciente = cliente.post("/pacientes", json=dados).json()["id_paciente"]
+    return id_paciente, cliente.get(f"/pacientes/{id_paciente}").json()
+
+
+def test_put_sincroniza_familiares_por_id(cliente, db, dados_paciente):
+    id_paciente, atual = criar(cliente, dados_paciente)
+    ana, rita, _lia = atual["familiares"]
+
+    corpo = dict(atual)
+    corpo["familiares"] = [
+        dict(ana, tem_cancer_mama=True, idade_cancer_mama="48"),  # atualizado
+        rita,                                                   # igual
+        {"nome": "Bia", "parentesco": "prima"},                 # novo (sem id)
+    ]                                                           # Lia ausente → removida
+    comandos, resposta = comandos_filhos(lambda: cliente.put(f"/pacientes/{id_paciente}", json=corpo))
+    assert resposta.status_code == 200
+
+    familiares = {
+        f.nome: f for f in db.query(models.PacienteFamiliar).filter_by(id_paciente=id_paciente)
+    }
+    assert set(familiares) == {"Ana", "Rita", "Bia"}
+    assert familiares["Ana"].id_familiar == ana["id_familiar"]
+    assert familiares["Ana"].tem_cancer_mama is True and familiares["Ana"].idade_cancer_mama == "48"
+    assert familiares["Rita"].id_familiar == rita["id_familiar"]
+    assert familiares["Bia"].id_familiar not in {ana["id_familiar"], rita["id_familiar"]}
+
+    # Um statement por tipo de comando, só para o que mudou
+    assert sorted(c for c in comandos if c[1] == "paciente_familiares") == [
+        ("DELETE FROM", "paciente_familiares"),
+        ("INSERT INTO", "paciente_familiares"),
+        ("UPDATE", "paciente_familiares"),
+    ]
+
+
+def test_put_identico_nao_grava_filhos(cliente, dados_paciente):
+    id_paciente, atual = criar(cliente, dados_paciente)
+
+    comandos, resposta = comandos_filhos(lambda: cliente.put(f"/pacientes/{id_paciente}", json=atual))
+    assert resposta.status_code == 200
+    assert comandos == []
+    assert cliente.get(f"/pacientes/{id_paciente}").json()["familiares"] == atual["familiares"]
@@ -0,0 +1,26 @@
+from sqlalchemy import event
+
+import models
+from database import engine
+
+
+def test_put_incrementa_versao_no_update(cliente, db, dados_paciente):
+    id_paciente = cliente.post("/pacientes", json=dados_paciente).json()["id_paciente"]
+    etag = cliente.get(f"/pacientes/{id_paciente}").headers["ETag"]
+
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE paciente "):
+            comandos.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        resposta = cliente.put(f"/pacientes/{id_paciente}", json=dict(dados_paciente, cidade="Sobral"))
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert resposta.status_code == 200
+    assert any("versao=(paciente.versao + " in comando for comando in comandos)
+    assert db.query(models.Paciente.versao).filter_by(id_paciente=id_paciente).scalar() == 2
+    assert cliente.get(f"/pacientes/{id_paciente}", headers={"If-None-Match": etag}).status_code == 200